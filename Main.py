@@ -1,29 +1,65 @@
+import time
+
+# Mesure du temps jusqu'à la première image, depuis le lancement
+STARTED_AT = time.perf_counter()
+
 import os
-import json
+import bisect
 import sys
 import xml.etree.ElementTree as ET
-import subprocess
 import random
 import platform
+from contextlib import contextmanager
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QVBoxLayout, QHBoxLayout,
-    QWidget, QPushButton, QListWidget, QTextEdit, QInputDialog,
+    QWidget, QPushButton, QListView, QInputDialog,
     QMessageBox, QFileDialog, QProgressBar, QDialog, QLineEdit,
-    QComboBox, QMenu, QAction
+    QComboBox, QMenu, QAction, QCheckBox
+)
+from PyQt5.QtGui import QPixmap, QIcon, QImage
+from PyQt5.QtCore import Qt, QSize, QUrl, QTimer, QFileSystemWatcher, pyqtSignal
+
+# Seuls les modules du démarrage sont importés ici ; ceux des traitements
+# (conversion, export, doublons, Ollama, règles, base SQLite...) le sont
+# dans les actions qui s'en servent
+from captioninghelper.captions import merge_tags, split_tags, remove_empty_captions
+from captioninghelper import config as app_config
+from captioninghelper.dataset import Dataset, HiddenImagesLog, load_flagged, save_flagged
+from captioninghelper.journal import OperationJournal, UndoJob
+from captioninghelper.previews import PreviewLoader
+from captioninghelper.resultcache import CaptionCache, ReapplyCachedCaptions
+from captioninghelper.scan import (
+    FolderScanJob, FolderSnapshot, folder_mtime, load_snapshot, save_snapshot, scan_entries
 )
-from PyQt5.QtGui import QPixmap, QIcon
-from PyQt5.QtCore import Qt, QSize, QUrl
-from PIL import Image
+from captioninghelper.store import CaptionStore
+from captioninghelper.tagindex import QueryError, TagIndex, TagIndexBuildJob
+from captioninghelper.taglibrary import TagLibrary
+from captioninghelper.thumbnails import ThumbnailStore
+from captioninghelper.trace import traced, tracer
+from captioninghelper.ui.jobs import JobRunner, JobDialog
+from captioninghelper.ui.overlay import LatencyOverlay
+from captioninghelper.ui.tags import TagEditor, TagLibraryModel
 
 # Constantes de chemin
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-LAST_FOLDER_FILE = os.path.join(SCRIPT_DIR, "last_folder.json")
-CONFIG_FILE = os.path.join(SCRIPT_DIR, "config.json")
 LANGUAGE_FILE = os.path.join(SCRIPT_DIR, "language", "languages.xml")
 
+# Modes de la file de travail : (images non légendées, images signalées)
+QUEUE_MODES = {
+    "off": (False, False),
+    "uncaptioned": (True, False),
+    "flagged": (False, True),
+    "both": (True, True),
+}
+
 
 class ImageCaptioningApp(QMainWindow):
+    # Légende modifiée (image, anciens tags, nouveaux tags) : émis par le
+    # CaptionStore, éventuellement depuis un thread de travail, et traité
+    # dans le thread de l'interface
+    caption_changed = pyqtSignal(str, object, object)
+
     def __init__(self, folder_path):
         super().__init__()
 
@@ -36,38 +72,114 @@ class ImageCaptioningApp(QMainWindow):
 
         # Gère les fichiers (tags, images cachées) et la config
         self.tag_library_file = os.path.join(folder_path, "tag_library.json")
-        self.hidden_images_file = os.path.join(folder_path, "hidden_images.json")
+        self.hidden_images_log = HiddenImagesLog(folder_path)
         self.save_last_folder(folder_path)
         self.config = self.load_config()
 
+        # Cache des aperçus décodés, alimenté en arrière-plan,
+        # adossé aux miniatures persistées dans le dossier
+        self.previews = PreviewLoader(
+            max_bytes=self.config["preview_cache_mb"] * 1024 * 1024,
+            store=ThumbnailStore(folder_path, self.config["thumbnail_cache_mb"] * 1024 * 1024)
+        )
+        self.next_random_index = None
+        self.first_image_ms = None
+
+        # État du dossier enregistré à la dernière fermeture : la première
+        # image est décodée en arrière-plan pendant la construction de l'UI
+        snapshot = load_snapshot(folder_path)
+        if snapshot and snapshot[0]:
+            self.previews.prefetch([os.path.join(folder_path, snapshot[0][0])])
+
+        # Cache des légendes déjà produites par les modèles
+        self.caption_cache = CaptionCache(max_entries=self.config["caption_cache_entries"])
+
         # Charge la gestion multilingue
         self.load_languages()
 
         # Pré-initialise d'éventuels attributs
-        self.tag_library = set()
-        self.hidden_images = set()
-        self.image_files = []
+        self.tag_library = TagLibrary.load(self.tag_library_file)
+        # Règles de normalisation (tag_rules.json), rechargées si le fichier change
+        self.tag_rules = None
+        self.tag_rules_mtime = None
+        self.tag_counts_stale = False
+        # Images du dossier (identifiants, états cachée / légendée) ;
+        # image_files est la vue des images visibles, dans l'ordre de navigation
+        self.dataset = Dataset()
+        self.image_files = self.dataset.images
         self.current_index = 0
+        # Journal des opérations par lot : termine celles qu'un arrêt
+        # brutal a interrompues, puis oublie les plus anciennes
+        self.journal = OperationJournal(folder_path)
+        replayed = self.journal.replay()
+        self.journal.compact()
+        # Base SQLite des légendes (optionnelle) : les légendes restées en
+        # base seulement lors d'un arrêt brutal sont écrites dans les .txt
+        self.caption_db = None
+        if self.config["caption_database"]:
+            from captioninghelper.database import CaptionDatabase
+
+            self.caption_db = CaptionDatabase(folder_path)
+            self.caption_db.export_sidecars()
+        self.captions = self.make_caption_store()
+        self.tag_index = TagIndex(self.dataset)
+        self.caption_changed.connect(self.on_caption_changed)
+        self.captions.listeners.append(self.caption_changed.emit)
+        self.filter_query = ""
+        self.filter_cache = None
+        self.filter_stale = True
+        self.job_runner = None
+        self.background_runners = []
+        self.scan_runner = None
+        self.rescan_pending = False
+        self.folder_snapshot = FolderSnapshot()
+        # Date de modification du dossier dans l'état connu (dernier
+        # parcours, puis écritures de l'application elle-même)
+        self.known_folder_mtime = None
 
         # Construit l'UI en premier
         self.setup_ui()
 
+        # Mesure des temps (spans) et surcouche d'affichage
+        tracer.enabled = self.config["record_timings"] or self.config["latency_overlay"]
+        self.latency_overlay = LatencyOverlay(tracer, self.centralWidget())
+        self.latency_overlay.move(8, 8)
+        self.latency_overlay.setVisible(self.config["latency_overlay"])
+
         # Sélectionne la langue (ré-étiquette l'UI) - possible APRES setup_ui()
         self.set_language(self.config.get('language', 'English'))
 
-        # Charge les images cachées et la liste d'images
+        # Charge les images cachées et signalées, active la file de travail
         self.load_hidden_images()
-        self.load_image_list()
-
-        # Charge la bibliothèque de tags
-        self.load_tag_library()
-
-        # S'il y a des images, on affiche la première
-        if self.image_files:
-            self.load_image()
-            self.update_progress_bar()
+        for name in load_flagged(folder_path):
+            self.dataset.flag(name)
+        self.apply_queue_mode()
+        self.update_undo_buttons()
+        if replayed:
+            # Affiché une fois la fenêtre ouverte
+            QTimer.singleShot(0, lambda: self.report_replayed_operations(replayed))
+
+        # Légendes en mémoire, écrites sur disque par lots
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush_pending)
+        self.flush_timer.start(self.config["flush_interval_ms"])
+
+        if snapshot:
+            # Rouvre le dossier tel qu'il était ; le parcours en arrière-plan
+            # ne fait ensuite que valider cet état et appliquer les différences
+            self.open_snapshot(*snapshot)
         else:
-            QMessageBox.critical(self, "Error", "No images found in the specified folder.")
+            # Parcourt le dossier en arrière-plan : la première image
+            # s'affiche dès le premier paquet lu
+            self.start_folder_scan(initial=True)
+
+        # Surveille le dossier pour suivre les ajouts / suppressions / renommages
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.setSingleShot(True)
+        self.rescan_timer.setInterval(1000)
+        self.rescan_timer.timeout.connect(self.start_folder_scan)
+        self.folder_watcher = QFileSystemWatcher([folder_path], self)
+        self.folder_watcher.directoryChanged.connect(self.on_folder_changed)
 
 
     def setup_ui(self):
@@ -112,10 +224,24 @@ class ImageCaptioningApp(QMainWindow):
             tag_library_label.setStyleSheet("font-size: 12px;")
             tag_library_layout.addWidget(tag_library_label)
 
-            self.tags_listbox = QListWidget()
+            # Liste virtualisée : seules les lignes visibles sont dessinées
+            tag_list_layout = QVBoxLayout()
+            tag_library_layout.addLayout(tag_list_layout)
+
+            self.tag_search_input = QLineEdit()
+            self.tag_search_input.setObjectName("tag_search_input")
+            self.tag_search_input.setPlaceholderText("Search tags...")
+            tag_list_layout.addWidget(self.tag_search_input)
+
+            self.tag_model = TagLibraryModel(self.tag_library, self.tag_count, self)
+            self.tag_search_input.textChanged.connect(self.tag_model.set_prefix)
+
+            self.tags_listbox = QListView()
             self.tags_listbox.setObjectName("tags_listbox")
             self.tags_listbox.setFixedHeight(120)
-            tag_library_layout.addWidget(self.tags_listbox)
+            self.tags_listbox.setUniformItemSizes(True)
+            self.tags_listbox.setModel(self.tag_model)
+            tag_list_layout.addWidget(self.tags_listbox)
 
             # Boutons d'action sur la Tag library
             tag_buttons_layout = QVBoxLayout()
@@ -131,11 +257,48 @@ class ImageCaptioningApp(QMainWindow):
             remove_tag_button.clicked.connect(self.remove_from_library)
             tag_buttons_layout.addWidget(remove_tag_button)
 
+            rewrite_tags_button = QPushButton("Rewrite Tags...")
+            rewrite_tags_button.setObjectName("rewrite_tags_button")
+            rewrite_tags_button.clicked.connect(self.rewrite_tags)
+            tag_buttons_layout.addWidget(rewrite_tags_button)
+
+            normalize_tags_button = QPushButton("Normalize Tags")
+            normalize_tags_button.setObjectName("normalize_tags_button")
+            normalize_tags_button.clicked.connect(self.normalize_tags)
+            tag_buttons_layout.addWidget(normalize_tags_button)
+
             convert_to_jpg_button = QPushButton("Convertir tout en JPG")
             convert_to_jpg_button.setObjectName("convert_to_jpg_button")
             convert_to_jpg_button.clicked.connect(lambda: self.convert_to_jpg(self.folder_path))
             tag_buttons_layout.addWidget(convert_to_jpg_button)
 
+            clean_captions_button = QPushButton("Clean Empty Captions")
+            clean_captions_button.setObjectName("clean_captions_button")
+            clean_captions_button.clicked.connect(self.clean_empty_captions)
+            tag_buttons_layout.addWidget(clean_captions_button)
+
+            export_button = QPushButton("Export Dataset...")
+            export_button.setObjectName("export_button")
+            export_button.clicked.connect(self.export_dataset)
+            tag_buttons_layout.addWidget(export_button)
+
+            duplicates_button = QPushButton("Find Duplicates")
+            duplicates_button.setObjectName("duplicates_button")
+            duplicates_button.clicked.connect(self.find_duplicates)
+            tag_buttons_layout.addWidget(duplicates_button)
+
+            # Annulation / rétablissement des opérations du journal
+            history_layout = QHBoxLayout()
+            self.undo_button = QPushButton("Undo")
+            self.undo_button.setObjectName("undo_button")
+            self.undo_button.clicked.connect(lambda: self.undo_operation())
+            history_layout.addWidget(self.undo_button)
+            self.redo_button = QPushButton("Redo")
+            self.redo_button.setObjectName("redo_button")
+            self.redo_button.clicked.connect(lambda: self.undo_operation(redo=True))
+            history_layout.addWidget(self.redo_button)
+            tag_buttons_layout.addLayout(history_layout)
+
             # Label pour les tags d'une image
             image_tags_label = QLabel("Tags Associated with Image:")
             image_tags_label.setObjectName("image_tags_label")
@@ -144,11 +307,57 @@ class ImageCaptioningApp(QMainWindow):
             main_layout.addWidget(image_tags_label)
 
             # Zone de texte pour les tags liés à l'image en cours
-            self.image_tags_display = QTextEdit()
+            self.image_tags_display = TagEditor(self.complete_tag)
             self.image_tags_display.setFixedHeight(60)
             self.image_tags_display.setObjectName("image_tags_display")
             main_layout.addWidget(self.image_tags_display)
 
+            # Filtre de navigation (requête sur les tags)
+            filter_layout = QHBoxLayout()
+            main_layout.addLayout(filter_layout)
+
+            filter_label = QLabel("Filter:")
+            filter_label.setObjectName("filter_label")
+            filter_layout.addWidget(filter_label)
+
+            self.filter_input = QLineEdit()
+            self.filter_input.setObjectName("filter_input")
+            self.filter_input.setPlaceholderText("blue eyes & !smile")
+            self.filter_input.returnPressed.connect(self.apply_filter)
+            filter_layout.addWidget(self.filter_input)
+
+            self.filter_status_label = QLabel()
+            self.filter_status_label.setObjectName("filter_status_label")
+            filter_layout.addWidget(self.filter_status_label)
+
+            # File de travail : navigation limitée aux images à traiter
+            queue_label = QLabel("Work Queue:")
+            queue_label.setObjectName("queue_label")
+            filter_layout.addWidget(queue_label)
+
+            self.queue_combo = QComboBox()
+            self.queue_combo.setObjectName("queue_combo")
+            for mode in QUEUE_MODES:
+                self.queue_combo.addItem(mode, mode)
+            self.queue_combo.setCurrentIndex(self.queue_combo.findData(self.config["queue_mode"]))
+            self.queue_combo.activated.connect(self.change_queue_mode)
+            filter_layout.addWidget(self.queue_combo)
+
+            self.queue_status_label = QLabel()
+            self.queue_status_label.setObjectName("queue_status_label")
+            filter_layout.addWidget(self.queue_status_label)
+
+            skip_button = QPushButton("Skip")
+            skip_button.setObjectName("skip_button")
+            skip_button.clicked.connect(self.skip_image)
+            filter_layout.addWidget(skip_button)
+
+            self.flag_button = QPushButton("Flag")
+            self.flag_button.setObjectName("flag_button")
+            self.flag_button.setCheckable(True)
+            self.flag_button.clicked.connect(self.toggle_flag)
+            filter_layout.addWidget(self.flag_button)
+
             # Bloc de boutons sous l'éditeur
             actions_layout = QHBoxLayout()
             main_layout.addLayout(actions_layout)
@@ -198,6 +407,11 @@ class ImageCaptioningApp(QMainWindow):
             send_to_ollama_button.clicked.connect(self.send_to_ollama)
             actions_layout.addWidget(send_to_ollama_button)
 
+            caption_all_button = QPushButton("Caption All (Ollama)")
+            caption_all_button.setObjectName("caption_all_button")
+            caption_all_button.clicked.connect(self.caption_all_with_ollama)
+            actions_layout.addWidget(caption_all_button)
+
             # Label de progression
             self.progress_label = QLabel()
             self.progress_label.setStyleSheet("font-size: 12px;")
@@ -261,6 +475,52 @@ class ImageCaptioningApp(QMainWindow):
             language_combo.setCurrentText(self.config.get('language', 'English'))
             layout.addWidget(language_combo)
 
+            # Cache des légendes
+            cache_layout = QHBoxLayout()
+            cache_stats_button = QPushButton(self.current_language.get("cache_stats_button", "Caption Cache Statistics"))
+            cache_stats_button.clicked.connect(self.show_cache_stats)
+            cache_layout.addWidget(cache_stats_button)
+            apply_cached_button = QPushButton(self.current_language.get("apply_cached_button", "Apply Cached Captions"))
+            apply_cached_button.clicked.connect(lambda: (dialog.accept(), self.apply_cached_captions()))
+            cache_layout.addWidget(apply_cached_button)
+            layout.addLayout(cache_layout)
+
+            # Diagnostic : mesure des temps, surcouche, trace, profilage
+            diagnostics_label = QLabel(self.current_language.get("diagnostics_label", "Diagnostics:"))
+            layout.addWidget(diagnostics_label)
+            timings_checkbox = QCheckBox(self.current_language.get("record_timings_checkbox", "Record timings"))
+            timings_checkbox.setChecked(self.config["record_timings"])
+            timings_checkbox.toggled.connect(lambda checked: self.set_diagnostics("record_timings", checked))
+            layout.addWidget(timings_checkbox)
+            overlay_checkbox = QCheckBox(self.current_language.get("latency_overlay_checkbox", "Show latency overlay"))
+            overlay_checkbox.setChecked(self.config["latency_overlay"])
+            overlay_checkbox.toggled.connect(lambda checked: self.set_diagnostics("latency_overlay", checked))
+            layout.addWidget(overlay_checkbox)
+
+            diagnostics_layout = QHBoxLayout()
+            export_trace_button = QPushButton(self.current_language.get("export_trace_button", "Export Trace..."))
+            export_trace_button.clicked.connect(self.export_trace)
+            diagnostics_layout.addWidget(export_trace_button)
+            profiler_button = QPushButton()
+            profiler_button.clicked.connect(lambda: self.toggle_profiler(profiler_button))
+            self.update_profiler_button(profiler_button)
+            diagnostics_layout.addWidget(profiler_button)
+            layout.addLayout(diagnostics_layout)
+
+            # Stockage des légendes (pris en compte à la prochaine ouverture)
+            storage_label = QLabel(self.current_language.get("storage_label", "Caption storage (next start):"))
+            layout.addWidget(storage_label)
+            database_checkbox = QCheckBox(self.current_language.get("caption_database_checkbox", "Use a caption database (SQLite)"))
+            database_checkbox.setChecked(self.config["caption_database"])
+            database_checkbox.toggled.connect(lambda checked: self.set_storage_option("caption_database", checked))
+            layout.addWidget(database_checkbox)
+            defer_checkbox = QCheckBox(self.current_language.get("defer_sidecars_checkbox", "Write .txt files only when closing"))
+            defer_checkbox.setChecked(self.config["defer_sidecars"])
+            defer_checkbox.setEnabled(self.config["caption_database"])
+            defer_checkbox.toggled.connect(lambda checked: self.set_storage_option("defer_sidecars", checked))
+            database_checkbox.toggled.connect(defer_checkbox.setEnabled)
+            layout.addWidget(defer_checkbox)
+
             # Boutons (Sauver / Réinitialiser)
             buttons_layout = QHBoxLayout()
             save_button = QPushButton(self.current_language.get("save_button", "Save"))
@@ -318,45 +578,284 @@ class ImageCaptioningApp(QMainWindow):
 
     def load_image_list(self):
         """
-        Charge la liste des images en excluant les images cachées
+        Recharge entièrement la liste des images en excluant les images cachées
+        (parcours complet et synchrone du dossier)
+        """
+        self.write_captions()
+        hidden = self.dataset.hidden_names()
+        flagged = self.dataset.flagged_names()
+        self.dataset = Dataset()
+        for name in hidden:
+            self.dataset.hide(name)
+        self.known_folder_mtime = folder_mtime(self.folder_path)
+        self.folder_snapshot = FolderSnapshot()
+        for images, captions in scan_entries(self.folder_path):
+            self.folder_snapshot.add(images, captions)
+            self.dataset.add_captions(captions)
+            self.dataset.add_images(images)
+        self.image_files = self.dataset.images
+        for name in flagged:
+            self.dataset.flag(name)
+        self.apply_queue_mode()
+        if self.caption_db is not None:
+            self.caption_db.sync_sidecars(self.folder_snapshot.captions)
+        self.captions = self.make_caption_store()
+        self.tag_index = TagIndex(self.dataset)
+        self.captions.listeners.append(self.caption_changed.emit)
+        self.filter_stale = True
+        self.build_tag_index()
+
+    def make_caption_store(self):
+        return CaptionStore(
+            self.folder_path, self.dataset, self.caption_db,
+            write_sidecars=not self.config["defer_sidecars"], journal=self.journal
+        )
+
+    def write_captions(self):
+        """
+        Écrit les légendes modifiées, jusque dans les .txt même quand leur
+        écriture est différée (avant un traitement qui relit les .txt)
+        """
+        with self.own_folder_writes():
+            self.captions.flush()
+        if self.caption_db is not None:
+            self.caption_db.export_sidecars()
+
+    def sync_caption_database(self):
+        """
+        Importe en base les .txt modifiés hors de l'application depuis la
+        dernière ouverture (en arrière-plan), puis construit l'index des tags
+        """
+        if self.caption_db is None:
+            self.build_tag_index()
+            return
+        from captioninghelper.database import SidecarSyncJob
+
+        job = SidecarSyncJob(self.caption_db, self.folder_snapshot.captions)
+        self.run_background(job, None, self.on_caption_database_synced)
+
+    def on_caption_database_synced(self, job):
+        self.captions.forget_captions(job.changed)
+        self.build_tag_index()
+
+    @contextmanager
+    def own_folder_writes(self):
+        """
+        with self.own_folder_writes(): ... — écritures de l'application dans
+        le dossier (légendes, bibliothèque de tags). Si le dossier n'avait
+        pas changé depuis l'état connu, l'état après ces écritures est
+        connu aussi : l'événement du QFileSystemWatcher qu'elles
+        provoquent ne relance pas de parcours.
         """
-        files = os.listdir(self.folder_path)
-        self.image_files = [
-            f for f in files
-            if os.path.isfile(os.path.join(self.folder_path, f))
-            and f.lower().endswith(('png', 'jpg', 'jpeg'))
-            and f not in self.hidden_images
-        ]
+        before = folder_mtime(self.folder_path)
+        try:
+            yield
+        finally:
+            if before is not None and before == self.known_folder_mtime:
+                self.known_folder_mtime = folder_mtime(self.folder_path)
+
+    def on_folder_changed(self):
+        if folder_mtime(self.folder_path) != self.known_folder_mtime:
+            self.rescan_timer.start()
 
+    def apply_own_caption_writes(self):
+        """
+        Reporte dans folder_snapshot les .txt écrits par l'application :
+        un nouveau parcours n'y voit que les changements venus d'ailleurs
+        """
+        captions = self.folder_snapshot.captions
+        for stem, mtime in self.captions.take_written().items():
+            if mtime is None:
+                captions.pop(stem, None)
+            else:
+                captions[stem] = mtime
+
+    def start_folder_scan(self, initial=False):
+        """
+        Parcourt le dossier en arrière-plan. Au premier parcours, la liste est
+        remplie au fil de la lecture ; ensuite, seuls les changements sont appliqués.
+        """
+        if self.scan_runner is not None and self.scan_runner.isRunning():
+            self.rescan_pending = True
+            return
+        job = FolderScanJob(self.folder_path)
+        self.scan_runner = self.run_background(
+            job,
+            self.on_scan_batch if initial else None,
+            lambda job: self.on_scan_finished(job, initial)
+        )
+
+    def on_scan_batch(self, images, captions):
+        first_batch = not self.image_files
+        self.dataset.add_captions(captions)
+        self.dataset.add_images(images)
+        self.filter_stale = True
+        if first_batch and self.image_files:
+            self.current_index = 0
+            self.load_image()
+        self.update_progress_bar()
+
+    def open_snapshot(self, images, captions):
+        """
+        Remplit la liste d'images depuis l'état enregistré, sans lire le dossier.
+        La première image est affichée avant d'ajouter les autres.
+        """
+        self.folder_snapshot = FolderSnapshot(images, captions)
+        self.dataset.add_captions(captions)
+        self.dataset.add_images(images[:64])
+        if self.image_files:
+            self.current_index = 0
+            self.load_image()
+        QTimer.singleShot(0, lambda: self.finish_snapshot(images[64:]))
+
+    def finish_snapshot(self, images):
+        self.dataset.add_images(images)
+        self.filter_stale = True
+        self.update_progress_bar()
+        self.sync_caption_database()
+        self.start_folder_scan()
+
+    def save_folder_snapshot(self):
+        if not self.folder_snapshot.images:
+            return
+        self.apply_own_caption_writes()
+        names = self.dataset.names
+        images = [names[image_id] for image_id in self.dataset.present]
+        save_snapshot(self.folder_path, images, self.folder_snapshot.captions)
+
+    def on_scan_finished(self, job, initial):
+        self.known_folder_mtime = job.folder_mtime
+        if initial:
+            self.folder_snapshot = job.snapshot
+            self.apply_own_caption_writes()
+            if not self.image_files:
+                QMessageBox.critical(self, "Error", "No images found in the specified folder.")
+            self.sync_caption_database()
+            self.save_folder_snapshot()
+        else:
+            self.apply_own_caption_writes()
+            changes = self.folder_snapshot.diff(job.snapshot)
+            self.folder_snapshot = job.snapshot
+            self.apply_folder_changes(changes)
+        if self.rescan_pending:
+            self.rescan_pending = False
+            self.rescan_timer.start()
+
+    @traced()
+    def apply_folder_changes(self, changes):
+        """
+        Applique à la liste d'images et aux légendes les changements
+        détectés dans le dossier, sans tout recharger
+        """
+        self.dataset.remove_captions(changes.removed_captions)
+        self.dataset.add_captions(changes.changed_captions)
+        if self.caption_db is not None:
+            self.caption_db.import_sidecars(changes.changed_captions | changes.removed_captions)
+        self.captions.forget_captions(changes.changed_captions | changes.removed_captions)
+
+        current = self.image_files[self.current_index] if self.image_files else None
+        self.dataset.remove_images(changes.removed_images)
+        self.dataset.add_images(sorted(changes.added_images))
+
+        # Réindexe les tags des images touchées
+        for image_file in changes.removed_images:
+            self.tag_index.set_tags(self.dataset.id_of(image_file), ())
+        stems = changes.changed_captions | changes.removed_captions
+        stems |= {os.path.splitext(f)[0] for f in changes.added_images}
+        for stem in stems:
+            for image_id in self.dataset.ids_for_stem(stem):
+                if self.dataset.present[image_id]:
+                    self.tag_index.set_tags(image_id, self.captions.get(self.dataset.names[image_id]))
+        self.filter_stale = True
+
+        if current in self.image_files:
+            self.current_index = self.image_files.index(current)
+        else:
+            # L'image affichée a disparu : on reste au même rang
+            self.current_index = min(self.current_index, max(len(self.image_files) - 1, 0))
+            if self.image_files:
+                self.load_image()
+        self.update_progress_bar()
+
+    @traced()
     def load_image(self):
         if not self.image_files:
             return
+        # Écrit les légendes modifiées avant de changer d'image
+        with self.own_folder_writes():
+            self.captions.flush()
         image_path = os.path.join(self.folder_path, self.image_files[self.current_index])
         self.image_path = image_path  # Stocker le chemin dans l'attribut
-        image = Image.open(image_path)
-        image.thumbnail((600, 400))
-        pixmap = QPixmap(image_path)
-        pixmap = pixmap.scaled(600, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.image_label.setPixmap(pixmap)
+        # Aperçu déjà décodé à la bonne taille (immédiat s'il a été préchargé)
+        try:
+            preview = self.previews.get(image_path)
+        except Exception as e:
+            # Fichier disparu ou illisible : on affiche l'erreur à la place de
+            # l'image, les tags et la navigation restent utilisables
+            print(f"Erreur avec {image_path}: {e}")
+            preview = None
+            error_msg = self.current_language.get("image_load_error", "Cannot open this image: {error}")
+            self.image_label.setText(error_msg.format(error=e))
+        if preview is not None:
+            image = QImage(preview.data, preview.width, preview.height,
+                           4 * preview.width, QImage.Format_RGBA8888)
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+        if self.first_image_ms is None:
+            self.first_image_ms = (time.perf_counter() - STARTED_AT) * 1000
+            # Mesuré une fois la boucle d'événements lancée (fenêtre visible)
+            QTimer.singleShot(0, self.report_startup_time)
         self.image_name_label.setText(os.path.basename(image_path))
+        current = self.image_files[self.current_index]
+        self.flag_button.setChecked(self.dataset.is_flagged(current))
+        if self.dataset.queue is not None:
+            self.dataset.queue.visit(self.dataset.id_of(current))
         self.load_tags()
+        self.prefetch_neighbours()
 
+    def report_startup_time(self):
+        """
+        Ajoute les temps de démarrage (première image, fenêtre affichée)
+        aux temps mesurés : surcouche de latence et export de trace
+        """
+        tracer.add("startup.first_image", STARTED_AT, self.first_image_ms / 1000)
+        tracer.add("startup.window_shown", STARTED_AT, time.perf_counter() - STARTED_AT)
+        if self.latency_overlay.isVisible():
+            self.latency_overlay.refresh()
+
+    def prefetch_neighbours(self):
+        """
+        Précharge les N images suivantes / précédentes et le prochain tirage aléatoire
+        """
+        count = self.config["prefetch_count"]
+        queue = self.dataset.queue
+        if queue is not None:
+            # Un seul parcours de la file plutôt qu'un peek par voisin
+            following, preceding = queue.peek_many(count)
+            indexes = [self.dataset.position_of(image_id) for image_id in following + preceding]
+        else:
+            indexes = []
+            for offset in range(1, count + 1):
+                indexes += [self.step_index(offset), self.step_index(-offset)]
+        # Le prochain tirage aléatoire est choisi d'avance pour pouvoir le précharger
+        self.next_random_index = self.pick_random_index()
+        indexes.append(self.next_random_index)
+        self.previews.prefetch([
+            os.path.join(self.folder_path, self.image_files[i])
+            for i in indexes if i is not None
+        ])
+
+    @traced()
     def load_tags(self):
         """
         Charge les tags d'une image .txt
         """
-        image_name = os.path.splitext(self.image_files[self.current_index])[0]
-        tags_file = os.path.join(self.folder_path, f"{image_name}.txt")
-
-        tags = []
-        if os.path.exists(tags_file):
-            with open(tags_file, "r", encoding="utf-8") as f:
-                tags = f.read().strip().split(",")
+        tags = self.captions.get(self.image_files[self.current_index])
 
         self.image_tags_display.clear()
         if tags:
             self.image_tags_display.setText(", ".join(tags))
 
+    @traced()
     def save_tags(self):
         """
         Sauvegarde les tags liés à l'image courante
@@ -364,45 +863,76 @@ class ImageCaptioningApp(QMainWindow):
         if not self.image_files:
             return
         # Ne pas sauvegarder si l'image est cachée
-        if self.image_files[self.current_index] in self.hidden_images:
+        if self.dataset.is_hidden(self.image_files[self.current_index]):
             return
 
-        image_name = os.path.splitext(self.image_files[self.current_index])[0]
-        tags_file = os.path.join(self.folder_path, f"{image_name}.txt")
-
-        tags_text = self.image_tags_display.toPlainText().strip()
-        tags = [tag.strip() for tag in tags_text.split(",") if tag.strip()]
+        image_file = self.image_files[self.current_index]
+        tags = split_tags(self.image_tags_display.toPlainText())
+        normalizer = self.tag_normalizer()
+        if normalizer is not None:
+            normalized = normalizer.normalize(tags)
+            if normalized != tags:
+                tags = normalized
+                self.image_tags_display.setText(", ".join(tags))
 
-        with open(tags_file, "w", encoding="utf-8") as f:
-            f.write(", ".join(tags))
+        self.captions.set(image_file, tags)
         self.update_progress_bar()
 
+    def tag_normalizer(self):
+        """
+        Règles de tag_rules.json compilées (None si le dossier n'en a pas),
+        recompilées seulement quand le fichier change
+        """
+        from captioninghelper.rules import load_rules, rules_path
+
+        try:
+            mtime = os.stat(rules_path(self.folder_path)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.tag_rules_mtime:
+            self.tag_rules_mtime = mtime
+            try:
+                self.tag_rules = load_rules(self.folder_path)
+            except ValueError as e:
+                # Signalé une seule fois par version du fichier
+                self.tag_rules = None
+                msg_template = self.current_language.get("invalid_tag_rules", "Tag rules ignored: {error}")
+                QMessageBox.warning(
+                    self, self.current_language.get("error_title", "Error"), msg_template.format(error=e)
+                )
+        return self.tag_rules
 
+
+    @traced()
     def update_progress_bar(self):
-        # Supprime les fichiers .txt vides
-        for file in os.listdir(self.folder_path):
-            if file.lower().endswith(".txt"):
-                full_path = os.path.join(self.folder_path, file)
-                try:
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        content = f.read().strip()
-                    if not content:  # Si le fichier est vide
-                        os.remove(full_path)
-                except Exception as e:
-                    print(f"Erreur lors de la suppression de {file}: {e}")
-
-        # Après suppression, compte les fichiers .txt et met à jour la barre de progression
-        all_files = os.listdir(self.folder_path)
-        txt_files = len([f for f in all_files if f.endswith(".txt")])
-        total_images = len(self.image_files) + len(self.hidden_images)
-        
+        """
+        Met à jour la progression depuis l'index en mémoire (aucun accès disque)
+        """
+        captioned = self.captions.captioned_count
+        total_images = self.dataset.present_count
+
         if total_images > 0:
-            progress = (txt_files / total_images) * 100
+            progress = (captioned / total_images) * 100
         else:
             progress = 0
 
         self.progress_bar.setValue(int(progress))
-        self.progress_label.setText(f"Progress: {txt_files} / {total_images} images captioned")
+        self.progress_label.setText(f"Progress: {captioned} / {total_images} images captioned")
+        self.update_queue_status()
+
+    def clean_empty_captions(self):
+        """
+        Supprime les fichiers .txt vides du dossier et met à jour l'index
+        """
+        self.write_captions()
+        removed = remove_empty_captions(self.folder_path)
+        stems = {os.path.splitext(f)[0] for f in removed}
+        self.dataset.remove_captions(stems)
+        self.captions.forget_captions(stems)
+        self.update_progress_bar()
+        success_title = self.current_language.get("success_title", "Success")
+        msg_template = self.current_language.get("clean_captions_success", "{count} empty caption files removed.")
+        QMessageBox.information(self, success_title, msg_template.format(count=len(removed)))
 
 
 
@@ -412,36 +942,160 @@ class ImageCaptioningApp(QMainWindow):
 
     def add_to_library(self):
         new_tag, ok = QInputDialog.getText(self, "Add Tag", "Enter a new tag:")
-        if ok and new_tag and new_tag not in self.tag_library:
-            self.tag_library.add(new_tag)
-            self.update_tag_library()
-            self.save_tag_library()
+        if ok and new_tag.strip():
+            # Le modèle est prévenu par la bibliothèque, l'écriture est différée
+            self.tag_library.add(new_tag.strip())
 
     def remove_from_library(self):
-        selected_tag = self.tags_listbox.currentItem()
-        if selected_tag and selected_tag.text() in self.tag_library:
-            self.tag_library.remove(selected_tag.text())
-            self.update_tag_library()
-            self.save_tag_library()
+        selected_tag = self.selected_library_tag()
+        if selected_tag:
+            self.tag_library.remove(selected_tag)
+
+    def rewrite_tags(self):
+        """
+        Renomme, fusionne ou supprime des tags (exacts, par préfixe ou par
+        expression régulière) dans tout le dossier, après un aperçu
+        """
+        from captioninghelper.bulk import TagRewriteJob
+        from captioninghelper.ui.rewrite import TagRewriteDialog
+
+        dialog = TagRewriteDialog(self.current_language, self.selected_library_tag() or "", self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        try:
+            rewriter = dialog.rewriter()
+        except ValueError as e:
+            QMessageBox.warning(self, self.current_language.get("error_title", "Error"), str(e))
+            return
+        image_files = self.select_image_subset()
+        if image_files is None:
+            return
+        self.save_tags()
+        job = TagRewriteJob(self.captions, image_files, rewriter, dry_run=True)
+        title = self.current_language.get("rewrite_title", "Rewrite Tags")
+        self.run_job(job, title, on_finished=self.on_rewrite_preview)
+
+    def on_rewrite_preview(self, job):
+        from captioninghelper.bulk import TagRewriteJob
+        from captioninghelper.ui.rewrite import TagRewritePreviewDialog
+
+        if job.cancelled:
+            return
+        if TagRewritePreviewDialog(job, self.current_language, self).exec_() != QDialog.Accepted:
+            return
+        # Seules les images trouvées par l'aperçu sont reprises
+        apply_job = TagRewriteJob(self.captions, job.changed, job.rewriter)
+        title = self.current_language.get("rewrite_title", "Rewrite Tags")
+        self.run_job(apply_job, title, on_finished=lambda job: self.on_tags_rewritten(job, job.rewriter))
+
+    def on_tags_rewritten(self, job, rules):
+        """
+        Fin d'une réécriture ou d'une normalisation appliquée : les mêmes
+        `rules` (TagRewriter ou TagNormalizer) sont appliquées à la
+        bibliothèque de tags, sauf si le traitement a été annulé en cours
+        de route (seules les images déjà traitées ont changé)
+        """
+        from captioninghelper.bulk import rewrite_library
+
+        self.filter_stale = True
+        if self.image_files:
+            self.load_tags()
+        self.update_progress_bar()
+        self.update_undo_buttons()
+        if job.cancelled:
+            template = self.current_language.get(
+                "rewrite_cancelled",
+                "Cancelled: {images} images changed before stopping, the tag library was not updated."
+            )
+            QMessageBox.information(self, "Info", template.format(images=len(job.changed)))
+            return
+        library_changes = rewrite_library(self.tag_library, rules)
+        self.save_tag_library()
+        template = self.current_language.get(
+            "rewrite_success", "{images} images changed, {library} library tags updated."
+        )
+        QMessageBox.information(
+            self, self.current_language.get("success_title", "Success"),
+            template.format(images=len(job.changed), library=library_changes)
+        )
+
+    def normalize_tags(self):
+        """
+        Applique les règles de tag_rules.json (alias, implications, liste
+        noire, ordre) aux légendes choisies et à la bibliothèque de tags
+        """
+        from captioninghelper.rules import NormalizeTagsJob, load_rules
+
+        error_title = self.current_language.get("error_title", "Error")
+        try:
+            normalizer = load_rules(self.folder_path)
+        except ValueError as e:
+            QMessageBox.warning(self, error_title, str(e))
+            return
+        if normalizer is None:
+            QMessageBox.warning(self, error_title, self.current_language.get(
+                "no_tag_rules", "No tag_rules.json file in this folder."
+            ))
+            return
+        image_files = self.select_image_subset()
+        if image_files is None:
+            return
+        self.save_tags()
+        job = NormalizeTagsJob(self.captions, image_files, normalizer, dry_run=True)
+        title = self.current_language.get("normalize_tags_button", "Normalize Tags")
+        self.run_job(job, title, on_finished=self.on_normalize_preview)
+
+    def on_normalize_preview(self, job):
+        from captioninghelper.rules import NormalizeTagsJob
+
+        if job.cancelled:
+            return
+        title = self.current_language.get("normalize_tags_button", "Normalize Tags")
+        question = self.current_language.get("normalize_confirm", "{count} images will change. Apply the rules?")
+        if QMessageBox.question(self, title, question.format(count=len(job.changed))) != QMessageBox.Yes:
+            return
+        apply_job = NormalizeTagsJob(self.captions, job.changed, job.normalizer)
+        self.run_job(apply_job, title, on_finished=lambda job: self.on_tags_rewritten(job, job.normalizer))
+
+    def selected_library_tag(self):
+        index = self.tags_listbox.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(TagLibraryModel.TagRole)
 
     def save_tag_library(self):
-        with open(self.tag_library_file, "w", encoding="utf-8") as f:
-            json.dump(sorted(list(self.tag_library)), f, ensure_ascii=False, indent=4)
-        QMessageBox.information(self, "Success", "Tag library automatically saved in the folder.")
+        if self.tag_library.dirty:
+            self.tag_library.save(self.tag_library_file)
 
-    def load_tag_library(self):
-        if os.path.exists(self.tag_library_file):
-            with open(self.tag_library_file, "r", encoding="utf-8") as f:
-                self.tag_library = set(json.load(f))
-        self.update_tag_library()
+    def tag_count(self, tag):
+        """
+        Nombre d'images du dossier qui portent le tag
+        """
+        return self.tag_index.count(tag)
+
+    def complete_tag(self, prefix, limit=20):
+        """
+        Propositions d'autocomplétion : tags de la bibliothèque et tags déjà
+        utilisés dans le dossier, les plus fréquents d'abord
+        """
+        candidates = set(self.tag_library.complete(prefix, self.tag_count, limit))
+        candidates.update(self.tag_index.tags_with_prefix(prefix))
+        return sorted(candidates, key=lambda tag: (-self.tag_count(tag), tag))[:limit]
 
-    def update_tag_library(self):
-        self.tags_listbox.clear()
-        for tag in sorted(self.tag_library):
-            self.tags_listbox.addItem(tag)
+    def flush_pending(self):
+        """
+        Écritures différées : légendes, bibliothèque de tags, compteurs affichés
+        """
+        with self.own_folder_writes():
+            self.captions.flush()
+            self.save_tag_library()
+        self.update_undo_buttons()
+        if self.tag_counts_stale:
+            self.tag_counts_stale = False
+            self.tag_model.refresh_counts()
 
     def apply_tag(self):
-        selected_tag = self.tags_listbox.currentItem()
+        selected_tag = self.selected_library_tag()
         if not selected_tag:
             QMessageBox.warning(self, "Error", "Please select a tag.")
             return
@@ -449,8 +1103,8 @@ class ImageCaptioningApp(QMainWindow):
         tags_text = self.image_tags_display.toPlainText().strip()
         tags = [tag.strip() for tag in tags_text.split(",") if tag.strip()]
 
-        if selected_tag.text() not in tags:
-            tags.append(selected_tag.text())
+        if selected_tag not in tags:
+            tags.append(selected_tag)
 
         self.image_tags_display.setText(", ".join(tags))
         self.save_tags()
@@ -463,15 +1117,31 @@ class ImageCaptioningApp(QMainWindow):
     def add_tag_to_caption(self, new_tag):
         if not new_tag:
             return
-        tags_text = self.image_tags_display.toPlainText().strip()
-        tags = [tag.strip() for tag in tags_text.split(",") if tag.strip()]
-
-        if new_tag not in tags:
-            tags.append(new_tag)
+        # Chaque tag de `new_tag` (réponse du modèle) est ajouté ; les règles
+        # du dossier sont appliquées par save_tags()
+        tags = merge_tags(split_tags(self.image_tags_display.toPlainText()), new_tag)
 
         self.image_tags_display.setText(", ".join(tags))
         self.save_tags()
 
+    def add_tag_to_image(self, image_file, new_tag):
+        """
+        Ajoute un tag à une image quelconque : via l'éditeur si c'est
+        l'image affichée, sinon directement dans le CaptionStore
+        """
+        if self.image_files and image_file == self.image_files[self.current_index]:
+            self.add_tag_to_caption(new_tag)
+            return
+        if not new_tag:
+            return
+        # Une réponse du modèle peut contenir plusieurs tags
+        tags = merge_tags(self.captions.get(image_file), new_tag)
+        normalizer = self.tag_normalizer()
+        if normalizer is not None:
+            tags = normalizer.normalize(tags)
+        if self.captions.set(image_file, tags):
+            self.update_progress_bar()
+
     def remove_tag(self):
         tags_text = self.image_tags_display.toPlainText().strip()
         tags = [tag.strip() for tag in tags_text.split(",") if tag.strip()]
@@ -485,66 +1155,313 @@ class ImageCaptioningApp(QMainWindow):
             self.save_tags()
 
     def add_tag_to_all_images(self):
+        from captioninghelper.bulk import BulkTagJob
+
         # Récupère le tag sélectionné dans la liste
-        selected_tag = self.tags_listbox.currentItem()
+        selected_tag = self.selected_library_tag()
         if not selected_tag:
             error_title = self.current_language.get("error_title", "Error")
             error_msg = self.current_language.get("select_tag_error", "Please select a tag.")
             QMessageBox.warning(self, error_title, error_msg)
             return
 
-        tag_text = selected_tag.text()
-        applied_count = 0
-
-        # Itère sur toutes les images dans self.image_files
-        for image_file in self.image_files:
-            image_name = os.path.splitext(image_file)[0]
-            tags_file = os.path.join(self.folder_path, f"{image_name}.txt")
-            
-            # Charge les tags existants pour cette image
-            if os.path.exists(tags_file):
-                with open(tags_file, "r", encoding="utf-8") as f:
-                    file_tags = [t.strip() for t in f.read().strip().split(",") if t.strip()]
-            else:
-                file_tags = []
+        image_files = self.select_image_subset()
+        if image_files is None:
+            return
 
-            # Si le tag n'est pas déjà présent, l'ajouter
-            if tag_text not in file_tags:
-                file_tags.append(tag_text)
-                with open(tags_file, "w", encoding="utf-8") as f:
-                    f.write(", ".join(file_tags))
-                applied_count += 1
+        # Applique le tag en arrière-plan, seuls les .txt modifiés sont réécrits
+        job = BulkTagJob(self.captions, image_files, selected_tag)
+        title = self.current_language.get("add_tag_to_all_images", "Add Tag To All Images")
+        self.run_job(job, title, on_finished=self.on_bulk_tag_finished)
 
-        # Met à jour la barre de progression après modifications
+    def select_image_subset(self):
+        """
+        Demande à quelles images appliquer une opération par lot.
+        Retourne la liste des images choisies, ou None si annulé.
+        """
+        subsets = {
+            self.current_language.get("subset_all", "All images"): lambda f: True,
+            self.current_language.get("subset_uncaptioned", "Uncaptioned images"):
+                lambda f: not self.captions.is_captioned(f),
+            self.current_language.get("subset_captioned", "Captioned images"):
+                self.captions.is_captioned,
+        }
+        filtered_choice = self.current_language.get("subset_filtered", "Filtered images")
+        if self.filter_query:
+            subsets[filtered_choice] = None
+        choice, ok = QInputDialog.getItem(
+            self,
+            self.current_language.get("subset_title", "Apply To"),
+            self.current_language.get("subset_label", "Images:"),
+            list(subsets), 0, False
+        )
+        if not ok:
+            return None
+        if choice == filtered_choice:
+            return [self.image_files[i] for i in self.filter_positions()]
+        return [f for f in self.image_files if subsets[choice](f)]
+
+    def on_bulk_tag_finished(self, job):
+        # Recharge l'éditeur si l'image affichée a été modifiée
+        if self.image_files:
+            self.load_tags()
         self.update_progress_bar()
-        
+        self.update_undo_buttons()
+
+        if job.cancelled:
+            # Annulé en cours de route : seules les images déjà traitées ont le tag
+            template = self.current_language.get(
+                "add_tag_all_cancelled", "Cancelled: tag '{tag}' was applied to {count} images before stopping."
+            )
+            QMessageBox.information(self, "Info", template.format(tag=job.tag, count=len(job.changed)))
+            return
+
         # Affiche un message de succès (vous pouvez paramétrer ce message dans votre fichier de langues)
         success_title = self.current_language.get("success_title", "Success")
         success_msg_template = self.current_language.get("add_tag_all_success", "Tag '{tag}' has been applied to {count} images.")
-        success_msg = success_msg_template.format(tag=tag_text, count=applied_count)
+        success_msg = success_msg_template.format(tag=job.tag, count=len(job.changed))
         QMessageBox.information(self, success_title, success_msg)
 
+    def report_replayed_operations(self, count):
+        """
+        Signale les opérations interrompues terminées depuis le journal
+        """
+        msg_template = self.current_language.get(
+            "journal_replayed", "{count} interrupted operations were completed from the journal."
+        )
+        QMessageBox.information(self, "Info", msg_template.format(count=count))
+
+    def update_undo_buttons(self):
+        undo_label = self.journal.undo_label()
+        redo_label = self.journal.redo_label()
+        self.undo_button.setEnabled(undo_label is not None)
+        self.undo_button.setToolTip(undo_label or "")
+        self.redo_button.setEnabled(redo_label is not None)
+        self.redo_button.setToolTip(redo_label or "")
+
+    def undo_operation(self, redo=False):
+        """
+        Annule (ou rétablit) la dernière opération du journal : modification
+        de légendes, ajout d'un tag par lot, conversion en JPG
+        """
+        if self.job_runner is not None and self.job_runner.isRunning():
+            return
+        self.save_tags()
+        job = UndoJob(self.journal, self.captions, redo)
+        key, default = ("redo_button", "Redo") if redo else ("undo_button", "Undo")
+        self.run_job(job, self.current_language.get(key, default), on_finished=self.on_undo_finished)
+
+    def on_undo_finished(self, job):
+        if job.renamed:
+            self.apply_renames(job.renamed)
+        else:
+            self.filter_stale = True
+            if self.image_files:
+                self.load_tags()
+            self.update_progress_bar()
+        self.update_undo_buttons()
+
 
     # ======================
     #  FONCTIONS DE NAVIGATION
     # ======================
 
     def prev_image(self):
-        if self.current_index > 0:
-            self.current_index -= 1
+        target = self.step_index(-1)
+        if target is not None:
+            self.current_index = target
             self.load_image()
 
     def next_image(self):
-        if self.current_index < len(self.image_files) - 1:
-            self.current_index += 1
+        target = self.step_index(1)
+        if target is not None:
+            self.current_index = target
             self.load_image()
 
     def random_image(self):
         if not self.image_files:
             return
-        self.current_index = random.randint(0, len(self.image_files) - 1)
+        if self.next_random_index is not None and self.next_random_index < len(self.image_files) \
+                and self.is_navigable(self.next_random_index):
+            self.current_index = self.next_random_index
+        else:
+            target = self.pick_random_index()
+            if target is None:
+                return
+            self.current_index = target
         self.load_image()
 
+    def step_index(self, step):
+        """
+        Rang de l'image située à `step` crans de l'image courante, dans la
+        file de travail si elle est active (en bouclant), sinon parmi les
+        images du filtre s'il y en a un ; None si hors limites
+        """
+        queue = self.dataset.queue
+        if queue is not None:
+            image_id = queue.peek(step)
+            return self.dataset.position_of(image_id) if image_id is not None else None
+        positions = self.filter_positions()
+        if positions is None:
+            target = self.current_index + step
+            return target if 0 <= target < len(self.image_files) else None
+        if step > 0:
+            i = bisect.bisect_right(positions, self.current_index) + step - 1
+        else:
+            i = bisect.bisect_left(positions, self.current_index) + step
+        return positions[i] if 0 <= i < len(positions) else None
+
+    def pick_random_index(self):
+        queue = self.dataset.queue
+        if queue is not None:
+            current = self.dataset.id_at(self.current_index) if self.image_files else None
+            image_id = queue.random(exclude=current)
+            return self.dataset.position_of(image_id) if image_id is not None else None
+        positions = self.filter_positions()
+        if positions is None:
+            return random.randint(0, len(self.image_files) - 1) if self.image_files else None
+        return random.choice(positions) if positions else None
+
+    def is_navigable(self, index):
+        """
+        L'image de rang `index` fait-elle partie de la navigation
+        (file de travail ou filtre) ?
+        """
+        queue = self.dataset.queue
+        if queue is not None:
+            return self.dataset.id_at(index) in queue
+        positions = self.filter_positions()
+        if positions is None:
+            return True
+        i = bisect.bisect_left(positions, index)
+        return i < len(positions) and positions[i] == index
+
+    # ======================
+    #  FILE DE TRAVAIL
+    # ======================
+
+    def apply_queue_mode(self):
+        self.dataset.set_queue(*QUEUE_MODES[self.config["queue_mode"]])
+
+    def change_queue_mode(self):
+        """
+        Active la file des images à traiter (non légendées et / ou
+        signalées) : Suivante, Précédente et Aléatoire ne parcourent plus
+        qu'elle, et une image en sort dès qu'elle est légendée
+        """
+        self.config["queue_mode"] = self.queue_combo.currentData()
+        self.save_config()
+        self.apply_queue_mode()
+        self.update_queue_status()
+        queue = self.dataset.queue
+        if queue is not None and self.image_files:
+            if self.is_navigable(self.current_index):
+                queue.visit(self.dataset.id_at(self.current_index))
+            else:
+                target = self.step_index(1)
+                if target is not None:
+                    self.current_index = target
+                    self.load_image()
+                    return
+        if self.image_files:
+            self.prefetch_neighbours()
+
+    def update_queue_status(self):
+        queue = self.dataset.queue
+        if queue is None:
+            self.queue_status_label.clear()
+        else:
+            template = self.current_language.get("queue_status", "{count} left")
+            self.queue_status_label.setText(template.format(count=len(queue)))
+
+    def skip_image(self):
+        """
+        Remet l'image courante en fin de file et passe à la suivante
+        """
+        queue = self.dataset.queue
+        if queue is None or not self.image_files:
+            self.next_image()
+            return
+        self.save_tags()
+        queue.defer(self.dataset.id_at(self.current_index))
+        self.next_image()
+
+    def toggle_flag(self):
+        """
+        Signale l'image courante (à revoir) ou retire le signalement
+        """
+        if not self.image_files:
+            return
+        current = self.image_files[self.current_index]
+        self.dataset.flag(current, not self.dataset.is_flagged(current))
+        self.flag_button.setChecked(self.dataset.is_flagged(current))
+        save_flagged(self.folder_path, self.dataset.flagged_names())
+        self.update_queue_status()
+
+    # ======================
+    #  FONCTIONS DE FILTRE
+    # ======================
+
+    def apply_filter(self):
+        """
+        Restreint la navigation aux images qui correspondent à la requête saisie
+        """
+        query = self.filter_input.text().strip()
+        if query:
+            try:
+                self.tag_index.query(query)
+            except QueryError as e:
+                error_msg = self.current_language.get("filter_error", "Invalid filter: {error}")
+                QMessageBox.warning(self, "Error", error_msg.format(error=e))
+                return
+        self.filter_query = query
+        self.filter_stale = True
+        positions = self.filter_positions()
+        if positions is None:
+            self.filter_status_label.clear()
+        elif positions and self.current_index not in positions:
+            self.current_index = positions[0]
+            self.load_image()
+        else:
+            self.prefetch_neighbours()
+
+    def filter_positions(self):
+        """
+        Rangs (dans image_files) des images qui correspondent au filtre,
+        ou None s'il n'y a pas de filtre. Recalculé seulement après un changement.
+        """
+        if not self.filter_query:
+            return None
+        if self.filter_stale:
+            self.filter_stale = False
+            matches = self.tag_index.query(self.filter_query)
+            self.filter_cache = [
+                position for position, image_id in enumerate(self.dataset.visible_ids())
+                if image_id in matches
+            ]
+            msg_template = self.current_language.get("filter_matches", "{count} matching images")
+            self.filter_status_label.setText(msg_template.format(count=len(self.filter_cache)))
+        return self.filter_cache
+
+    def on_caption_changed(self, image_file, old_tags, new_tags):
+        # Toujours dans le thread de l'interface (signal caption_changed)
+        self.tag_index.update(image_file, old_tags, new_tags)
+        self.filter_stale = True
+        self.tag_counts_stale = True
+
+    def build_tag_index(self):
+        """
+        Construit l'index des tags en arrière-plan depuis les .txt
+        """
+        job = TagIndexBuildJob(self.tag_index, self.captions, list(self.image_files))
+        self.run_background(job, on_finished=self.on_tag_index_built)
+
+    def on_tag_index_built(self, job):
+        self.filter_stale = True
+        self.tag_model.refresh_counts()
+        # Les .txt lus sans aucun tag ne comptent plus comme légendés
+        self.update_progress_bar()
+
     # ======================
     #  FONCTIONS HIDE
     # ======================
@@ -553,12 +1470,14 @@ class ImageCaptioningApp(QMainWindow):
         if not self.image_files:
             return
         current_image = self.image_files[self.current_index]
-        if current_image not in self.hidden_images:
-            self.hidden_images.add(current_image)
-            self.save_hidden_images()
+        # Le masquage ne change qu'un compteur de la liste et n'ajoute qu'une ligne au journal
+        if self.dataset.hide(current_image):
+            self.hidden_images_log.append(current_image)
+            if self.hidden_images_log.needs_compaction:
+                self.save_hidden_images()
+            self.filter_stale = True
             QMessageBox.information(self, "Success", f"The image {current_image} has been hidden.")
             # Après le masquage, on passe à l'image suivante
-            self.load_image_list()
             if self.current_index >= len(self.image_files):
                 self.current_index = 0
             if self.image_files:
@@ -568,14 +1487,67 @@ class ImageCaptioningApp(QMainWindow):
         else:
             QMessageBox.information(self, "Info", "Image already hidden.")
 
+    def find_duplicates(self):
+        """
+        Cherche les images visibles en double ou presque (pHash) et propose
+        de cacher en une fois les doublons de chaque groupe
+        """
+        from captioninghelper.duplicates import DuplicateScanJob, numpy_available
+
+        if not self.image_files:
+            return
+        if not numpy_available():
+            QMessageBox.warning(self, "Error", self.current_language.get(
+                "duplicates_numpy_error", "Finding duplicates needs NumPy (pip install numpy)."
+            ))
+            return
+        job = DuplicateScanJob(self.folder_path, list(self.image_files), self.config["duplicate_threshold"])
+        title = self.current_language.get("duplicates_button", "Find Duplicates")
+        self.run_job(job, title, on_finished=self.on_duplicates_found)
+
+    def on_duplicates_found(self, job):
+        from captioninghelper.ui.duplicates import DuplicatesDialog
+
+        if job.cancelled or job.cache is None:
+            return
+        if not job.clusters:
+            QMessageBox.information(self, "Info", self.current_language.get(
+                "duplicates_none", "No duplicate images found."
+            ))
+            return
+        dialog = DuplicatesDialog(self.folder_path, job.clusters, job.cache.size, self.current_language, self)
+        if dialog.exec_() == QDialog.Accepted:
+            self.hide_images(dialog.checked_images())
+
+    def hide_images(self, names):
+        """
+        Cache plusieurs images en une opération (un passage sur la liste,
+        une écriture dans le journal des images cachées)
+        """
+        current = self.image_files[self.current_index] if self.image_files else None
+        hidden = self.dataset.hide_many(names)
+        if not hidden:
+            return
+        self.hidden_images_log.extend(hidden)
+        if self.hidden_images_log.needs_compaction:
+            self.save_hidden_images()
+        self.filter_stale = True
+        if current in self.image_files:
+            self.current_index = self.image_files.index(current)
+        elif self.current_index >= len(self.image_files):
+            self.current_index = 0
+        if self.image_files:
+            self.load_image()
+        self.update_progress_bar()
+        template = self.current_language.get("hide_images_success", "{count} images have been hidden.")
+        QMessageBox.information(self, "Success", template.format(count=len(hidden)))
+
     def save_hidden_images(self):
-        with open(self.hidden_images_file, "w", encoding="utf-8") as f:
-            json.dump(list(self.hidden_images), f, ensure_ascii=False, indent=4)
+        self.hidden_images_log.compact(self.dataset.hidden_names())
 
     def load_hidden_images(self):
-        if os.path.exists(self.hidden_images_file):
-            with open(self.hidden_images_file, "r", encoding="utf-8") as f:
-                self.hidden_images = set(json.load(f))
+        for name in self.hidden_images_log.load():
+            self.dataset.hide(name)
 
     # ======================
     #  FONCTIONS OLLAMA
@@ -587,40 +1559,190 @@ class ImageCaptioningApp(QMainWindow):
         """
         if not self.image_files:
             return
+        with tracer.span("send_to_ollama"):
+            self.start_captioning([self.image_files[self.current_index]])
 
-        image_path = os.path.join(self.folder_path, self.image_files[self.current_index])
+    def caption_all_with_ollama(self):
+        """
+        Légende par lot toutes les images qui n'ont pas encore de légende
+        """
+        uncaptioned = [f for f in self.image_files if not self.captions.is_captioned(f)]
+        if not uncaptioned:
+            info_msg = self.current_language.get("no_uncaptioned_info", "All images are already captioned.")
+            QMessageBox.information(self, "Info", info_msg)
+            return
+        self.start_captioning(uncaptioned)
+
+    def start_captioning(self, image_files):
+        """
+        Lance le légendage en arrière-plan via l'API HTTP d'Ollama
+        """
+        from captioninghelper.ollama import BatchCaptioner, OllamaClient
+
+        job = BatchCaptioner(
+            OllamaClient(self.config["ollama_url"]),
+            self.config["model"],
+            self.config["prompt"],
+            [os.path.join(self.folder_path, f) for f in image_files],
+            workers=self.config["ollama_workers"],
+            cache=self.caption_cache
+        )
+        title = self.current_language.get("captioning_title", "Auto-captioning")
+        self.run_job(job, title, self.on_caption_result, self.on_captioning_finished)
+
+    def on_caption_result(self, image_path, output):
+        self.add_tag_to_image(os.path.basename(image_path), output)
+
+    def on_captioning_finished(self, job):
+        if not job.errors:
+            return
+        if len(job.errors) == 1 and len(job.image_paths) == 1:
+            error_message = next(iter(job.errors.values()))
+            QMessageBox.critical(self, "Error", f"Ollama returned an error: {error_message}")
+            return
+        details = "\n".join(
+            f"{os.path.basename(path)}: {error}" for path, error in list(job.errors.items())[:10]
+        )
+        QMessageBox.critical(self, "Error", f"Ollama failed on {len(job.errors)} images:\n{details}")
 
-        command = ["ollama", "run", self.config["model"], image_path, self.config["prompt"]]
 
-        try:
-            if platform.system() == "Windows":
-                # Sous Windows, pour ne pas ouvrir de console
-                result = subprocess.run(
-                    command,
-                    capture_output=True,
-                    text=True,
-                    encoding="utf-8",
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-            else:
-                # Sous Linux/Mac, rediriger stderr vers /dev/null
-                result = subprocess.run(
-                    command,
-                    capture_output=True,
-                    text=True,
-                    encoding="utf-8",
-                    stderr=subprocess.DEVNULL
-                )
+    def show_cache_stats(self):
+        """
+        Affiche les statistiques du cache des légendes
+        """
+        stats = self.caption_cache.stats()
+        template = self.current_language.get(
+            "cache_stats_message",
+            "Cached captions: {entries}\nHits: {hits}\nMisses: {misses}\nHit rate: {hit_rate:.0%}"
+        )
+        title = self.current_language.get("cache_stats_button", "Caption Cache Statistics")
+        QMessageBox.information(self, title, template.format(**stats))
+
+    def apply_cached_captions(self):
+        """
+        Réapplique aux images sans légende les résultats en cache
+        pour le modèle et le prompt actuels, sans appeler Ollama
+        """
+        uncaptioned = [f for f in self.image_files if not self.captions.is_captioned(f)]
+        job = ReapplyCachedCaptions(
+            self.caption_cache,
+            self.config["model"],
+            self.config["prompt"],
+            [os.path.join(self.folder_path, f) for f in uncaptioned]
+        )
+        title = self.current_language.get("apply_cached_button", "Apply Cached Captions")
+        self.run_job(job, title, self.on_caption_result, self.on_cached_captions_applied)
+
+    def on_cached_captions_applied(self, job):
+        success_title = self.current_language.get("success_title", "Success")
+        msg_template = self.current_language.get("apply_cached_success", "Cached captions applied to {count} images.")
+        QMessageBox.information(self, success_title, msg_template.format(count=job.applied))
 
-            if result.returncode == 0:
-                output = result.stdout.strip()
-                self.add_tag_to_caption(output)
-            else:
-                error_message = result.stderr.strip()
-                QMessageBox.critical(self, "Error", f"Ollama returned an error: {error_message}")
 
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+    # ======================
+    #  FONCTIONS DE TÂCHES DE FOND
+    # ======================
+
+    def set_diagnostics(self, key, enabled):
+        """
+        Active ou non la mesure des temps ("record_timings") ou la
+        surcouche de latence ("latency_overlay", qui mesure aussi)
+        """
+        self.config[key] = enabled
+        self.save_config()
+        tracer.enabled = self.config["record_timings"] or self.config["latency_overlay"]
+        self.latency_overlay.setVisible(self.config["latency_overlay"])
+
+    def set_storage_option(self, key, enabled):
+        """
+        Base des légendes ("caption_database") et écriture des .txt à la
+        fermeture seulement ("defer_sidecars") : pris en compte à la
+        prochaine ouverture du dossier
+        """
+        self.config[key] = enabled
+        self.save_config()
+
+    def export_trace(self):
+        """
+        Exporte les temps mesurés au format Chrome trace (chrome://tracing, Perfetto)
+        """
+        title = self.current_language.get("export_trace_button", "Export Trace...")
+        path, _ = QFileDialog.getSaveFileName(
+            self, title, os.path.join(self.folder_path, "trace.json"), "Chrome trace (*.json)"
+        )
+        if not path:
+            return
+        count = tracer.export_chrome_trace(path)
+        template = self.current_language.get("export_trace_success", "{count} timings exported to {path}.")
+        QMessageBox.information(self, title, template.format(count=count, path=path))
+
+    def toggle_profiler(self, button):
+        """
+        Démarre ou arrête cProfile ; à l'arrêt, le profil et son résumé
+        sont écrits dans le dossier .captioninghelper
+        """
+        if not tracer.profiling:
+            tracer.start_profile()
+        else:
+            folder = os.path.join(self.folder_path, ".captioninghelper")
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+            tracer.stop_profile(path)
+            template = self.current_language.get("profile_saved", "Profile saved to {path}.")
+            QMessageBox.information(self, "Info", template.format(path=path))
+        self.update_profiler_button(button)
+
+    def update_profiler_button(self, button):
+        if tracer.profiling:
+            button.setText(self.current_language.get("stop_profiler_button", "Stop Profiler"))
+        else:
+            button.setText(self.current_language.get("start_profiler_button", "Start Profiler"))
+
+    def run_job(self, job, title, on_result=None, on_finished=None):
+        """
+        Exécute une tâche de fond avec sa fenêtre de progression
+        """
+        if self.job_runner is not None and self.job_runner.isRunning():
+            error_msg = self.current_language.get("job_running_error", "Another batch operation is already running.")
+            QMessageBox.warning(self, "Error", error_msg)
+            return
+        runner = JobRunner(job, self)
+        if on_result:
+            runner.result.connect(on_result)
+        runner.failure.connect(lambda error: self.show_job_failure(title, error))
+        if on_finished:
+            # Une tâche qui a échoué n'a pas de résultat à appliquer
+            runner.finished.connect(lambda: runner.error is None and on_finished(job))
+        self.job_runner = runner
+        dialog = JobDialog(runner, title, self.current_language, self)
+        dialog.show()
+        runner.start()
+
+    def run_background(self, job, on_result=None, on_finished=None):
+        """
+        Exécute une tâche de fond discrète (sans fenêtre de progression)
+        """
+        runner = JobRunner(job, self)
+        if on_result:
+            runner.result.connect(on_result)
+        runner.failure.connect(lambda error: self.show_job_failure(type(job).__name__, error))
+
+        def finished():
+            self.background_runners.remove(runner)
+            if on_finished and runner.error is None:
+                on_finished(job)
+
+        runner.finished.connect(finished)
+        self.background_runners.append(runner)
+        runner.start()
+        return runner
+
+
+    def show_job_failure(self, title, error):
+        template = self.current_language.get("job_failed", "{title} failed: {error}")
+        QMessageBox.critical(
+            self, self.current_language.get("error_title", "Error"), template.format(title=title, error=error)
+        )
 
 
     # ======================
@@ -642,11 +1764,9 @@ class ImageCaptioningApp(QMainWindow):
         """
         Réinitialise les paramètres aux valeurs par défaut
         """
-        default_prompt = ("Describe this image as a training prompt, using short, "
-                          "precise terms separated by commas. You'll answer only "
-                          "with these descriptive terms.")
-        default_model = "llava"
-        default_language = "English"
+        default_prompt = app_config.DEFAULT_PROMPT
+        default_model = app_config.DEFAULT_MODEL
+        default_language = app_config.DEFAULT_LANGUAGE
 
         prompt_input.setText(default_prompt)
         model_input.setText(default_model)
@@ -665,79 +1785,141 @@ class ImageCaptioningApp(QMainWindow):
     # ======================
 
     def load_config(self):
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        else:
-            config = {}
-
-        # Valeurs par défaut
-        default_config = {
-            "prompt": ("Describe this image as a training prompt, using short, "
-                       "precise terms separated by commas. You'll answer only "
-                       "with these descriptive terms."),
-            "model": "llava"
-        }
-
-        for key, value in default_config.items():
-            if key not in config:
-                config[key] = value
-
-        # Sauvegarde la config potentiellement mise à jour
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4)
-
-        return config
+        return app_config.load_config()
 
     def convert_to_jpg(self, input_folder):
+        from captioninghelper.convert import ConvertJob
+
         if not os.path.exists(input_folder):
             QMessageBox.warning(self, "Error", f"Le dossier {input_folder} n'existe pas.")
             return
 
-        supported_formats = ('.png', '.webp', '.jpeg', '.gif', '.bmp', '.tiff')
-        files = os.listdir(input_folder)
-        converted_count = 0
+        # La conversion déplace des .txt : les légendes en attente sont écrites avant
+        self.write_captions()
+        job = ConvertJob(
+            input_folder,
+            quality=self.config["jpg_quality"],
+            subsampling=self.config["jpg_subsampling"],
+            journal=self.journal if input_folder == self.folder_path else None
+        )
+        title = self.current_language.get("convert_to_jpg_button", "Convert All to JPG")
+        self.run_job(job, title, on_finished=self.on_conversion_finished)
 
-        for file in files:
-            if file.lower().endswith(supported_formats):
-                original_path = os.path.join(input_folder, file)
-                try:
-                    with Image.open(original_path) as img:
-                        rgb_img = img.convert('RGB')
-                        base_name = os.path.splitext(file)[0]
-                        jpg_name = base_name + '.jpg'
-                        jpg_path = os.path.join(input_folder, jpg_name)
+    def on_conversion_finished(self, job):
+        self.apply_renames(job.converted)
+        self.update_undo_buttons()
+        QMessageBox.information(self, "Success", f"{len(job.converted)} images ont été converties en JPG avec succès !")
 
-                        counter = 1
-                        # S'assure de ne pas écraser un .jpg existant
-                        while os.path.exists(jpg_path):
-                            jpg_name = f"{base_name}_{counter}.jpg"
-                            jpg_path = os.path.join(input_folder, jpg_name)
-                            counter += 1
 
-                        rgb_img.save(jpg_path, 'JPEG')
-                        os.remove(original_path)
-                        converted_count += 1
-                except Exception as e:
-                    print(f"Erreur lors de la conversion de {file}: {str(e)}")
+    def apply_renames(self, renamed):
+        """
+        Répercute des images renommées {ancien nom: nouveau nom} (conversion
+        en JPG ou son annulation) : images cachées, signalées, liste, index
+        """
+        renamed_hidden = [f for f in self.dataset.hidden_names() if f in renamed]
+        for name in renamed_hidden:
+            self.dataset.unhide(name)
+            self.dataset.hide(renamed[name])
+        if renamed_hidden:
+            self.save_hidden_images()
+        renamed_flagged = [f for f in self.dataset.flagged_names() if f in renamed]
+        for name in renamed_flagged:
+            self.dataset.flag(name, False)
+            self.dataset.flag(renamed[name])
+        if renamed_flagged:
+            save_flagged(self.folder_path, self.dataset.flagged_names())
+
+        current = self.image_files[self.current_index] if self.image_files else None
+        current = renamed.get(current, current)
+        self.load_image_list()
+        self.current_index = self.image_files.index(current) if current in self.image_files else 0
+        if self.image_files:
+            self.load_image()
+        self.update_progress_bar()
+
+    def export_dataset(self):
+        """
+        Exporte les images visibles et leurs légendes (archives WebDataset,
+        Parquet ou manifeste JSONL). Un export interrompu reprend s'il est
+        relancé vers le même dossier.
+        """
+        from captioninghelper.export import ExportJob, parquet_available
 
-        QMessageBox.information(self, "Success", f"{converted_count} images ont été converties en JPG avec succès !")
+        if not self.image_files:
+            return
+        formats = {
+            self.current_language.get("export_webdataset", "WebDataset (tar shards)"): "webdataset",
+            self.current_language.get("export_jsonl", "JSONL manifest"): "jsonl",
+        }
+        if parquet_available():
+            formats[self.current_language.get("export_parquet", "Parquet shards")] = "parquet"
+        title = self.current_language.get("export_button", "Export Dataset...")
+        choice, ok = QInputDialog.getItem(
+            self, title, self.current_language.get("export_format_label", "Format:"), list(formats), 0, False
+        )
+        if not ok:
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, title, os.path.dirname(self.folder_path))
+        if not output_dir:
+            return
 
+        # Les légendes sont relues depuis les .txt : celles en attente sont écrites avant
+        self.write_captions()
+        job = ExportJob(
+            self.folder_path,
+            list(self.image_files),
+            output_dir,
+            format=formats[choice],
+            shard_size=self.config["export_shard_mb"] * 1024 * 1024
+        )
+        self.run_job(job, title, on_finished=self.on_export_finished)
+
+    def on_export_finished(self, job):
+        if job.cancelled:
+            return
+        template = self.current_language.get(
+            "export_success", "{count} images exported in {shards} files to {path}."
+        )
+        QMessageBox.information(self, "Success", template.format(
+            count=job.exported, shards=len(job.shards), path=job.output_dir
+        ))
+
+    def closeEvent(self, event):
+        if self.job_runner is not None and self.job_runner.isRunning():
+            self.job_runner.job.cancel()
+            self.job_runner.wait()
+        for runner in list(self.background_runners):
+            runner.job.cancel()
+            runner.wait()
+        self.write_captions()
+        self.save_tag_library()
+        self.save_folder_snapshot()
+        if self.hidden_images_log.pending:
+            self.save_hidden_images()
+        if self.caption_db is not None:
+            names = self.dataset.names
+            self.caption_db.save_state(
+                [names[image_id] for image_id in self.dataset.present],
+                self.dataset.hidden_names(), self.dataset.flagged_names(), list(self.tag_library)
+            )
+            self.caption_db.close()
+        self.journal.close()
+        self.previews.shutdown()
+        self.caption_cache.close()
+        super().closeEvent(event)
 
     def save_last_folder(self, folder_path):
         """
         Sauvegarde le dernier dossier utilisé
         """
-        with open(LAST_FOLDER_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"last_folder": folder_path}, f)
+        app_config.save_last_folder(folder_path)
 
 
     def save_config(self):
         """
         Sauvegarde la config (prompt, model, language...) dans le fichier config.json
         """
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4)
+        app_config.save_config(self.config)
 
     def copy_image(self):
         image_path = os.path.join(self.folder_path, self.image_files[self.current_index])
@@ -752,6 +1934,8 @@ class ImageCaptioningApp(QMainWindow):
         clipboard.setText(text)
 
     def open_file_location(self):
+        import subprocess
+
         image_path = os.path.join(self.folder_path, self.image_files[self.current_index])
         folder = os.path.dirname(image_path)
         if platform.system() == 'Windows':
@@ -801,6 +1985,10 @@ class ImageCaptioningApp(QMainWindow):
         self.setWindowTitle(title)
 
         # Mise à jour du label principal "Tag Library"
+        self.tag_search_input.setPlaceholderText(
+            self.current_language.get('tag_search_placeholder', "Search tags...")
+        )
+
         tag_label = self.findChild(QLabel, "tag_library_label")
         if tag_label:
             tag_label.setText(self.current_language.get('tag_library_label', "Tag Library:"))
@@ -827,6 +2015,29 @@ class ImageCaptioningApp(QMainWindow):
         if convert_jpg_btn:
             convert_jpg_btn.setText(self.current_language.get('convert_to_jpg_button', "Convert All to JPG"))
 
+        clean_captions_btn = self.findChild(QPushButton, "clean_captions_button")
+        if clean_captions_btn:
+            clean_captions_btn.setText(self.current_language.get('clean_captions_button', "Clean Empty Captions"))
+
+        export_btn = self.findChild(QPushButton, "export_button")
+        if export_btn:
+            export_btn.setText(self.current_language.get('export_button', "Export Dataset..."))
+
+        rewrite_tags_btn = self.findChild(QPushButton, "rewrite_tags_button")
+        if rewrite_tags_btn:
+            rewrite_tags_btn.setText(self.current_language.get('rewrite_tags_button', "Rewrite Tags..."))
+
+        normalize_tags_btn = self.findChild(QPushButton, "normalize_tags_button")
+        if normalize_tags_btn:
+            normalize_tags_btn.setText(self.current_language.get('normalize_tags_button', "Normalize Tags"))
+
+        duplicates_btn = self.findChild(QPushButton, "duplicates_button")
+        if duplicates_btn:
+            duplicates_btn.setText(self.current_language.get('duplicates_button', "Find Duplicates"))
+
+        self.undo_button.setText(self.current_language.get('undo_button', "Undo"))
+        self.redo_button.setText(self.current_language.get('redo_button', "Redo"))
+
         settings_btn = self.findChild(QPushButton, "settings_button")
         if settings_btn:
             settings_btn.setToolTip(self.current_language.get('settings_button_tooltip', "Settings"))
@@ -867,6 +2078,29 @@ class ImageCaptioningApp(QMainWindow):
             add_tag_all_btn.setText(self.current_language.get("add_tag_to_all_images", "Add Tag To All Images"))
 
 
+        filter_lbl = self.findChild(QLabel, "filter_label")
+        if filter_lbl:
+            filter_lbl.setText(self.current_language.get('filter_label', "Filter:"))
+
+        queue_lbl = self.findChild(QLabel, "queue_label")
+        if queue_lbl:
+            queue_lbl.setText(self.current_language.get('queue_label', "Work Queue:"))
+
+        queue_names = {
+            "off": self.current_language.get('queue_off', "Off"),
+            "uncaptioned": self.current_language.get('queue_uncaptioned', "Uncaptioned"),
+            "flagged": self.current_language.get('queue_flagged', "Flagged"),
+            "both": self.current_language.get('queue_both', "Uncaptioned or flagged"),
+        }
+        for i in range(self.queue_combo.count()):
+            self.queue_combo.setItemText(i, queue_names[self.queue_combo.itemData(i)])
+
+        skip_btn = self.findChild(QPushButton, "skip_button")
+        if skip_btn:
+            skip_btn.setText(self.current_language.get('skip_button', "Skip"))
+        self.flag_button.setText(self.current_language.get('flag_button', "Flag"))
+        self.update_queue_status()
+
         hide_image_btn = self.findChild(QPushButton, "hide_image_button")
         if hide_image_btn:
             hide_image_btn.setText(self.current_language.get('hide_image_button', "Hide Image"))
@@ -875,6 +2109,10 @@ class ImageCaptioningApp(QMainWindow):
         if send_ollama_btn:
             send_ollama_btn.setText(self.current_language.get('send_to_ollama_button', "Send to Ollama"))
 
+        caption_all_btn = self.findChild(QPushButton, "caption_all_button")
+        if caption_all_btn:
+            caption_all_btn.setText(self.current_language.get('caption_all_button', "Caption All (Ollama)"))
+
 
 def main():
     app = QApplication(sys.argv)
@@ -884,15 +2122,14 @@ def main():
     app.setWindowIcon(app_icon)
 
     # Charge le dernier dossier utilisé
-    def load_last_folder():
-        if os.path.exists(LAST_FOLDER_FILE):
-            with open(LAST_FOLDER_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get("last_folder", "")
-        return ""
-
-    last_folder = load_last_folder()
-    folder_path = QFileDialog.getExistingDirectory(None, "Select the folder containing images", last_folder)
+    last_folder = app_config.load_last_folder()
+    if len(sys.argv) > 1 and sys.argv[1] == "--last" and os.path.isdir(last_folder):
+        # Rouvre directement le dernier dossier, sans boîte de dialogue
+        folder_path = last_folder
+    elif len(sys.argv) > 1 and os.path.isdir(sys.argv[1]):
+        folder_path = sys.argv[1]
+    else:
+        folder_path = QFileDialog.getExistingDirectory(None, "Select the folder containing images", last_folder)
 
     if folder_path:
         window = ImageCaptioningApp(folder_path)
@@ -0,0 +1,37 @@
+"""
+Compare deux résultats de benchmarks/run.py
+
+    python benchmarks/compare.py AVANT.json APRES.json
+"""
+import json
+import sys
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print(__doc__.strip())
+        return 2
+    before, after = load(argv[0]), load(argv[1])
+    print(f"{'':40s} {before.get('revision') or '?':>12s} {after.get('revision') or '?':>12s}")
+    for count, dataset in after["datasets"].items():
+        previous = before["datasets"].get(count, {}).get("results", {})
+        print(f"{count} images")
+        for name, result in dataset["results"].items():
+            new = result["median"] * 1000
+            if name in previous:
+                old = previous[name]["median"] * 1000
+                ratio = f"x{old / new:.2f}" if new else ""
+                print(f"  {name:38s} {old:10.1f} ms {new:10.1f} ms  {ratio}")
+            else:
+                print(f"  {name:38s} {'-':>13s} {new:10.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Générateur de dossiers d'images synthétiques pour les benchmarks
+
+    python benchmarks/generate.py DOSSIER --count 100000 --size 768x512 --formats png,jpg
+
+Chaque format n'est encodé qu'une fois, puis les octets sont réécrits
+pour chaque image : générer un million de fichiers reste rapide. Une part
+des PNG reçoit un prompt A1111 (chunk tEXt « parameters ») propre à
+l'image, une part des images une légende aléatoire, et une bibliothèque
+de tags est écrite à côté.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+
+from PIL import Image
+
+WORDS = (
+    "red blue green black white blonde silver long short curly hair eyes "
+    "smile open mouth closed standing sitting outdoors indoors night day sky "
+    "cloud tree flower dress shirt skirt hat glasses solo portrait full body "
+    "looking at viewer from side from behind detailed background simple"
+).split()
+
+
+def make_vocabulary(size, rng):
+    """
+    Tags du style « booru » : un à trois mots, suffixés si besoin pour être uniques
+    """
+    vocabulary = []
+    seen = set()
+    while len(vocabulary) < size:
+        tag = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        if tag in seen:
+            tag = f"{tag} {len(vocabulary)}"
+        seen.add(tag)
+        vocabulary.append(tag)
+    return vocabulary
+
+
+def encode_template(extension, size, rng):
+    """
+    Octets d'une image bruitée (pour que la compression ait du travail)
+    """
+    width, height = size
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    color = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    img = Image.blend(noise, color, 0.5)
+    buffer = io.BytesIO()
+    img.save(buffer, {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}[extension])
+    return buffer.getvalue()
+
+
+def png_with_text(png_bytes, keyword, text):
+    """
+    Insère un chunk tEXt juste après l'en-tête IHDR d'un PNG
+    """
+    data = keyword.encode("latin-1") + b"\0" + text.encode("latin-1", "replace")
+    chunk = struct.pack(">I", len(data)) + b"tEXt" + data
+    chunk += struct.pack(">I", zlib.crc32(b"tEXt" + data) & 0xFFFFFFFF)
+    ihdr_end = 8 + 8 + 13 + 4
+    return png_bytes[:ihdr_end] + chunk + png_bytes[ihdr_end:]
+
+
+def generate_dataset(folder_path, count, size=(512, 512), formats=("png", "jpg"),
+                     captioned=0.5, prompts=0.5, tags_per_image=(3, 12),
+                     vocabulary_size=5000, library_size=1000, seed=0):
+    """
+    Crée `count` images dans `folder_path` et retourne la description du
+    jeu de données (paramètres et nombres de fichiers créés)
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder_path, exist_ok=True)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    templates = {extension: encode_template(extension, size, rng) for extension in formats}
+
+    captions = with_prompt = 0
+    for i in range(count):
+        extension = formats[i % len(formats)]
+        name = f"img{i:07d}"
+        data = templates[extension]
+        tags = rng.sample(vocabulary, rng.randint(*tags_per_image))
+        if extension == "png" and rng.random() < prompts:
+            parameters = (", ".join(tags) + "\nNegative prompt: lowres, blurry\n"
+                          f"Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: {rng.randrange(2 ** 32)}, "
+                          f"Size: {size[0]}x{size[1]}, Model hash: 0123abcd")
+            data = png_with_text(data, "parameters", parameters)
+            with_prompt += 1
+        with open(os.path.join(folder_path, f"{name}.{extension}"), "wb") as f:
+            f.write(data)
+        if rng.random() < captioned:
+            with open(os.path.join(folder_path, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(", ".join(tags))
+            captions += 1
+
+    with open(os.path.join(folder_path, "tag_library.json"), "w", encoding="utf-8") as f:
+        json.dump(sorted(rng.sample(vocabulary, min(library_size, vocabulary_size))), f, indent=4)
+
+    return {
+        "images": count,
+        "size": list(size),
+        "formats": list(formats),
+        "captions": captions,
+        "png_prompts": with_prompt,
+        "vocabulary": vocabulary_size,
+        "library": min(library_size, vocabulary_size),
+        "seed": seed,
+    }
+
+
+def parse_size(text):
+    width, _, height = text.partition("x")
+    return int(width), int(height or width)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic image folder for benchmarks.")
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--size", type=parse_size, default=(512, 512), help="WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="png,jpg", help="comma separated: png, jpg, webp")
+    parser.add_argument("--captioned", type=float, default=0.5, help="fraction of images with a caption")
+    parser.add_argument("--prompts", type=float, default=0.5, help="fraction of PNG files with an A1111 prompt")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="number of distinct tags")
+    parser.add_argument("--library", type=int, default=1000, help="tags in tag_library.json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    description = generate_dataset(
+        args.folder, args.count, args.size, tuple(args.formats.split(",")),
+        captioned=args.captioned, prompts=args.prompts,
+        vocabulary_size=args.vocabulary, library_size=args.library, seed=args.seed
+    )
+    json.dump(description, sys.stdout, indent=4)
+    print()
+
+
+if __name__ == "__main__":
+    main()
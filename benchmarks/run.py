@@ -0,0 +1,241 @@
+"""
+Benchmarks des chemins critiques de l'application, sans affichage
+(plateforme Qt « offscreen »)
+
+    python benchmarks/run.py --counts 1000,10000 --repeat 3
+    python benchmarks/compare.py benchmarks/results/AVANT.json benchmarks/results/APRES.json
+
+Pour chaque taille, un dossier synthétique est généré (benchmarks/generate.py)
+puis chaque mesure est répétée ; les résultats sont écrits en JSON avec la
+révision git, la machine et les paramètres, pour comparer deux versions.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.generate import generate_dataset, parse_size  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def isolate_app_files(data_dir):
+    """
+    Redirige config.json, last_folder.json et le cache des légendes vers
+    `data_dir` : ouvrir la fenêtre ne doit pas écraser les fichiers du
+    développeur, et les mesures partent de la configuration par défaut
+    """
+    from captioninghelper import config, resultcache
+
+    state_dir = os.path.join(data_dir, "app")
+    os.makedirs(state_dir, exist_ok=True)
+    config.CONFIG_FILE = os.path.join(state_dir, "config.json")
+    config.LAST_FOLDER_FILE = os.path.join(state_dir, "last_folder.json")
+    resultcache.CAPTION_CACHE_FILE = os.path.join(state_dir, "caption_cache.db")
+
+
+def summarize(runs, items=None):
+    result = {"runs": runs, "median": statistics.median(runs), "min": min(runs)}
+    if items:
+        result["per_item"] = result["median"] / items
+    return result
+
+
+class Bench:
+    """
+    Mesures sur un dossier synthétique de `count` images
+    """
+
+    def __init__(self, app, data_dir, count, generate_args, repeat):
+        self.app = app
+        self.data_dir = data_dir
+        self.count = count
+        self.generate_args = generate_args
+        self.repeat = repeat
+        self.folder = os.path.join(data_dir, f"dataset-{count}")
+        self.dataset = generate_dataset(self.folder, count, **generate_args)
+        self.results = {}
+
+    def fresh_copy(self, name):
+        """
+        Nouveau dossier identique (pour les mesures qui le modifient)
+        """
+        path = os.path.join(self.data_dir, f"{name}-{self.count}")
+        shutil.rmtree(path, ignore_errors=True)
+        generate_dataset(path, self.count, **self.generate_args)
+        return path
+
+    def wait_background(self, window):
+        while window.background_runners or (window.job_runner and window.job_runner.isRunning()):
+            self.app.processEvents()
+            time.sleep(0.001)
+        self.app.processEvents()
+
+    def open_window(self, folder):
+        import Main
+        start = time.perf_counter()
+        window = Main.ImageCaptioningApp(folder)
+        self.wait_background(window)
+        return window, time.perf_counter() - start
+
+    def record(self, name, runs, items=None):
+        self.results[name] = summarize(runs, items)
+        print(f"  {name:32s} {self.results[name]['median'] * 1000:10.1f} ms", file=sys.stderr)
+
+    def run(self):
+        print(f"{self.count} images", file=sys.stderr)
+        opens = []
+        for _ in range(self.repeat):
+            # Sans état enregistré : premier parcours complet du dossier
+            shutil.rmtree(os.path.join(self.folder, ".captioninghelper"), ignore_errors=True)
+            window, seconds = self.open_window(self.folder)
+            opens.append(seconds)
+            window.close()
+        self.record("open_folder", opens, self.count)
+
+        window, seconds = self.open_window(self.folder)
+        self.record("reopen_folder_snapshot", [seconds], self.count)
+        try:
+            self.bench_window(window)
+        finally:
+            window.close()
+        self.bench_convert()
+        self.bench_extract_prompts()
+        return {"dataset": self.dataset, "results": self.results}
+
+    def bench_window(self, window):
+        runs = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            window.load_image_list()
+            runs.append(time.perf_counter() - start)
+            self.wait_background(window)
+        self.record("load_image_list", runs, self.count)
+
+        rng = random.Random(0)
+        indexes = [rng.randrange(len(window.image_files)) for _ in range(20)]
+        runs = []
+        for index in indexes:
+            window.current_index = index
+            start = time.perf_counter()
+            window.load_image()
+            runs.append(time.perf_counter() - start)
+        self.record("load_image", runs)
+
+        runs = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(100):
+                window.update_progress_bar()
+            runs.append((time.perf_counter() - start) / 100)
+        self.record("update_progress_bar", runs)
+
+        from captioninghelper.bulk import BulkTagJob
+        runs = []
+        for i in range(self.repeat):
+            # Le même chemin que add_tag_to_all_images, sans la boîte de dialogue
+            job = BulkTagJob(window.captions, list(window.image_files), f"benchmark tag {i}")
+            start = time.perf_counter()
+            job.run()
+            runs.append(time.perf_counter() - start)
+        self.record("add_tag_to_all_images", runs, self.count)
+
+    def bench_convert(self):
+        from captioninghelper.convert import ConvertJob
+        runs = []
+        for _ in range(self.repeat):
+            folder = self.fresh_copy("convert")
+            job = ConvertJob(folder)
+            start = time.perf_counter()
+            job.run()
+            runs.append(time.perf_counter() - start)
+            shutil.rmtree(folder, ignore_errors=True)
+        self.record("convert_to_jpg", runs, self.count)
+
+    def bench_extract_prompts(self):
+        from captioninghelper.prompts import ExtractPromptsJob
+        cold, warm = [], []
+        for _ in range(self.repeat):
+            folder = self.fresh_copy("prompts")
+            start = time.perf_counter()
+            ExtractPromptsJob(folder).run()
+            cold.append(time.perf_counter() - start)
+            # Deuxième passage : tout est à jour, rien n'est relu
+            start = time.perf_counter()
+            ExtractPromptsJob(folder).run()
+            warm.append(time.perf_counter() - start)
+            shutil.rmtree(folder, ignore_errors=True)
+        self.record("metatxt_process_folder", cold, self.count)
+        self.record("metatxt_process_folder_again", warm, self.count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of the application (headless).")
+    parser.add_argument("--counts", default="1000", help="comma separated dataset sizes, e.g. 1000,100000")
+    parser.add_argument("--size", type=parse_size, default=(512, 512), help="image size, WIDTHxHEIGHT")
+    parser.add_argument("--formats", default="png,jpg", help="comma separated: png, jpg, webp")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where to generate datasets (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated datasets")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/DATE-REVISION.json)")
+    args = parser.parse_args(argv)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="captioninghelper-bench-")
+    isolate_app_files(data_dir)
+    generate_args = {"size": args.size, "formats": tuple(args.formats.split(",")), "seed": args.seed}
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {"size": list(args.size), "formats": generate_args["formats"],
+                       "repeat": args.repeat, "seed": args.seed},
+        "datasets": {},
+    }
+    try:
+        for count in (int(c) for c in args.counts.split(",")):
+            report["datasets"][str(count)] = Bench(app, data_dir, count, generate_args, args.repeat).run()
+    finally:
+        if not args.keep and not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{revision or 'unknown'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Cœur de Captioninghelper : logique indépendante de l'interface Qt
+"""
@@ -0,0 +1,216 @@
+"""
+Modifications de légendes par lot, exécutées en arrière-plan
+"""
+import os
+import re
+from collections import Counter
+from contextlib import nullcontext
+
+from captioninghelper.jobs import Job
+
+REWRITE_MODES = ("exact", "prefix", "regex")
+
+
+class BulkTagJob(Job):
+    """
+    Ajoute un tag à un ensemble d'images en passant par le CaptionStore :
+    les légendes manquantes sont chargées par paquets en parallèle, seules
+    les images réellement modifiées sont marquées, puis tout est écrit
+    en un seul flush(), qui forme une seule opération du journal
+    (annulable d'un coup). Les images modifiées sont listées dans `changed`.
+
+    Les sous-classes qui proposent un aperçu (`dry_run`) ne modifient
+    rien et n'ouvrent alors pas d'opération du journal.
+    """
+
+    batch_size = 1024
+    dry_run = False
+
+    def __init__(self, store, image_files, tag):
+        super().__init__()
+        self.store = store
+        self.image_files = list(image_files)
+        self.tag = tag
+        self.changed = []
+
+    def update_tags(self, tags):
+        """
+        Retourne la nouvelle liste de tags, ou None si rien ne change
+        """
+        if self.tag in tags:
+            return None
+        return tags + [self.tag]
+
+    @property
+    def label(self):
+        return f"Add tag '{self.tag}'"
+
+    def run(self):
+        total = len(self.image_files)
+        self.report(0, total)
+        with self.store.batch(self.label) if not self.dry_run else nullcontext():
+            for start in range(0, total, self.batch_size):
+                if not self.checkpoint():
+                    break
+                batch = self.image_files[start:start + self.batch_size]
+                self.store.preload(batch)
+                for image_file in batch:
+                    self.process(image_file)
+                self.report(start + len(batch), total, os.path.basename(batch[-1]))
+
+    def process(self, image_file):
+        new_tags = self.update_tags(self.store.get(image_file))
+        if new_tags is not None and self.store.set(image_file, new_tags):
+            self.changed.append(image_file)
+
+
+class TagRewriter:
+    """
+    Règle de réécriture des tags : chaque tag qui correspond à `pattern`
+    (tag exact, préfixe, ou expression régulière cherchée dans le tag)
+    est remplacé par `replacement` (pour un préfixe : le préfixe seul est
+    remplacé ; pour une expression : re.sub, avec \\1...), ou supprimé si
+    `replacement` est None. Un tag renommé en un tag déjà présent est
+    fusionné avec lui.
+
+    Le résultat est mémorisé par tag distinct : le vocabulaire d'un
+    dossier est bien plus petit que son nombre de légendes.
+    """
+
+    def __init__(self, pattern, replacement=None, mode="exact", ignore_case=False):
+        if mode not in REWRITE_MODES:
+            raise ValueError(f"Unknown rewrite mode: {mode}")
+        if not pattern:
+            raise ValueError("Empty pattern")
+        self.pattern = pattern
+        self.replacement = replacement
+        self.mode = mode
+        self.ignore_case = ignore_case
+        if mode == "regex":
+            try:
+                self._regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression: {e}") from None
+        self._folded = pattern.casefold() if ignore_case else pattern
+        self._cache = {}
+
+    @property
+    def label(self):
+        if self.replacement is None:
+            return f"Delete tags {self.mode} '{self.pattern}'"
+        return f"Rewrite tags {self.mode} '{self.pattern}' -> '{self.replacement}'"
+
+    def _prefix_end(self, tag):
+        """
+        Fin, dans `tag`, du préfixe qui correspond au motif, ou None. Sans
+        tenir compte de la casse, elle peut différer de la longueur du
+        motif (« ß » se compare comme « ss »).
+        """
+        if not self.ignore_case:
+            return len(self.pattern) if tag.startswith(self.pattern) else None
+        for end in range(1, len(tag) + 1):
+            folded = tag[:end].casefold()
+            if folded == self._folded:
+                return end
+            if not self._folded.startswith(folded):
+                return None
+        return None
+
+    def _rewrite(self, tag):
+        key = tag.casefold() if self.ignore_case else tag
+        if self.mode == "exact":
+            if key != self._folded:
+                return tag
+            return self.replacement.strip() if self.replacement is not None else None
+        if self.mode == "prefix":
+            end = self._prefix_end(tag)
+            if end is None:
+                return tag
+            if self.replacement is None:
+                return None
+            return (self.replacement + tag[end:]).strip()
+        if self.replacement is None:
+            return None if self._regex.search(tag) else tag
+        return self._regex.sub(self.replacement, tag).strip()
+
+    def rewrite_tag(self, tag):
+        """
+        Nouveau tag, ou None s'il est supprimé
+        """
+        try:
+            return self._cache[tag]
+        except KeyError:
+            new_tag = self._rewrite(tag) or None
+            self._cache[tag] = new_tag
+            return new_tag
+
+    def rewrite(self, tags):
+        """
+        Retourne (nouvelle liste de tags, tags modifiés [(ancien, nouveau)]),
+        ou None si aucun tag ne change
+        """
+        changes = []
+        for tag in tags:
+            new_tag = self.rewrite_tag(tag)
+            if new_tag != tag:
+                changes.append((tag, new_tag))
+        if not changes:
+            return None
+        new_tags = []
+        seen = set()
+        for tag in tags:
+            new_tag = self.rewrite_tag(tag)
+            if new_tag is not None and new_tag not in seen:
+                seen.add(new_tag)
+                new_tags.append(new_tag)
+        return new_tags, changes
+
+
+class TagRewriteJob(BulkTagJob):
+    """
+    Applique un TagRewriter à un ensemble d'images, en un seul passage
+    (légendes chargées par paquets en parallèle, une seule opération du
+    journal). En aperçu (`dry_run`), rien n'est modifié.
+
+    Résultats : `changed` (images touchées), `counts` {image: nombre de
+    tags modifiés} et `tag_changes` Counter {(ancien, nouveau ou None):
+    nombre d'images}.
+    """
+
+    def __init__(self, store, image_files, rewriter, dry_run=False):
+        super().__init__(store, image_files, None)
+        self.rewriter = rewriter
+        self.dry_run = dry_run
+        self.counts = {}
+        self.tag_changes = Counter()
+
+    @property
+    def label(self):
+        return self.rewriter.label
+
+    def process(self, image_file):
+        result = self.rewriter.rewrite(self.store.get(image_file))
+        if result is None:
+            return
+        new_tags, changes = result
+        if not self.dry_run and not self.store.set(image_file, new_tags):
+            return
+        self.changed.append(image_file)
+        self.counts[image_file] = len(changes)
+        self.tag_changes.update(changes)
+
+
+def rewrite_library(library, rewriter):
+    """
+    Applique la règle aux tags d'une TagLibrary : un tag renommé est
+    remplacé par son nouveau nom, un tag supprimé est retiré. Retourne le
+    nombre de tags de la bibliothèque modifiés.
+    """
+    changes = [(tag, rewriter.rewrite_tag(tag)) for tag in library]
+    changes = [(tag, new_tag) for tag, new_tag in changes if new_tag != tag]
+    for tag, new_tag in changes:
+        library.remove(tag)
+    for tag, new_tag in changes:
+        if new_tag is not None:
+            library.add(new_tag)
+    return len(changes)
@@ -0,0 +1,90 @@
+"""
+Lecture / écriture des légendes (.txt)
+"""
+import os
+
+
+def caption_path(folder_path, image_file):
+    """
+    Chemin du fichier .txt associé à une image
+    """
+    image_name = os.path.splitext(image_file)[0]
+    return os.path.join(folder_path, f"{image_name}.txt")
+
+
+def split_tags(text):
+    return [tag.strip() for tag in text.split(",") if tag.strip()]
+
+
+def merge_tags(tags, text):
+    """
+    `tags` suivis des tags de `text` (liste séparée par des virgules,
+    comme une réponse du modèle) qu'ils ne contiennent pas encore
+    """
+    merged = list(tags)
+    for tag in split_tags(text):
+        if tag not in merged:
+            merged.append(tag)
+    return merged
+
+
+def is_empty_caption(text):
+    """
+    Une légende sans aucun tag (vide, espaces ou virgules seulement)
+    """
+    return not split_tags(text)
+
+
+def join_tags(tags):
+    return ", ".join(tags)
+
+
+def read_tags(folder_path, image_file):
+    """
+    Lit les tags d'une image (liste vide si pas de .txt)
+    """
+    tags_file = caption_path(folder_path, image_file)
+    if not os.path.exists(tags_file):
+        return []
+    with open(tags_file, "r", encoding="utf-8") as f:
+        return split_tags(f.read())
+
+
+def write_tags(folder_path, image_file, tags):
+    """
+    Écrit les tags d'une image. Une légende vide supprime le .txt
+    au lieu de laisser un fichier vide. Retourne True si l'image est légendée.
+    L'écriture passe par un fichier temporaire renommé : un .txt n'est
+    jamais laissé à moitié écrit.
+    """
+    tags_file = caption_path(folder_path, image_file)
+    if tags:
+        tmp_file = tags_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(join_tags(tags))
+        os.replace(tmp_file, tags_file)
+        return True
+    if os.path.exists(tags_file):
+        os.remove(tags_file)
+    return False
+
+
+def remove_empty_captions(folder_path):
+    """
+    Passe de nettoyage explicite : supprime les fichiers .txt vides du
+    dossier (sans aucun tag, voir is_empty_caption). Retourne la liste des fichiers supprimés.
+    """
+    removed = []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".txt") or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    empty = is_empty_caption(f.read())
+                if empty:
+                    os.remove(entry.path)
+                    removed.append(entry.name)
+            except Exception as e:
+                print(f"Erreur lors de la suppression de {entry.name}: {e}")
+    return removed
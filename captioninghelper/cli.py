@@ -0,0 +1,454 @@
+"""
+Ligne de commande : les traitements par lot de l'application sans interface
+graphique (ni PyQt5, ni affichage), pour les serveurs et les tâches cron.
+
+    python -m captioninghelper caption DOSSIER [--all] [--model M] [--workers N]
+    python -m captioninghelper convert DOSSIER [--quality Q] [--workers N]
+    python -m captioninghelper stats DOSSIER [--top N] [--json]
+    python -m captioninghelper extract-prompts DOSSIER [--force]
+    python -m captioninghelper metadata DOSSIER
+    python -m captioninghelper export DOSSIER SORTIE [--format webdataset|parquet|jsonl]
+    python -m captioninghelper duplicates DOSSIER [--threshold N] [--hide]
+    python -m captioninghelper db sync|query TAG|tags DOSSIER
+    python -m captioninghelper normalize DOSSIER [--dry-run]
+    python -m captioninghelper rewrite DOSSIER MOTIF [--replace R | --delete] [--mode exact|prefix|regex] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import Counter
+
+from captioninghelper.config import load_config
+from captioninghelper.dataset import Dataset, HiddenImagesLog, load_flagged
+from captioninghelper.scan import FolderSnapshot, scan_entries
+from captioninghelper.store import CaptionStore
+
+
+def open_folder(folder_path, database=None):
+    """
+    Parcourt le dossier comme le fait l'interface : Dataset (images
+    cachées exclues) et CaptionStore associé. Avec une `database`
+    (database.CaptionDatabase), celle-ci est d'abord mise à jour depuis
+    les .txt, puis sert de source aux lectures de légendes.
+    """
+    dataset = Dataset()
+    for name in HiddenImagesLog(folder_path).load():
+        dataset.hide(name)
+    snapshot = FolderSnapshot()
+    for images, captions in scan_entries(folder_path):
+        snapshot.add(images, captions)
+        dataset.add_captions(captions)
+        dataset.add_images(images)
+    if database is not None:
+        database.export_sidecars()
+        database.sync_sidecars(snapshot.captions)
+    return dataset, CaptionStore(folder_path, dataset, database)
+
+
+def print_progress(done, total, item):
+    if total:
+        print(f"\r{done} / {total}", end="" if done < total else "\n", file=sys.stderr, flush=True)
+
+
+def run_job(job, quiet=False):
+    """
+    Exécute une tâche jusqu'au bout ; Ctrl+C l'annule proprement
+    (les éléments en cours se terminent, le reste est abandonné)
+    """
+    if not quiet and sys.stderr.isatty():
+        job.on_progress = print_progress
+    worker = threading.Thread(target=job.run, name=type(job).__name__)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        print("\nCancelling...", file=sys.stderr)
+        job.cancel()
+        worker.join()
+    for item, error in list(job.errors.items())[:20]:
+        print(f"{item}: {error}", file=sys.stderr)
+    return 1 if job.errors or job.cancelled else 0
+
+
+def cmd_caption(args, config):
+    from captioninghelper.captions import merge_tags
+    from captioninghelper.ollama import BatchCaptioner, OllamaClient
+    from captioninghelper.resultcache import CaptionCache
+    from captioninghelper.rules import load_rules
+
+    try:
+        normalizer = load_rules(args.folder)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    dataset, store = open_folder(args.folder)
+    if not args.all:
+        # Un .txt sans aucun tag (espaces, virgules) ne compte pas comme une légende
+        store.preload(list(dataset.images))
+    image_files = [f for f in dataset.images if args.all or not store.is_captioned(f)]
+    if not image_files:
+        print("All images are already captioned.")
+        return 0
+
+    cache = None if args.no_cache else CaptionCache(max_entries=config["caption_cache_entries"])
+    job = BatchCaptioner(
+        OllamaClient(args.url or config["ollama_url"]),
+        args.model or config["model"],
+        args.prompt or config["prompt"],
+        [os.path.join(args.folder, f) for f in image_files],
+        workers=args.workers or config["ollama_workers"],
+        cache=cache
+    )
+
+    def on_result(image_path, output):
+        # Même comportement que l'interface : chaque tag de la réponse est
+        # ajouté, puis les règles du dossier sont appliquées s'il y en a
+        image_file = os.path.basename(image_path)
+        tags = merge_tags(store.get(image_file), output or "")
+        if normalizer is not None:
+            tags = normalizer.normalize(tags)
+        store.set(image_file, tags)
+        if store.dirty_count >= 64:
+            store.flush()
+
+    job.on_result = on_result
+    try:
+        status = run_job(job, args.quiet)
+    finally:
+        store.flush()
+        if cache:
+            cache.close()
+    print(f"{job.done - len(job.errors)} images captioned, {len(job.errors)} errors.")
+    return status
+
+
+def cmd_convert(args, config):
+    from captioninghelper.convert import ConvertJob
+
+    job = ConvertJob(
+        args.folder,
+        quality=args.quality or config["jpg_quality"],
+        subsampling=config["jpg_subsampling"],
+        workers=args.workers
+    )
+    status = run_job(job, args.quiet)
+
+    # Les images cachées renommées restent cachées sous leur nouveau nom
+    hidden_log = HiddenImagesLog(args.folder)
+    hidden = hidden_log.load()
+    if any(name in job.converted for name in hidden):
+        hidden_log.compact({job.converted.get(name, name) for name in hidden})
+    print(f"{len(job.converted)} images converted to JPG.")
+    return status
+
+
+def cmd_stats(args, config):
+    database = None
+    if config["caption_database"]:
+        from captioninghelper.database import CaptionDatabase
+
+        database = CaptionDatabase(args.folder)
+    dataset, store = open_folder(args.folder, database)
+    images = list(dataset.images)
+    store.preload(images)
+    tag_counts = Counter()
+    for image_file in images:
+        tag_counts.update(set(store.get(image_file)))
+
+    stats = {
+        "images": len(images),
+        "hidden": len(dataset.hidden_names()),
+        "captioned": sum(1 for f in images if store.is_captioned(f)),
+        "distinct_tags": len(tag_counts),
+        "top_tags": tag_counts.most_common(args.top),
+    }
+    stats["uncaptioned"] = stats["images"] - stats["captioned"]
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=4))
+        return 0
+    print(f"Images: {stats['images']} ({stats['hidden']} hidden)")
+    print(f"Captioned: {stats['captioned']}  Uncaptioned: {stats['uncaptioned']}")
+    print(f"Distinct tags: {stats['distinct_tags']}")
+    for tag, count in stats["top_tags"]:
+        print(f"{count:8d}  {tag}")
+    return 0
+
+
+def cmd_extract_prompts(args, config):
+    from captioninghelper.prompts import ExtractPromptsJob
+
+    job = ExtractPromptsJob(args.folder, workers=args.workers, force=args.force)
+    status = run_job(job, args.quiet)
+    print(f"{len(job.written)} prompts extracted, {job.skipped} up to date.")
+    return status
+
+
+def cmd_metadata(args, config):
+    from captioninghelper.prompts import ExtractPromptsJob
+
+    # Met le cache à jour (seules les images modifiées sont relues) puis l'affiche
+    job = ExtractPromptsJob(args.folder, workers=args.workers, write_captions=False)
+    status = run_job(job, args.quiet)
+    for name in sorted(job.cache.columns["name"]):
+        info = job.cache.get(name)
+        if info is not None:
+            print(json.dumps(dict(info._asdict(), name=name), ensure_ascii=False))
+    return status
+
+
+def cmd_export(args, config):
+    from captioninghelper.export import ExportJob, parquet_available
+
+    if args.format == "parquet" and not parquet_available():
+        print("The Parquet export needs pyarrow (pip install pyarrow).", file=sys.stderr)
+        return 2
+    dataset, _ = open_folder(args.folder)
+    job = ExportJob(
+        args.folder,
+        dataset.images,
+        args.output,
+        format=args.format,
+        shard_size=args.shard_size * 1024 * 1024,
+        reencode="jpg" if args.jpg else None,
+        quality=args.quality or config["jpg_quality"],
+        captioned_only=args.captioned_only,
+        workers=args.workers
+    )
+    status = run_job(job, args.quiet)
+    print(f"{job.exported} images exported in {len(job.shards)} shards to {args.output}.")
+    return status
+
+
+def cmd_duplicates(args, config):
+    from captioninghelper.duplicates import DuplicateScanJob, numpy_available
+
+    if not numpy_available():
+        print("Finding duplicates needs NumPy (pip install numpy).", file=sys.stderr)
+        return 2
+    dataset, _ = open_folder(args.folder)
+    job = DuplicateScanJob(
+        args.folder, dataset.images,
+        threshold=config["duplicate_threshold"] if args.threshold is None else args.threshold,
+        workers=args.workers
+    )
+    status = run_job(job, args.quiet)
+    to_hide = []
+    for names in job.clusters:
+        # Garde l'image la plus lourde de chaque groupe
+        keep = max(names, key=job.cache.size)
+        to_hide += [name for name in names if name != keep]
+        print("  ".join(("*" if name == keep else " ") + name for name in names))
+    if args.hide and to_hide:
+        hidden_log = HiddenImagesLog(args.folder)
+        hidden_log.compact(hidden_log.load() | set(to_hide))
+    action = "hidden" if args.hide else "to hide (use --hide)"
+    print(f"{len(job.clusters)} groups of duplicates, {len(to_hide)} images {action}.")
+    return status
+
+
+def cmd_rewrite(args, config):
+    from captioninghelper.bulk import TagRewriteJob, TagRewriter, rewrite_library
+    from captioninghelper.journal import OperationJournal
+    from captioninghelper.taglibrary import TagLibrary
+
+    if (args.replace is None) == (not args.delete):
+        print("Give either --replace or --delete.", file=sys.stderr)
+        return 2
+    try:
+        rewriter = TagRewriter(args.pattern, args.replace, args.mode, args.ignore_case)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    dataset, store = open_folder(args.folder)
+    if not args.dry_run:
+        store.journal = OperationJournal(args.folder)
+    job = TagRewriteJob(store, dataset.images, rewriter, dry_run=args.dry_run)
+    status = run_job(job, args.quiet)
+    for (tag, new_tag), count in job.tag_changes.most_common():
+        print(f"{count:8d}  {tag} -> {new_tag if new_tag is not None else '(deleted)'}")
+    if args.dry_run:
+        for image_file in sorted(job.changed):
+            print(f"{job.counts[image_file]:8d}  {image_file}")
+        print(f"{len(job.changed)} images would change.")
+        return status
+    store.journal.close()
+    library_path = os.path.join(args.folder, "tag_library.json")
+    library = TagLibrary.load(library_path)
+    library_changes = rewrite_library(library, rewriter)
+    if library.dirty:
+        library.save(library_path)
+    print(f"{len(job.changed)} images changed, {library_changes} library tags updated.")
+    return status
+
+
+def cmd_normalize(args, config):
+    from captioninghelper.bulk import rewrite_library
+    from captioninghelper.journal import OperationJournal
+    from captioninghelper.rules import NormalizeTagsJob, RULES_FILE, load_rules
+    from captioninghelper.taglibrary import TagLibrary
+
+    try:
+        normalizer = load_rules(args.folder)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if normalizer is None:
+        print(f"No {RULES_FILE} in {args.folder}.", file=sys.stderr)
+        return 2
+    dataset, store = open_folder(args.folder)
+    if not args.dry_run:
+        store.journal = OperationJournal(args.folder)
+    job = NormalizeTagsJob(store, dataset.images, normalizer, dry_run=args.dry_run)
+    status = run_job(job, args.quiet)
+    if args.dry_run:
+        for image_file in sorted(job.changed):
+            print(image_file)
+        print(f"{len(job.changed)} images would change.")
+        return status
+    store.journal.close()
+    library_path = os.path.join(args.folder, "tag_library.json")
+    library = TagLibrary.load(library_path)
+    library_changes = rewrite_library(library, normalizer)
+    if library.dirty:
+        library.save(library_path)
+    print(f"{len(job.changed)} images changed, {library_changes} library tags updated.")
+    return status
+
+
+def cmd_db(args, config):
+    from captioninghelper.database import CaptionDatabase
+    from captioninghelper.metadata import MetadataCache
+    from captioninghelper.taglibrary import TagLibrary
+
+    database = CaptionDatabase(args.folder)
+    try:
+        if args.action == "sync":
+            # Légendes en attente vers les .txt, .txt modifiés vers la base
+            exported = database.export_sidecars()
+            snapshot = FolderSnapshot()
+            for images, captions in scan_entries(args.folder):
+                snapshot.add(images, captions)
+            changed = database.sync_sidecars(snapshot.captions)
+            database.save_state(
+                sorted(snapshot.images), HiddenImagesLog(args.folder).load(), load_flagged(args.folder),
+                TagLibrary.load(os.path.join(args.folder, "tag_library.json"))
+            )
+            database.save_metadata(MetadataCache(args.folder))
+            print(f"{len(changed)} captions imported, {exported} .txt files written.")
+        elif args.action == "query":
+            if not args.tag:
+                print("query needs a tag.", file=sys.stderr)
+                return 2
+            for name in database.images_with_tag(args.tag, include_hidden=args.include_hidden):
+                print(name)
+        else:
+            for tag, count in database.tag_counts(args.top):
+                print(f"{count:8d}  {tag}")
+    finally:
+        database.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m captioninghelper",
+        description="Batch processing of image captioning datasets, without the GUI."
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    caption = commands.add_parser("caption", help="caption images with Ollama")
+    caption.add_argument("folder")
+    caption.add_argument("--all", action="store_true", help="also caption already captioned images")
+    caption.add_argument("--model", help="Ollama model (default: from config.json)")
+    caption.add_argument("--prompt", help="prompt (default: from config.json)")
+    caption.add_argument("--url", help="Ollama server URL (default: from config.json)")
+    caption.add_argument("--workers", type=int, help="simultaneous requests")
+    caption.add_argument("--no-cache", action="store_true", help="do not use the caption cache")
+    caption.set_defaults(func=cmd_caption)
+
+    convert = commands.add_parser("convert", help="convert all images to JPG")
+    convert.add_argument("folder")
+    convert.add_argument("--quality", type=int, help="JPG quality (default: from config.json)")
+    convert.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    convert.set_defaults(func=cmd_convert)
+
+    stats = commands.add_parser("stats", help="caption progress and most used tags")
+    stats.add_argument("folder")
+    stats.add_argument("--top", type=int, default=20, help="number of tags to list")
+    stats.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    stats.set_defaults(func=cmd_stats)
+
+    extract = commands.add_parser("extract-prompts", help="write the prompts stored in generated images to .txt")
+    extract.add_argument("folder")
+    extract.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    extract.add_argument("--force", action="store_true", help="also rewrite .txt files newer than their image")
+    extract.set_defaults(func=cmd_extract_prompts)
+
+    metadata = commands.add_parser("metadata", help="print the generation settings of each image as JSON lines")
+    metadata.add_argument("folder")
+    metadata.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    metadata.set_defaults(func=cmd_metadata)
+
+    export = commands.add_parser(
+        "export", help="export images and captions to WebDataset tar shards, Parquet or a JSONL manifest"
+    )
+    export.add_argument("folder")
+    export.add_argument("output", help="output folder (an interrupted export resumes there)")
+    export.add_argument("--format", choices=("webdataset", "parquet", "jsonl"), default="webdataset")
+    export.add_argument("--shard-size", type=int, default=512, help="maximum shard size in MB")
+    export.add_argument("--jpg", action="store_true", help="re-encode images to JPG instead of copying them")
+    export.add_argument("--quality", type=int, help="JPG quality (default: from config.json)")
+    export.add_argument("--captioned-only", action="store_true", help="skip images without a caption")
+    export.add_argument("--workers", type=int, help="parallel reads (default: twice the CPU count, at most 16)")
+    export.set_defaults(func=cmd_export)
+
+    duplicates = commands.add_parser("duplicates", help="find duplicate and near-duplicate images (needs NumPy)")
+    duplicates.add_argument("folder")
+    duplicates.add_argument("--threshold", type=int, help="maximum differing hash bits (default: from config.json)")
+    duplicates.add_argument("--hide", action="store_true", help="hide all images of each group but the largest")
+    duplicates.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    duplicates.set_defaults(func=cmd_duplicates)
+
+    normalize = commands.add_parser(
+        "normalize", help="apply the folder's tag_rules.json (aliases, implications, blacklist, order) to all captions"
+    )
+    normalize.add_argument("folder")
+    normalize.add_argument("--dry-run", action="store_true", help="only list the images that would change")
+    normalize.set_defaults(func=cmd_normalize)
+
+    rewrite = commands.add_parser(
+        "rewrite", help="rename, merge or delete tags in all captions and in tag_library.json"
+    )
+    rewrite.add_argument("folder")
+    rewrite.add_argument("pattern", help="tag, prefix or regular expression to find")
+    rewrite.add_argument("--mode", choices=("exact", "prefix", "regex"), default="exact")
+    rewrite.add_argument("--replace", help="new tag (merged if already present), prefix or re.sub replacement")
+    rewrite.add_argument("--delete", action="store_true", help="delete the matching tags")
+    rewrite.add_argument("--ignore-case", action="store_true")
+    rewrite.add_argument("--dry-run", action="store_true", help="only print the changes, per tag and per image")
+    rewrite.set_defaults(func=cmd_rewrite)
+
+    db = commands.add_parser(
+        "db", help="caption database (.captioninghelper/captions.db): sync with the .txt files, query by tag"
+    )
+    db.add_argument("action", choices=("sync", "query", "tags"),
+                    help="sync: import changed .txt files and write pending ones; "
+                         "query: images with TAG (run sync first); tags: most used tags")
+    db.add_argument("folder")
+    db.add_argument("tag", nargs="?", help="tag to look for (query)")
+    db.add_argument("--include-hidden", action="store_true", help="also list hidden images (query)")
+    db.add_argument("--top", type=int, default=20, help="number of tags to list (tags)")
+    db.set_defaults(func=cmd_db)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"Folder not found: {args.folder}", file=sys.stderr)
+        return 2
+    return args.func(args, load_config())
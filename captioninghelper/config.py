@@ -0,0 +1,81 @@
+"""
+Configuration de l'application (config.json) et dernier dossier ouvert
+"""
+import json
+import os
+
+from captioninghelper.paths import APP_DIR
+
+CONFIG_FILE = os.path.join(APP_DIR, "config.json")
+LAST_FOLDER_FILE = os.path.join(APP_DIR, "last_folder.json")
+
+DEFAULT_PROMPT = ("Describe this image as a training prompt, using short, "
+                  "precise terms separated by commas. You'll answer only "
+                  "with these descriptive terms.")
+DEFAULT_MODEL = "llava"
+DEFAULT_LANGUAGE = "English"
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+# Valeurs par défaut
+DEFAULT_CONFIG = {
+    "prompt": DEFAULT_PROMPT,
+    "model": DEFAULT_MODEL,
+    "ollama_url": DEFAULT_OLLAMA_URL,
+    "ollama_workers": 2,
+    "caption_cache_entries": 100000,
+    "jpg_quality": 75,
+    "jpg_subsampling": "4:2:0",
+    "flush_interval_ms": 2000,
+    "preview_cache_mb": 256,
+    "thumbnail_cache_mb": 512,
+    "prefetch_count": 3,
+    "export_shard_mb": 512,
+    "duplicate_threshold": 6,
+    "queue_mode": "off",
+    "record_timings": False,
+    "latency_overlay": False,
+    "caption_database": False,
+    "defer_sidecars": False
+}
+
+
+def load_config(path=None):
+    """
+    Lit la config et la complète avec les valeurs par défaut manquantes.
+    Sans `path`, CONFIG_FILE est lu au moment de l'appel (les benchmarks
+    le redirigent vers un dossier temporaire).
+    """
+    path = path or CONFIG_FILE
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    else:
+        config = {}
+
+    missing = DEFAULT_CONFIG.keys() - config.keys()
+    for key in missing:
+        config[key] = DEFAULT_CONFIG[key]
+
+    # Réécrit la config seulement si des valeurs par défaut y ont été ajoutées
+    if missing:
+        save_config(config, path)
+    return config
+
+
+def save_config(config, path=None):
+    with open(path or CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4)
+
+
+def load_last_folder(path=None):
+    path = path or LAST_FOLDER_FILE
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get("last_folder", "")
+    return ""
+
+
+def save_last_folder(folder_path, path=None):
+    with open(path or LAST_FOLDER_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"last_folder": folder_path}, f)
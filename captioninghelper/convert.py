@@ -0,0 +1,190 @@
+"""
+Conversion des images du dossier en JPG, en parallèle sur tous les cœurs
+"""
+import multiprocessing
+import os
+import shutil
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from captioninghelper.jobs import Job
+from captioninghelper.journal import OperationJournal
+
+SUPPORTED_FORMATS = ('.png', '.webp', '.jpeg', '.gif', '.bmp', '.tiff')
+
+
+def plan_conversions(folder_path):
+    """
+    Associe à chaque image à convertir un nom .jpg libre.
+    Un seul listage du dossier : les noms déjà pris et déjà attribués
+    sont suivis en mémoire.
+    """
+    files = os.listdir(folder_path)
+    taken = set(files)
+    plan = []
+    for file in files:
+        if not file.lower().endswith(SUPPORTED_FORMATS):
+            continue
+        base_name = os.path.splitext(file)[0]
+        jpg_name = base_name + '.jpg'
+        counter = 1
+        # S'assure de ne pas écraser un .jpg existant
+        while jpg_name in taken:
+            jpg_name = f"{base_name}_{counter}.jpg"
+            counter += 1
+        taken.add(jpg_name)
+        plan.append((file, jpg_name))
+    return plan
+
+
+def convert_file(source_path, target_path, quality=75, subsampling="4:2:0"):
+    """
+    Écrit la version JPG d'une image (exécuté dans un processus de
+    travail) ; l'original n'est pas touché
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as img:
+        img.convert('RGB').save(target_path, 'JPEG', quality=quality, subsampling=subsampling)
+
+
+def conversion_entries(folder_path, staging, source_name, target_name, shared=False):
+    """
+    Entrées du journal d'une conversion dont le JPG a été écrit dans
+    `staging` (corbeille de l'opération, relative au dossier) : l'original
+    part dans la corbeille, le JPG prend sa place et la légende .txt suit
+    l'image renommée. Si une autre image garde le même nom de base
+    (`shared`), la légende est copiée au lieu d'être déplacée.
+    """
+    entries = [
+        ("move", source_name, os.path.join(staging, source_name)),
+        ("move", os.path.join(staging, target_name), target_name),
+        ("rename", source_name, target_name),
+    ]
+    source_txt = os.path.splitext(source_name)[0] + ".txt"
+    target_txt = os.path.splitext(target_name)[0] + ".txt"
+    if source_txt == target_txt or not os.path.exists(os.path.join(folder_path, source_txt)) \
+            or os.path.exists(os.path.join(folder_path, target_txt)):
+        return entries
+    if shared:
+        shutil.copyfile(os.path.join(folder_path, source_txt), os.path.join(folder_path, staging, target_txt))
+        entries.append(("move", os.path.join(staging, target_txt), target_txt))
+    else:
+        entries.append(("move", source_txt, target_txt))
+    return entries
+
+
+class ConvertJob(Job):
+    """
+    Convertit toutes les images du dossier en JPG avec un pool de processus.
+    Chaque conversion réussie est transmise par on_result(ancien nom, nouveau nom).
+
+    La conversion est une opération du journal (annulable) : les JPG sont
+    écrits dans la corbeille de l'opération, puis, par paquets de
+    `commit_size` validés en un seul fsync, mis à leur place pendant que
+    les originaux passent dans la corbeille. Un arrêt brutal ne laisse
+    jamais une image à moitié convertie.
+    """
+
+    commit_size = 64
+
+    def __init__(self, folder_path, quality=75, subsampling="4:2:0", workers=None, journal=None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.quality = quality
+        self.subsampling = subsampling
+        self.workers = workers or os.cpu_count() or 1
+        self.journal = journal
+        self.converted = {}
+
+    def run(self):
+        journal = self.journal or OperationJournal(self.folder_path)
+        try:
+            self.convert_all(journal)
+        finally:
+            if self.journal is None:
+                journal.close()
+
+    def commit(self, journal, op_id, ready):
+        """
+        Valide puis applique un paquet de conversions terminées
+        """
+        journal.append(op_id, [entry for _, _, entries in ready for entry in entries])
+        for source_name, target_name, entries in ready:
+            try:
+                for entry in entries:
+                    journal.apply(entry)
+            except OSError as e:
+                self.errors[source_name] = str(e)
+                continue
+            self.converted[source_name] = target_name
+            self.emit_result(source_name, target_name)
+        ready.clear()
+
+    def convert_all(self, journal):
+        plan = plan_conversions(self.folder_path)
+        op_id = journal.begin("Convert to JPG")
+        staging = journal.trash_dir(op_id)
+        os.makedirs(os.path.join(self.folder_path, staging), exist_ok=True)
+        # Nombre d'images par nom de base, pour savoir si une légende est partagée
+        stems = Counter(
+            os.path.splitext(f)[0] for f in os.listdir(self.folder_path)
+            if not f.lower().endswith(".txt")
+        )
+        pending = iter(plan)
+        in_flight = {}
+        ready = []
+        done = 0
+        self.report(0, len(plan))
+
+        # "spawn" : pas de fork d'un processus qui fait tourner Qt et des threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            while True:
+                # Garde un nombre borné de conversions en cours pour que
+                # la pause et l'annulation prennent effet rapidement
+                while len(in_flight) < 2 * self.workers and self.checkpoint():
+                    item = next(pending, None)
+                    if item is None:
+                        break
+                    source_name, target_name = item
+                    future = executor.submit(
+                        convert_file,
+                        os.path.join(self.folder_path, source_name),
+                        os.path.join(self.folder_path, staging, target_name),
+                        self.quality,
+                        self.subsampling
+                    )
+                    in_flight[future] = item
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    source_name, target_name = in_flight.pop(future)
+                    done += 1
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Erreur lors de la conversion de {source_name}: {str(e)}")
+                        self.errors[source_name] = str(e)
+                    else:
+                        source_stem = os.path.splitext(source_name)[0]
+                        stems[source_stem] -= 1
+                        stems[os.path.splitext(target_name)[0]] += 1
+                        try:
+                            ready.append((source_name, target_name, conversion_entries(
+                                self.folder_path, staging, source_name, target_name,
+                                shared=stems[source_stem] > 0
+                            )))
+                        except OSError as e:
+                            self.errors[source_name] = str(e)
+                    self.report(done, len(plan), source_name)
+                if len(ready) >= self.commit_size or (ready and not in_flight):
+                    self.commit(journal, op_id, ready)
+        if ready:
+            self.commit(journal, op_id, ready)
+        journal.end(op_id)
+        if not journal.operations[op_id].entries:
+            # Rien n'a été validé : la corbeille ne contient que des JPG inutilisés
+            shutil.rmtree(os.path.join(self.folder_path, staging), ignore_errors=True)
@@ -0,0 +1,274 @@
+"""
+Base SQLite (mode WAL) d'un dossier : légendes, tags indexés, images
+cachées / signalées, bibliothèque de tags et métadonnées de génération,
+synchronisée avec les .txt à côté des images
+"""
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from captioninghelper.captions import caption_path, join_tags, split_tags, write_tags
+from captioninghelper.jobs import Job
+from captioninghelper.paths import dataset_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captions (
+    stem TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    txt_mtime INTEGER,
+    dirty INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tags (
+    stem TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (stem, tag)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS captions_dirty ON captions (dirty) WHERE dirty;
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    stem TEXT NOT NULL,
+    hidden INTEGER NOT NULL DEFAULT 0,
+    flagged INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS images_by_stem ON images (stem);
+CREATE TABLE IF NOT EXISTS library (tag TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, info TEXT NOT NULL) WITHOUT ROWID;
+"""
+
+# Nombre maximal de paramètres par requête « IN (...) »
+CHUNK = 500
+
+
+def read_sidecar(folder_path, stem):
+    """
+    Texte d'un .txt et sa date de modification ; (None, None) s'il n'existe pas
+    """
+    path = os.path.join(folder_path, stem + ".txt")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return text, os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+
+
+class CaptionDatabase:
+    """
+    .captioninghelper/captions.db. Une légende est gardée par nom de base,
+    sous le même texte que son .txt (tags séparés par des virgules), avec
+    la date de modification du .txt au moment de la dernière
+    synchronisation ; ses tags sont aussi rangés dans une table indexée
+    par tag.
+
+    Les .txt restent le format d'échange : sync_sidecars() importe ceux
+    qui ont changé, export_sidecars() écrit les légendes modifiées
+    seulement en base (`dirty`).
+    """
+
+    FILE_NAME = "captions.db"
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self.path = os.path.join(dataset_cache_dir(folder_path), self.FILE_NAME)
+        # Partagée entre threads : chaque accès passe par le verrou
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # --- Légendes ---
+
+    def get_many(self, stems):
+        """
+        {nom de base: tags} des légendes connues parmi `stems`
+        (une légende vide est connue : liste vide)
+        """
+        stems = list(stems)
+        found = {}
+        with self._lock:
+            for start in range(0, len(stems), CHUNK):
+                chunk = stems[start:start + CHUNK]
+                rows = self.conn.execute(
+                    f"SELECT stem, text FROM captions WHERE stem IN ({','.join('?' * len(chunk))})", chunk
+                )
+                for stem, text in rows:
+                    found[stem] = split_tags(text)
+        return found
+
+    def get(self, stem):
+        """
+        Tags d'une légende, ou None si la base ne la connaît pas
+        """
+        return self.get_many([stem]).get(stem)
+
+    def _put(self, stem, text, txt_mtime, dirty):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO captions (stem, text, txt_mtime, dirty) VALUES (?, ?, ?, ?)",
+            (stem, text, txt_mtime, int(dirty))
+        )
+        self.conn.execute("DELETE FROM tags WHERE stem = ?", (stem,))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO tags (stem, tag) VALUES (?, ?)",
+            ((stem, tag) for tag in split_tags(text))
+        )
+
+    def put_many(self, items):
+        """
+        Enregistre des légendes en une transaction : (nom de base, tags,
+        date du .txt ou None, dirty). Une légende vide sans .txt est oubliée.
+        """
+        with self._lock, self.conn:
+            for stem, tags, txt_mtime, dirty in items:
+                if not tags and txt_mtime is None and not dirty:
+                    self.conn.execute("DELETE FROM captions WHERE stem = ?", (stem,))
+                    self.conn.execute("DELETE FROM tags WHERE stem = ?", (stem,))
+                else:
+                    self._put(stem, join_tags(tags), txt_mtime, dirty)
+
+    def import_sidecars(self, stems, workers=8):
+        """
+        Relit les .txt de `stems` (en parallèle) et les enregistre en base ;
+        une légende modifiée en base mais pas encore écrite est gardée
+        """
+        stems = list(stems)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(lambda stem: (stem,) + read_sidecar(self.folder_path, stem), stems))
+        with self._lock, self.conn:
+            dirty = self._dirty_stems(stems)
+            for stem, text, txt_mtime in loaded:
+                if stem in dirty:
+                    continue
+                if text is None:
+                    self.conn.execute("DELETE FROM captions WHERE stem = ?", (stem,))
+                    self.conn.execute("DELETE FROM tags WHERE stem = ?", (stem,))
+                else:
+                    self._put(stem, join_tags(split_tags(text)), txt_mtime, False)
+        return len(loaded)
+
+    def _dirty_stems(self, stems):
+        dirty = set()
+        for start in range(0, len(stems), CHUNK):
+            chunk = stems[start:start + CHUNK]
+            dirty.update(row[0] for row in self.conn.execute(
+                f"SELECT stem FROM captions WHERE dirty AND stem IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return dirty
+
+    def sync_sidecars(self, txt_mtimes, workers=8):
+        """
+        Met la base à jour depuis le dossier : `txt_mtimes` donne, pour
+        chaque .txt non vide présent, sa date de modification (le
+        parcours du dossier la fournit déjà). Seuls les .txt dont la date
+        a changé sont ouverts. Retourne les noms de base mis à jour.
+        """
+        with self._lock:
+            known = dict(self.conn.execute("SELECT stem, txt_mtime FROM captions WHERE NOT dirty"))
+        changed = [stem for stem, mtime in txt_mtimes.items() if known.get(stem) != mtime]
+        removed = [stem for stem in known if stem not in txt_mtimes]
+        if changed or removed:
+            self.import_sidecars(changed + removed, workers)
+        return changed + removed
+
+    def export_sidecars(self):
+        """
+        Écrit dans les .txt les légendes modifiées seulement en base.
+        Retourne le nombre de fichiers écrits.
+        """
+        with self._lock:
+            pending = self.conn.execute("SELECT stem, text FROM captions WHERE dirty").fetchall()
+        if not pending:
+            return 0
+        written = []
+        for stem, text in pending:
+            tags = split_tags(text)
+            # write_tags attend un nom d'image : l'extension ajoutée est retirée
+            write_tags(self.folder_path, stem + ".txt", tags)
+            path = caption_path(self.folder_path, stem + ".txt")
+            written.append((stem, tags, os.stat(path).st_mtime_ns if tags else None, False))
+        self.put_many(written)
+        return len(written)
+
+    @property
+    def dirty_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM captions WHERE dirty").fetchone()[0]
+
+    # --- Requêtes ---
+
+    def stems_with_tag(self, tag):
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT stem FROM tags WHERE tag = ?", (tag,))]
+
+    def images_with_tag(self, tag, include_hidden=False):
+        """
+        Images (visibles, sauf `include_hidden`) dont la légende contient `tag`
+        """
+        query = "SELECT images.name FROM tags JOIN images ON images.stem = tags.stem WHERE tags.tag = ?"
+        if not include_hidden:
+            query += " AND NOT images.hidden"
+        with self._lock:
+            return [row[0] for row in self.conn.execute(query + " ORDER BY images.name", (tag,))]
+
+    def tag_counts(self, limit=None):
+        query = "SELECT tag, COUNT(*) AS n FROM tags GROUP BY tag ORDER BY n DESC, tag"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        with self._lock:
+            return self.conn.execute(query).fetchall()
+
+    # --- État du dossier ---
+
+    def save_state(self, images, hidden=(), flagged=(), library=()):
+        """
+        Remplace la liste des images (avec leurs états caché / signalé)
+        et la bibliothèque de tags
+        """
+        hidden, flagged = set(hidden), set(flagged)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM images")
+            self.conn.executemany(
+                "INSERT INTO images (name, stem, hidden, flagged) VALUES (?, ?, ?, ?)",
+                ((name, os.path.splitext(name)[0], name in hidden, name in flagged) for name in images)
+            )
+            self.conn.execute("DELETE FROM library")
+            self.conn.executemany("INSERT OR IGNORE INTO library (tag) VALUES (?)", ((tag,) for tag in library))
+
+    def save_metadata(self, cache):
+        """
+        Copie les métadonnées de génération d'un MetadataCache
+        """
+        rows = []
+        for name in cache.columns["name"]:
+            info = cache.get(name)
+            if info is not None:
+                rows.append((name, json.dumps(info._asdict(), ensure_ascii=False)))
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM metadata")
+            self.conn.executemany("INSERT INTO metadata (name, info) VALUES (?, ?)", rows)
+
+
+class SidecarSyncJob(Job):
+    """
+    Met la base à jour depuis les .txt du dossier (voir
+    CaptionDatabase.sync_sidecars) ; les noms de base relus sont dans `changed`
+    """
+
+    def __init__(self, database, txt_mtimes):
+        super().__init__()
+        self.database = database
+        self.txt_mtimes = dict(txt_mtimes)
+        self.changed = []
+
+    def run(self):
+        self.report(0, len(self.txt_mtimes))
+        self.changed = self.database.sync_sidecars(self.txt_mtimes)
+        self.report(len(self.txt_mtimes), len(self.txt_mtimes))
@@ -0,0 +1,683 @@
+"""
+Modèle compact des images d'un dossier
+"""
+import json
+import os
+import random
+import sys
+import threading
+from array import array
+
+from captioninghelper.paths import CACHE_DIR_NAME, dataset_cache_dir
+
+
+def split_name(name):
+    """
+    Équivalent rapide de os.path.splitext pour un nom de fichier
+    """
+    dot = name.rfind(".")
+    if dot <= 0:
+        return name, ""
+    return name[:dot], name[dot:]
+
+
+class Bitmap:
+    """
+    Ensemble d'entiers positifs stocké sur un bit par valeur
+    """
+
+    def __init__(self, data=b""):
+        self._bytes = bytearray(data)
+
+    def __getitem__(self, i):
+        byte = i >> 3
+        return byte < len(self._bytes) and bool(self._bytes[byte] >> (i & 7) & 1)
+
+    def set(self, i, value=True):
+        """
+        Positionne un bit. Retourne True s'il a changé.
+        """
+        byte = i >> 3
+        if byte >= len(self._bytes):
+            if not value:
+                return False
+            self._bytes.extend(bytes(byte + 1 - len(self._bytes)))
+        mask = 1 << (i & 7)
+        if bool(self._bytes[byte] & mask) == value:
+            return False
+        self._bytes[byte] ^= mask
+        return True
+
+    def __iter__(self):
+        for byte, bits in enumerate(self._bytes):
+            if bits:
+                for bit in range(8):
+                    if bits >> bit & 1:
+                        yield byte * 8 + bit
+
+    def to_bytes(self):
+        return bytes(self._bytes)
+
+
+class CountTree:
+    """
+    Arbre de Fenwick sur des valeurs 0 / 1 : modification d'une valeur,
+    nombre de 1 avant une case (rang) et case du k-ième 1 (sélection),
+    chacun en O(log n)
+    """
+
+    def __init__(self):
+        # Nœuds numérotés à partir de 1 : _tree[i] couvre ]i - lowbit(i), i]
+        self._tree = array('q', [0])
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    def extend(self, values):
+        """
+        Ajoute des cases en fin d'arbre, en O(taille ajoutée + log n)
+        """
+        tree = self._tree
+        old_size = len(tree) - 1
+        tree.extend(values)
+        size = len(tree) - 1
+        # Chaque nœud reporte sa somme sur son parent, une seule fois :
+        # les anciens nœuds dont le parent vient d'apparaître sont ceux
+        # de la décomposition de old_size
+        i = old_size
+        while i:
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+            i -= i & -i
+        for i in range(old_size + 1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+
+    def add(self, slot, delta):
+        tree = self._tree
+        size = len(tree) - 1
+        i = slot + 1
+        while i <= size:
+            tree[i] += delta
+            i += i & -i
+
+    def rank(self, slot):
+        """
+        Somme des cases avant `slot`
+        """
+        tree = self._tree
+        total = 0
+        i = slot
+        while i:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def select(self, k):
+        """
+        Case du (k + 1)-ième 1
+        """
+        tree = self._tree
+        size = len(tree) - 1
+        position = 0
+        remaining = k + 1
+        step = 1 << (size.bit_length() - 1) if size else 0
+        while step:
+            next_position = position + step
+            if next_position <= size and tree[next_position] < remaining:
+                position = next_position
+                remaining -= tree[next_position]
+            step >>= 1
+        return position
+
+
+class ImageList:
+    """
+    Vue en lecture (noms de fichiers) sur les images visibles d'un Dataset,
+    dans l'ordre de navigation
+    """
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __len__(self):
+        return self._dataset.visible_count
+
+    def __getitem__(self, i):
+        dataset = self._dataset
+        if isinstance(i, slice):
+            return [dataset.names[dataset.id_at(k)] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return dataset.names[dataset.id_at(i)]
+
+    def __iter__(self):
+        names = self._dataset.names
+        return (names[image_id] for image_id in self._dataset.visible_ids())
+
+    def __contains__(self, name):
+        return self._dataset.is_visible(name)
+
+    def index(self, name):
+        image_id = self._dataset.id_of(name)
+        position = self._dataset.position_of(image_id) if image_id is not None else None
+        if position is None:
+            raise ValueError(f"{name} is not in the dataset")
+        return position
+
+
+class WorkQueue:
+    """
+    File des images qui restent à traiter, avec un curseur de navigation.
+
+    Ordre : celui d'entrée dans la file (l'ordre de navigation à la
+    construction, puis les images qui redeviennent à traiter à la fin).
+    Les entrées sorties de la file sont marquées vides dans `_order` puis
+    sautées ; la file est compactée quand elles deviennent majoritaires.
+    Suivant / précédent coûtent donc O(1) amorti, le tirage aléatoire
+    O(1) (tableau `_pool` avec suppression par échange avec le dernier).
+
+    Les mises à jour peuvent venir d'un thread de travail (légendes
+    modifiées par un traitement par lot) : tout passe par un verrou.
+    """
+
+    EMPTY = -1
+
+    def __init__(self, image_ids=()):
+        self._lock = threading.Lock()
+        self._order = array('q', image_ids)
+        self._slots = {image_id: slot for slot, image_id in enumerate(self._order)}
+        self._pool = array('q', self._order)
+        self._pool_positions = dict(self._slots)
+        self._cursor = -1
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, image_id):
+        return image_id in self._slots
+
+    def add(self, image_id):
+        with self._lock:
+            if image_id in self._slots:
+                return
+            self._slots[image_id] = len(self._order)
+            self._order.append(image_id)
+            self._pool_positions[image_id] = len(self._pool)
+            self._pool.append(image_id)
+
+    def discard(self, image_id):
+        with self._lock:
+            slot = self._slots.pop(image_id, None)
+            if slot is None:
+                return
+            self._order[slot] = self.EMPTY
+            # Retrait du tirage : le dernier élément prend la place libérée
+            position = self._pool_positions.pop(image_id)
+            last = self._pool.pop()
+            if last != image_id:
+                self._pool[position] = last
+                self._pool_positions[last] = position
+            self._compact_if_sparse()
+
+    def _compact_if_sparse(self):
+        # Cases vides laissées par discard() et defer()
+        if len(self._order) > 1024 and len(self._slots) < len(self._order) // 2:
+            self._compact()
+
+    def _compact(self):
+        cursor_image = None
+        for slot in range(min(self._cursor, len(self._order) - 1), -1, -1):
+            if self._order[slot] != self.EMPTY:
+                cursor_image = self._order[slot]
+                break
+        self._order = array('q', (i for i in self._order if i != self.EMPTY))
+        self._slots = {image_id: slot for slot, image_id in enumerate(self._order)}
+        self._cursor = self._slots[cursor_image] if cursor_image is not None else -1
+
+    def visit(self, image_id):
+        """
+        Place le curseur sur une image (si elle est dans la file)
+        """
+        with self._lock:
+            slot = self._slots.get(image_id)
+            if slot is not None:
+                self._cursor = slot
+
+    def peek(self, step=1):
+        """
+        Image à `step` crans du curseur (négatif : en arrière), en
+        bouclant sur la file ; None si la file est vide
+        """
+        with self._lock:
+            if not self._slots:
+                return None
+            order, slot = self._order, self._cursor
+            direction = 1 if step > 0 else -1
+            remaining = abs(step)
+            for _ in range(len(order) * remaining):
+                slot = (slot + direction) % len(order)
+                if order[slot] != self.EMPTY:
+                    remaining -= 1
+                    if not remaining:
+                        return order[slot]
+            return None
+
+    def peek_many(self, count):
+        """
+        Les `count` images qui suivent le curseur et les `count` qui le
+        précèdent, en un seul parcours dans chaque sens (sans faire plus
+        d'un tour de la file) : ([suivantes], [précédentes])
+        """
+        with self._lock:
+            order, cursor = self._order, self._cursor
+            neighbours = []
+            for direction in (1, -1):
+                found = []
+                slot = cursor
+                for _ in range(len(order)):
+                    if len(found) >= min(count, len(self._slots)):
+                        break
+                    slot = (slot + direction) % len(order)
+                    if order[slot] != self.EMPTY:
+                        found.append(order[slot])
+                neighbours.append(found)
+            return neighbours[0], neighbours[1]
+
+    def defer(self, image_id):
+        """
+        Remet une image en fin de file (« passer pour l'instant »)
+        """
+        with self._lock:
+            slot = self._slots.get(image_id)
+            if slot is None:
+                return
+            self._order[slot] = self.EMPTY
+            self._slots[image_id] = len(self._order)
+            self._order.append(image_id)
+            self._compact_if_sparse()
+
+    def random(self, exclude=None):
+        with self._lock:
+            pool = self._pool
+            if not pool or (len(pool) == 1 and pool[0] == exclude):
+                return None
+            while True:
+                image_id = pool[random.randrange(len(pool))]
+                if image_id != exclude:
+                    return image_id
+
+
+class Dataset:
+    """
+    Images d'un dossier sous forme compacte : chaque nom reçoit un
+    identifiant entier stable (jamais réutilisé, même si l'image disparaît
+    puis revient), les noms sont internés, les états « présente »,
+    « cachée » et « légendée » sont des bitmaps.
+
+    L'ordre de navigation est un tableau `order` des identifiants des
+    images présentes, cachées comprises (une image qui disparaît du
+    dossier y laisse une case vide). Un CountTree marque les cases
+    visibles : cacher ou montrer une image ne change qu'un compteur, en
+    O(log n), et une image montrée retrouve sa place. Le rang d'une
+    image parmi les visibles (position_of) et l'image d'un rang (id_at)
+    s'en déduisent en O(log n).
+
+    Une image est légendée si un .txt non vide porte son nom de base.
+    Le Dataset sert aussi d'index des légendes pour le CaptionStore
+    (is_captioned, mark, captioned_count), que les traitements par lot
+    modifient depuis leur thread : les changements d'état passent par
+    un verrou.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.names = []
+        self._ids = {}
+        self._extensions = set()
+        self._orphan_captions = set()
+        self.present = Bitmap()
+        self.hidden = Bitmap()
+        self.captioned = Bitmap()
+        self.flagged = Bitmap()
+        self.order = array('q')
+        self._slots = {}
+        self._visible_slots = CountTree()
+        self.visible_count = 0
+        self._empty_slots = 0
+        self.images = ImageList(self)
+        self.present_count = 0
+        self.captioned_count = 0
+        self.queue = None
+        self.queue_uncaptioned = self.queue_flagged = False
+
+    # --- Identifiants ---
+
+    def id_of(self, name):
+        return self._ids.get(name)
+
+    def _intern(self, name):
+        image_id = self._ids.get(name)
+        if image_id is None:
+            name = sys.intern(name)
+            image_id = len(self.names)
+            self.names.append(name)
+            self._ids[name] = image_id
+            stem, extension = split_name(name)
+            self._extensions.add(extension)
+            # Hérite de l'état de légende des images de même nom de base
+            if stem in self._orphan_captions:
+                self.captioned.set(image_id)
+            elif len(self._extensions) > 1 and any(
+                self.captioned[other] for other in self.ids_for_stem(stem) if other != image_id
+            ):
+                self.captioned.set(image_id)
+        return image_id
+
+    def ids_for_stem(self, stem):
+        for extension in self._extensions:
+            image_id = self._ids.get(stem + extension)
+            if image_id is not None:
+                yield image_id
+
+    # --- File de travail ---
+
+    def set_queue(self, uncaptioned=True, flagged=False):
+        """
+        Active la file des images visibles non légendées et / ou signalées,
+        dans l'ordre de navigation, ou la désactive (les deux à False).
+        Elle est ensuite tenue à jour à chaque changement d'état.
+        """
+        with self._lock:
+            self.queue_uncaptioned, self.queue_flagged = uncaptioned, flagged
+            if not (uncaptioned or flagged):
+                self.queue = None
+                return
+            self.queue = WorkQueue(i for i in self.visible_ids() if self._needs_work(i))
+
+    def _needs_work(self, image_id):
+        return (self.queue_uncaptioned and not self.captioned[image_id]) or \
+            (self.queue_flagged and self.flagged[image_id])
+
+    def _requeue(self, image_id):
+        """
+        Fait entrer ou sortir une image de la file après un changement d'état
+        """
+        if self.queue is None:
+            return
+        if self.present[image_id] and not self.hidden[image_id] and self._needs_work(image_id):
+            self.queue.add(image_id)
+        else:
+            self.queue.discard(image_id)
+
+    # --- Images signalées ---
+
+    def flag(self, name, flagged=True):
+        with self._lock:
+            image_id = self._intern(name)
+            if not self.flagged.set(image_id, flagged):
+                return False
+            self._requeue(image_id)
+            return True
+
+    def is_flagged(self, name):
+        image_id = self._ids.get(name)
+        return image_id is not None and self.flagged[image_id]
+
+    def flagged_names(self):
+        return [self.names[image_id] for image_id in self.flagged]
+
+    # --- Présence et ordre de navigation ---
+
+    EMPTY = -1
+
+    def add_images(self, names):
+        """
+        Déclare des images présentes dans le dossier ; les nouvelles
+        images sont ajoutées à la fin de l'ordre de navigation
+        """
+        with self._lock:
+            intern, present, hidden, captioned = self._intern, self.present, self.hidden, self.captioned
+            order, slots = self.order, self._slots
+            visible = []
+            for name in names:
+                image_id = intern(name)
+                if not present.set(image_id):
+                    continue
+                self.present_count += 1
+                if captioned[image_id]:
+                    self.captioned_count += 1
+                slots[image_id] = len(order)
+                order.append(image_id)
+                visible.append(0 if hidden[image_id] else 1)
+                if not hidden[image_id]:
+                    self._requeue(image_id)
+            self._visible_slots.extend(visible)
+            self.visible_count += sum(visible)
+
+    def remove_images(self, names):
+        with self._lock:
+            for name in names:
+                image_id = self._ids.get(name)
+                if image_id is None or not self.present.set(image_id, False):
+                    continue
+                self.present_count -= 1
+                if self.captioned[image_id]:
+                    self.captioned_count -= 1
+                slot = self._slots.pop(image_id)
+                self.order[slot] = self.EMPTY
+                self._empty_slots += 1
+                if not self.hidden[image_id]:
+                    self._visible_slots.add(slot, -1)
+                    self.visible_count -= 1
+                self._requeue(image_id)
+            if self._empty_slots > 1024 and self._empty_slots > len(self.order) // 2:
+                self._compact()
+
+    def _compact(self):
+        """
+        Retire les cases vides de l'ordre de navigation
+        """
+        self.order = array('q', (i for i in self.order if i != self.EMPTY))
+        self._slots = {image_id: slot for slot, image_id in enumerate(self.order)}
+        self._visible_slots = CountTree()
+        self._visible_slots.extend(0 if self.hidden[i] else 1 for i in self.order)
+        self._empty_slots = 0
+
+    def id_at(self, position):
+        """
+        Identifiant de l'image visible de rang `position`
+        """
+        if not 0 <= position < self.visible_count:
+            raise IndexError(position)
+        return self.order[self._visible_slots.select(position)]
+
+    def position_of(self, image_id):
+        """
+        Rang d'une image parmi les visibles, ou None si elle n'est pas visible
+        """
+        slot = self._slots.get(image_id)
+        if slot is None or self.hidden[image_id]:
+            return None
+        return self._visible_slots.rank(slot)
+
+    def visible_ids(self):
+        """
+        Identifiants des images visibles, dans l'ordre de navigation
+        """
+        hidden = self.hidden
+        for image_id in self.order:
+            if image_id != self.EMPTY and not hidden[image_id]:
+                yield image_id
+
+    def _set_visible(self, image_id, visible):
+        slot = self._slots.get(image_id)
+        if slot is not None:
+            self._visible_slots.add(slot, 1 if visible else -1)
+            self.visible_count += 1 if visible else -1
+
+    def is_visible(self, name):
+        image_id = self._ids.get(name)
+        return image_id is not None and self.present[image_id] and not self.hidden[image_id]
+
+    # --- Images cachées ---
+
+    def hide(self, name):
+        with self._lock:
+            image_id = self._intern(name)
+            if not self.hidden.set(image_id):
+                return False
+            self._set_visible(image_id, False)
+            self._requeue(image_id)
+            return True
+
+    def hide_many(self, names):
+        """
+        Cache plusieurs images. Retourne les noms qui n'étaient pas encore cachés.
+        """
+        with self._lock:
+            return [name for name in names if self.hide(name)]
+
+    def unhide(self, name):
+        """
+        Montre une image cachée, à sa place dans l'ordre de navigation
+        """
+        with self._lock:
+            image_id = self._intern(name)
+            if not self.hidden.set(image_id, False):
+                return False
+            self._set_visible(image_id, True)
+            self._requeue(image_id)
+            return True
+
+    def is_hidden(self, name):
+        image_id = self._ids.get(name)
+        return image_id is not None and self.hidden[image_id]
+
+    def hidden_names(self):
+        return [self.names[image_id] for image_id in self.hidden]
+
+    # --- Légendes (interface d'index du CaptionStore) ---
+
+    def _set_captioned(self, image_id, value):
+        if self.captioned.set(image_id, value) and self.present[image_id]:
+            self.captioned_count += 1 if value else -1
+            self._requeue(image_id)
+
+    def add_captions(self, stems):
+        """
+        Déclare des .txt non vides (par nom de base)
+        """
+        with self._lock:
+            for stem in stems:
+                ids = list(self.ids_for_stem(stem))
+                if not ids:
+                    self._orphan_captions.add(stem)
+                for image_id in ids:
+                    self._set_captioned(image_id, True)
+
+    def remove_captions(self, stems):
+        with self._lock:
+            for stem in stems:
+                self._orphan_captions.discard(stem)
+                for image_id in self.ids_for_stem(stem):
+                    self._set_captioned(image_id, False)
+
+    def mark(self, image_file, captioned):
+        with self._lock:
+            stem = split_name(image_file)[0]
+            self._intern(image_file)
+            if captioned:
+                self.add_captions([stem])
+            else:
+                self.remove_captions([stem])
+
+    def is_captioned(self, image_file):
+        image_id = self._ids.get(image_file)
+        if image_id is None:
+            return split_name(image_file)[0] in self._orphan_captions
+        return self.captioned[image_id]
+
+
+class HiddenImagesLog:
+    """
+    Persistance incrémentale des images cachées : hidden_images.json
+    (format inchangé) sert de base, chaque masquage ajoute une ligne au
+    journal .captioninghelper/hidden_images.log. Le journal est replié
+    dans le JSON quand il grossit et à la fermeture.
+    """
+
+    compact_threshold = 10000
+
+    def __init__(self, folder_path):
+        self.json_path = os.path.join(folder_path, "hidden_images.json")
+        self.log_path = os.path.join(dataset_cache_dir(folder_path), "hidden_images.log")
+        self.pending = 0
+
+    def load(self):
+        hidden = set()
+        if os.path.exists(self.json_path):
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                hidden = set(json.load(f))
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    name = line[1:].rstrip("\n")
+                    if line.startswith("+"):
+                        hidden.add(name)
+                    elif line.startswith("-"):
+                        hidden.discard(name)
+                    self.pending += 1
+        return hidden
+
+    def append(self, name, hidden=True):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(("+" if hidden else "-") + name + "\n")
+        self.pending += 1
+
+    def extend(self, names, hidden=True):
+        prefix = "+" if hidden else "-"
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.writelines(prefix + name + "\n" for name in names)
+        self.pending += len(names)
+
+    @property
+    def needs_compaction(self):
+        return self.pending >= self.compact_threshold
+
+    def compact(self, hidden_names):
+        """
+        Réécrit hidden_images.json avec l'état complet et vide le journal
+        """
+        tmp_path = self.json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(hidden_names), f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.json_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.pending = 0
+
+
+FLAGGED_FILE = "flagged_images.json"
+
+
+def load_flagged(folder_path):
+    """
+    Noms des images signalées (à revoir) du dossier
+    """
+    path = os.path.join(folder_path, CACHE_DIR_NAME, FLAGGED_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def save_flagged(folder_path, names):
+    path = os.path.join(dataset_cache_dir(folder_path), FLAGGED_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sorted(names), f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
@@ -0,0 +1,315 @@
+"""
+Détection des images en double ou presque : hachage perceptuel (pHash)
+vectorisé avec NumPy, gardé en cache dans le dossier, et recherche des
+voisins proches par index multiple (multi-index hashing)
+"""
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from captioninghelper.jobs import Job
+from captioninghelper.paths import dataset_cache_dir
+
+# Côté de l'image réduite et du bloc de basses fréquences gardé (8 x 8 = 64 bits)
+SAMPLE_SIZE = 32
+HASH_SIZE = 8
+
+
+def numpy_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def dct_matrix(n):
+    """
+    Matrice de la DCT-II orthonormée de taille n
+    """
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash_batch(pixels):
+    """
+    pHash de N images réduites (tableau N x 32 x 32) : DCT 2D de tout le
+    paquet en deux produits matriciels, puis un bit par coefficient basse
+    fréquence supérieur à la médiane. Retourne une liste d'entiers de 64 bits.
+    """
+    import numpy as np
+
+    dct = dct_matrix(SAMPLE_SIZE)
+    coefficients = dct @ pixels.astype(np.float64) @ dct.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(pixels), -1)
+    # La composante continue (luminosité moyenne) ne compte pas dans la médiane
+    medians = np.median(low[:, 1:], axis=1)
+    bits = np.packbits(low > medians[:, None], axis=1)
+    return [int(value) for value in bits.view(">u8").ravel()]
+
+
+def hash_images(folder_path, items):
+    """
+    Calcule le pHash d'un paquet d'images (exécuté dans un processus de
+    travail). `items` : liste de (nom, mtime, taille) ; retourne une liste
+    de (nom, mtime, taille, hash, erreur).
+    """
+    import numpy as np
+    from PIL import Image
+
+    results = []
+    samples = []
+    for name, mtime, size in items:
+        try:
+            with Image.open(os.path.join(folder_path, name)) as img:
+                # Décodage JPEG à taille réduite : bien plus rapide qu'un décodage complet
+                img.draft("L", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+                sample = img.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR)
+                samples.append(np.asarray(sample, dtype=np.uint8))
+            results.append([name, mtime, size, None, None])
+        except Exception as e:
+            results.append([name, mtime, size, None, str(e)])
+    if samples:
+        hashes = iter(phash_batch(np.stack(samples)))
+        for result in results:
+            if result[4] is None:
+                result[3] = next(hashes)
+    return [tuple(result) for result in results]
+
+
+if hasattr(int, "bit_count"):
+    def hamming(a, b):
+        return (a ^ b).bit_count()
+else:
+    def hamming(a, b):
+        return bin(a ^ b).count("1")
+
+
+class MultiIndex:
+    """
+    Index multiple (multi-index hashing) des hash de 64 bits pour la
+    recherche des voisins à au plus `radius` bits : chaque hash est coupé
+    en `blocks` morceaux, chacun rangé dans sa propre table. Deux hash à
+    distance <= radius ont forcément un morceau à distance <= radius // blocks
+    (principe des tiroirs) : seuls les hash des cases voisines de chaque
+    morceau sont comparés, au lieu de tous.
+    """
+
+    def __init__(self, radius, blocks=4):
+        self.radius = radius
+        self.blocks = blocks
+        self.block_bits = 64 // blocks
+        self.block_mask = (1 << self.block_bits) - 1
+        self.tables = [{} for _ in range(blocks)]
+        # Masques des variantes d'un morceau à distance <= radius // blocks
+        self.flips = [0]
+        for _ in range(radius // blocks):
+            self.flips = sorted(set(self.flips) | {
+                flip | (1 << bit) for flip in self.flips for bit in range(self.block_bits)
+            })
+
+    def _keys(self, value):
+        for block in range(self.blocks):
+            yield block, (value >> (block * self.block_bits)) & self.block_mask
+
+    def add(self, value):
+        for block, key in self._keys(value):
+            self.tables[block].setdefault(key, []).append(value)
+
+    def search(self, value):
+        """
+        Hash indexés à au plus `radius` bits de `value` (lui compris s'il
+        est indexé ; un hash proche sur plusieurs morceaux peut revenir
+        plusieurs fois)
+        """
+        radius = self.radius
+        for block, key in self._keys(value):
+            table = self.tables[block]
+            for flip in self.flips:
+                for other in table.get(key ^ flip, ()):
+                    if hamming(value, other) <= radius:
+                        yield other
+
+
+def find_clusters(hashes, threshold=6):
+    """
+    Regroupe les images dont les pHash sont à au plus `threshold` bits les
+    uns des autres (de proche en proche). `hashes` : {nom: hash}. Retourne
+    les groupes d'au moins deux images, les plus grands d'abord.
+    """
+    by_hash = {}
+    for name, value in hashes.items():
+        by_hash.setdefault(value, []).append(name)
+
+    # Union-find sur les valeurs de hash distinctes
+    parent = {value: value for value in by_hash}
+
+    def find(value):
+        while parent[value] != value:
+            parent[value] = parent[parent[value]]
+            value = parent[value]
+        return value
+
+    if threshold > 0:
+        # Chaque hash est cherché parmi ceux déjà indexés, puis indexé :
+        # chaque paire proche n'est examinée que dans un sens
+        index = MultiIndex(threshold)
+        for value in by_hash:
+            for neighbour in index.search(value):
+                root, other = find(value), find(neighbour)
+                if root != other:
+                    parent[other] = root
+            index.add(value)
+
+    groups = {}
+    for value, names in by_hash.items():
+        groups.setdefault(find(value), []).extend(names)
+    clusters = [sorted(names) for names in groups.values() if len(names) > 1]
+    clusters.sort(key=lambda names: (-len(names), names[0]))
+    return clusters
+
+
+class HashCache:
+    """
+    pHash des images d'un dossier, dans .captioninghelper/phash.json rangé
+    par colonnes ("name", "mtime", "size", "hash") : une image qui n'a pas
+    changé n'est jamais rouverte
+    """
+
+    FILE_NAME = "phash.json"
+    VERSION = 1
+    COLUMNS = ("name", "mtime", "size", "hash")
+
+    def __init__(self, folder_path):
+        self.path = os.path.join(dataset_cache_dir(folder_path), self.FILE_NAME)
+        self.rows = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.VERSION or set(data.get("columns", ())) != set(self.COLUMNS):
+            return
+        columns = data["columns"]
+        self.rows = {
+            name: (mtime, size, value)
+            for name, mtime, size, value in zip(columns["name"], columns["mtime"], columns["size"], columns["hash"])
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_fresh(self, name, mtime_ns, size):
+        row = self.rows.get(name)
+        return row is not None and row[0] == mtime_ns and row[1] == size
+
+    def get(self, name):
+        row = self.rows.get(name)
+        return row[2] if row is not None else None
+
+    def size(self, name):
+        row = self.rows.get(name)
+        return row[1] if row is not None else 0
+
+    def put(self, name, mtime_ns, size, value):
+        self.rows[name] = (mtime_ns, size, value)
+        self.dirty = True
+
+    def prune(self, names):
+        """
+        Oublie les images qui ne sont plus dans `names`
+        """
+        stale = [name for name in self.rows if name not in names]
+        for name in stale:
+            del self.rows[name]
+        if stale:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        names = list(self.rows)
+        columns = {"name": names}
+        for i, column in enumerate(self.COLUMNS[1:]):
+            columns[column] = [self.rows[name][i] for name in names]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "columns": columns}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class DuplicateScanJob(Job):
+    """
+    Calcule (par paquets, sur un pool de processus) les pHash des images
+    qui ne sont pas à jour dans le HashCache, puis regroupe dans `clusters`
+    les images à au plus `threshold` bits les unes des autres.
+    """
+
+    chunk_size = 64
+
+    def __init__(self, folder_path, image_files, threshold=6, workers=None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.image_files = list(image_files)
+        self.threshold = threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = None
+        self.clusters = []
+
+    def run(self):
+        self.cache = cache = HashCache(self.folder_path)
+        to_hash = []
+        for name in self.image_files:
+            try:
+                stat = os.stat(os.path.join(self.folder_path, name))
+            except OSError as e:
+                self.errors[name] = str(e)
+                continue
+            if not cache.is_fresh(name, stat.st_mtime_ns, stat.st_size):
+                to_hash.append((name, stat.st_mtime_ns, stat.st_size))
+        cache.prune(set(self.image_files))
+
+        total = len(to_hash)
+        chunks = (to_hash[i:i + self.chunk_size] for i in range(0, total, self.chunk_size))
+        in_flight = set()
+        done = 0
+        self.report(0, total)
+
+        # "spawn" : pas de fork d'un processus qui fait tourner Qt et des threads
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+                while True:
+                    while len(in_flight) < 2 * self.workers and self.checkpoint():
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        in_flight.add(executor.submit(hash_images, self.folder_path, chunk))
+                    if not in_flight:
+                        break
+
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        for name, mtime, size, value, error in future.result():
+                            done += 1
+                            if error is not None:
+                                self.errors[name] = error
+                                continue
+                            cache.put(name, mtime, size, value)
+                        self.report(done, total, name)
+        finally:
+            cache.save()
+
+        if not self.cancelled:
+            hashes = {name: cache.get(name) for name in self.image_files if cache.get(name) is not None}
+            self.clusters = find_clusters(hashes, self.threshold)
@@ -0,0 +1,334 @@
+"""
+Export du jeu de données vers les formats d'entraînement : archives tar
+WebDataset ou fichiers Parquet découpés en morceaux (shards) de taille
+bornée, ou manifeste JSONL qui référence les images sans les copier
+"""
+import io
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from captioninghelper.captions import caption_path
+from captioninghelper.jobs import Job
+
+EXPORT_FORMATS = ("webdataset", "parquet", "jsonl")
+
+# État de l'export, dans le dossier de sortie, pour reprendre un export interrompu
+STATE_FILE = "export_state.json"
+STATE_VERSION = 1
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def read_caption(folder_path, image_file):
+    """
+    Texte brut du .txt d'une image ("" si absent)
+    """
+    try:
+        with open(caption_path(folder_path, image_file), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def load_sample(folder_path, image_file, with_image=True, reencode=None, quality=90):
+    """
+    Retourne (extension, octets de l'image, légende). Les octets sont
+    copiés tels quels, sauf si `reencode` ("jpg") est demandé.
+    """
+    caption = read_caption(folder_path, image_file)
+    extension = os.path.splitext(image_file)[1][1:].lower()
+    if not with_image:
+        return extension, None, caption
+    image_path = os.path.join(folder_path, image_file)
+    if reencode == "jpg":
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        with Image.open(image_path) as img:
+            img.convert("RGB").save(buffer, "JPEG", quality=quality)
+        return "jpg", buffer.getvalue(), caption
+    with open(image_path, "rb") as f:
+        return extension, f.read(), caption
+
+
+class TarShardWriter:
+    """
+    Archive WebDataset : pour chaque échantillon, CLÉ.jpg (ou .png),
+    CLÉ.txt (légende) et CLÉ.json (nom d'origine)
+    """
+
+    def __init__(self, path):
+        self.tar = tarfile.open(path, "w", format=tarfile.USTAR_FORMAT)
+        self.mtime = time.time()
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def add(self, key, image_file, extension, data, caption):
+        self._add(f"{key}.{extension}", data)
+        self._add(f"{key}.txt", caption.encode("utf-8"))
+        self._add(f"{key}.json", json.dumps({"file_name": image_file}, ensure_ascii=False).encode("utf-8"))
+
+    def close(self):
+        self.tar.close()
+
+
+class ParquetShardWriter:
+    """
+    Fichier Parquet (colonnes key, file_name, image, caption), écrit par
+    groupes de lignes pour garder la mémoire bornée. Nécessite pyarrow.
+    """
+
+    row_group_size = 256
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("key", pa.string()),
+            ("file_name", pa.string()),
+            ("image", pa.binary()),
+            ("caption", pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def add(self, key, image_file, extension, data, caption):
+        self.rows.append((key, image_file, data, caption))
+        if len(self.rows) >= self.row_group_size:
+            self._write_rows()
+
+    def _write_rows(self):
+        columns = list(zip(*self.rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+        self.rows = []
+
+    def close(self):
+        if self.rows:
+            self._write_rows()
+        self.writer.close()
+
+
+class JsonlShardWriter:
+    """
+    Manifeste JSONL : une ligne {"file_name", "text"} par image, le chemin
+    étant relatif au dossier de sortie
+    """
+
+    def __init__(self, path, folder_path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.prefix = os.path.relpath(folder_path, os.path.dirname(path))
+
+    def add(self, key, image_file, extension, data, caption):
+        file_name = os.path.join(self.prefix, image_file).replace(os.sep, "/")
+        self.file.write(json.dumps({"file_name": file_name, "text": caption}, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ExportJob(Job):
+    """
+    Exporte `image_files` (images cachées déjà exclues par l'appelant) de
+    `folder_path` vers `output_dir`, dans l'ordre des noms.
+
+    Les images et légendes sont lues en parallèle (threads, ou processus
+    si elles sont réencodées) avec un nombre borné de lectures d'avance,
+    puis écrites dans l'ordre dans des morceaux d'au plus `shard_size`
+    octets. Chaque morceau est écrit sous un nom temporaire puis renommé,
+    et l'état de l'export est enregistré après chacun : relancé avec les
+    mêmes paramètres, l'export reprend après le dernier morceau terminé.
+    """
+
+    def __init__(self, folder_path, image_files, output_dir, format="webdataset",
+                 shard_size=512 * 1024 * 1024, reencode=None, quality=90,
+                 captioned_only=False, workers=None, prefix="shard"):
+        super().__init__()
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        if reencode not in (None, "jpg"):
+            raise ValueError(f"Unknown image format: {reencode}")
+        self.folder_path = folder_path
+        self.image_files = sorted(image_files)
+        self.output_dir = output_dir
+        self.format = format
+        self.shard_size = shard_size
+        self.reencode = reencode if format != "jsonl" else None
+        self.quality = quality
+        self.captioned_only = captioned_only
+        self.workers = workers or min(16, (os.cpu_count() or 1) * 2)
+        self.prefix = prefix
+        self.state_path = os.path.join(output_dir, STATE_FILE)
+        self.exported = 0
+        self.skipped = 0
+        self.shards = []
+
+    def settings(self):
+        return {
+            "format": self.format,
+            "shard_size": self.shard_size,
+            "reencode": self.reencode,
+            "quality": self.quality,
+            "captioned_only": self.captioned_only,
+            "prefix": self.prefix,
+        }
+
+    def load_state(self):
+        """
+        État d'un export précédent avec les mêmes paramètres, sinon None
+        """
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("version") != STATE_VERSION or state.get("settings") != self.settings():
+            return None
+        return state
+
+    def save_state(self, last_image, complete=False):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": STATE_VERSION,
+                "settings": self.settings(),
+                "shards": self.shards,
+                "samples": self.exported,
+                "last_image": last_image,
+                "complete": complete,
+            }, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def open_shard(self, path):
+        if self.format == "webdataset":
+            return TarShardWriter(path)
+        if self.format == "parquet":
+            return ParquetShardWriter(path)
+        return JsonlShardWriter(path, self.folder_path)
+
+    def shard_name(self, number):
+        extension = {"webdataset": "tar", "parquet": "parquet", "jsonl": "jsonl"}[self.format]
+        return f"{self.prefix}-{number:06d}.{extension}"
+
+    def make_executor(self):
+        if self.reencode:
+            # "spawn" : pas de fork d'un processus qui fait tourner Qt et des threads
+            context = multiprocessing.get_context("spawn")
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = self.image_files
+        state = self.load_state()
+        if state is not None:
+            # Reprise : les images triées après la dernière exportée
+            self.shards = state["shards"]
+            self.exported = state["samples"]
+            if state["last_image"] is not None:
+                pending = [f for f in pending if f > state["last_image"]]
+        if self.captioned_only:
+            before = len(pending)
+            pending = [f for f in pending if os.path.exists(caption_path(self.folder_path, f))]
+            self.skipped = before - len(pending)
+
+        total = len(pending)
+        self.report(0, total)
+        if not pending:
+            self.save_state(state["last_image"] if state else None, complete=True)
+            return
+
+        with_image = self.format != "jsonl"
+        items = iter(pending)
+        in_flight = deque()
+        writer = None
+        shard_path = shard_bytes = shard_samples = shard_last = None
+        last_image = state["last_image"] if state else None
+        done = 0
+
+        def finish_shard():
+            nonlocal writer, last_image
+            writer.close()
+            os.replace(shard_path + ".tmp", shard_path)
+            self.shards.append({
+                "file": os.path.basename(shard_path),
+                "samples": shard_samples,
+                "bytes": os.path.getsize(shard_path),
+            })
+            last_image = shard_last
+            self.save_state(last_image)
+            writer = None
+
+        with self.make_executor() as executor:
+            try:
+                while True:
+                    # Lectures d'avance bornées : mémoire constante, pause et annulation rapides
+                    while len(in_flight) < 2 * self.workers and self.checkpoint():
+                        image_file = next(items, None)
+                        if image_file is None:
+                            break
+                        in_flight.append((image_file, executor.submit(
+                            load_sample, self.folder_path, image_file,
+                            with_image, self.reencode, self.quality
+                        )))
+                    if not in_flight or self.cancelled:
+                        break
+
+                    # Écriture dans l'ordre des noms (reprise déterministe)
+                    image_file, future = in_flight.popleft()
+                    done += 1
+                    try:
+                        extension, data, caption = future.result()
+                    except Exception as e:
+                        self.errors[image_file] = str(e)
+                        self.report(done, total, image_file)
+                        continue
+
+                    size = (len(data) if data is not None else 0) + len(caption) + 1024
+                    if writer is not None and shard_bytes + size > self.shard_size:
+                        finish_shard()
+                    if writer is None:
+                        shard_path = os.path.join(self.output_dir, self.shard_name(len(self.shards)))
+                        writer = self.open_shard(shard_path + ".tmp")
+                        shard_bytes = shard_samples = 0
+                    writer.add(f"{self.exported:09d}", image_file, extension, data, caption)
+                    shard_bytes += size
+                    shard_samples += 1
+                    shard_last = image_file
+                    self.exported += 1
+                    self.emit_result(image_file, os.path.basename(shard_path))
+                    self.report(done, total, image_file)
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
+
+        if writer is not None:
+            if self.cancelled:
+                # Morceau incomplet : abandonné, l'export reprendra à son début
+                writer.close()
+                os.remove(shard_path + ".tmp")
+                self.exported -= shard_samples
+            else:
+                finish_shard()
+        if not self.cancelled:
+            self.save_state(last_image, complete=True)
@@ -0,0 +1,58 @@
+"""
+Tâches de fond annulables (traitements par lot)
+"""
+import threading
+
+
+class Job:
+    """
+    Tâche de fond : pause / reprise / annulation, suivi de progression
+    et erreurs par élément. Les sous-classes implémentent run().
+
+    on_progress(done, total, item) et on_result(item, value) sont appelés
+    depuis les threads de travail.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.errors = {}
+        self.on_progress = None
+        self.on_result = None
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """
+        Bloque tant que la tâche est en pause. Retourne False si elle est annulée.
+        """
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    def report(self, done, total, item=None):
+        if self.on_progress:
+            self.on_progress(done, total, item)
+
+    def emit_result(self, item, value):
+        if self.on_result:
+            self.on_result(item, value)
+
+    def run(self):
+        raise NotImplementedError
@@ -0,0 +1,373 @@
+"""
+Journal des opérations par lot (.captioninghelper/journal.log) : chaque
+modification est enregistrée avant d'être appliquée, ce qui permet de
+terminer une opération interrompue par un arrêt brutal et d'annuler ou
+rétablir des opérations entières
+"""
+import json
+import os
+import shutil
+import threading
+
+from captioninghelper.captions import join_tags, split_tags, write_tags
+from captioninghelper.jobs import Job
+from captioninghelper.paths import dataset_cache_dir
+
+TRASH_DIR_NAME = "trash"
+
+
+class Operation:
+    """
+    Une opération du journal : modification directe ("edit"), annulation
+    ("undo") ou rétablissement ("redo") de l'opération `target`.
+
+    `entries` ne contient que les entrées validées :
+    ("caption", image, texte avant, texte après), ("move", source,
+    destination) pour un fichier déplacé (chemins relatifs au dossier)
+    et ("rename", ancien nom, nouveau nom) pour une image renommée
+    (information seulement, le fichier suit par ses "move").
+    """
+
+    __slots__ = ("id", "label", "kind", "target", "entries", "ended")
+
+    def __init__(self, op_id, label, kind="edit", target=None):
+        self.id = op_id
+        self.label = label
+        self.kind = kind
+        self.target = target
+        self.entries = []
+        self.ended = False
+
+
+def inverse_entries(entries):
+    """
+    Entrées qui défont `entries`, dans l'ordre inverse
+    """
+    inverse = []
+    for entry in reversed(entries):
+        if entry[0] == "caption":
+            inverse.append(("caption", entry[1], entry[3], entry[2]))
+        else:
+            inverse.append((entry[0], entry[2], entry[1]))
+    return inverse
+
+
+def entry_records(op_id, entries):
+    """
+    Lignes du journal d'un paquet d'entrées, suivies de leur validation
+    """
+    records = []
+    for entry in entries:
+        if entry[0] == "caption":
+            records.append({"op": op_id, "caption": entry[1], "before": entry[2], "after": entry[3]})
+        else:
+            records.append({"op": op_id, entry[0]: [entry[1], entry[2]]})
+    records.append({"op": op_id, "commit": len(entries)})
+    return records
+
+
+def apply_move(folder_path, source, target):
+    """
+    Déplace un fichier du journal. Sans effet si c'est déjà fait (source
+    absente ou destination présente) : rejouer un déplacement est sûr.
+    """
+    source_path = os.path.join(folder_path, source)
+    target_path = os.path.join(folder_path, target)
+    if not os.path.exists(source_path) or os.path.exists(target_path):
+        return False
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.replace(source_path, target_path)
+    return True
+
+
+class OperationJournal:
+    """
+    Journal en ajout seul, une ligne JSON par enregistrement. Une
+    opération s'écrit ainsi :
+
+        begin(label)            -> {"op": N, "begin": label, ...}
+        append(op, entrées)     -> une ligne par entrée puis {"op": N, "commit": n},
+                                   le tout rendu durable par un seul fsync
+        (l'appelant applique alors les entrées)
+        end(op)                 -> {"op": N, "end": true}
+
+    Les entrées sont donc toujours sur disque avant d'être appliquées, et
+    regroupées pour ne payer qu'un fsync par paquet (group commit). À
+    l'ouverture, les entrées validées d'une opération sans "end" sont
+    rejouées (replay()) : écrire une légende ou refaire un déplacement
+    déjà fait ne change rien. Les entrées écrites après le dernier
+    "commit" n'ont jamais été appliquées et sont ignorées.
+
+    Les fichiers supprimés par une opération (originaux d'une conversion)
+    sont déplacés dans .captioninghelper/trash/N/, vidé quand l'opération
+    sort de l'historique (`max_operations` dernières opérations). Le
+    journal est compacté à la fin d'une opération dès que l'historique
+    dépasse `max_operations` de `compact_margin`.
+    """
+
+    FILE_NAME = "journal.log"
+    max_operations = 100
+    compact_margin = 25
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        cache_dir = dataset_cache_dir(folder_path)
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.trash_path = os.path.join(cache_dir, TRASH_DIR_NAME)
+        self.operations = {}
+        self.undo_stack = []
+        self.redo_stack = []
+        self.next_id = 1
+        self._file = None
+        # Réentrant : compact() réécrit le fichier sous le même verrou
+        self._lock = threading.RLock()
+        self._load()
+
+    # --- Lecture ---
+
+    def _load(self):
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        uncommitted = {}
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Dernière ligne à moitié écrite lors d'un arrêt brutal
+                    break
+                op_id = record["op"]
+                self.next_id = max(self.next_id, op_id + 1)
+                if "begin" in record:
+                    self.operations[op_id] = Operation(
+                        op_id, record["begin"], record.get("kind", "edit"), record.get("target")
+                    )
+                    uncommitted[op_id] = []
+                    continue
+                operation = self.operations.get(op_id)
+                if operation is None:
+                    continue
+                if "caption" in record:
+                    uncommitted[op_id].append(("caption", record["caption"], record["before"], record["after"]))
+                elif "move" in record:
+                    uncommitted[op_id].append(("move",) + tuple(record["move"]))
+                elif "rename" in record:
+                    uncommitted[op_id].append(("rename",) + tuple(record["rename"]))
+                elif "commit" in record:
+                    operation.entries += uncommitted[op_id]
+                    uncommitted[op_id] = []
+                elif "end" in record:
+                    operation.ended = True
+        for operation in self.operations.values():
+            self._track(operation)
+
+    def _track(self, operation):
+        """
+        Met à jour les piles d'annulation / rétablissement
+        """
+        if operation.kind == "edit":
+            if operation.entries:
+                self.undo_stack.append(operation.id)
+                self.redo_stack.clear()
+        elif operation.kind == "undo" and operation.target in self.undo_stack:
+            self.undo_stack.remove(operation.target)
+            self.redo_stack.append(operation.target)
+        elif operation.kind == "redo" and operation.target in self.redo_stack:
+            self.redo_stack.remove(operation.target)
+            self.undo_stack.append(operation.target)
+
+    # --- Écriture ---
+
+    def _write(self, records, sync=False):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def begin(self, label, kind="edit", target=None):
+        with self._lock:
+            op_id = self.next_id
+            self.next_id += 1
+            self.operations[op_id] = Operation(op_id, label, kind, target)
+        record = {"op": op_id, "begin": label}
+        if kind != "edit":
+            record.update(kind=kind, target=target)
+        self._write([record])
+        return op_id
+
+    def append(self, op_id, entries, sync=True):
+        """
+        Écrit et valide un paquet d'entrées (un seul fsync) : elles
+        peuvent ensuite être appliquées. Sans `sync`, le paquet peut être
+        perdu lors d'un arrêt brutal (modifications interactives, déjà
+        écrites de façon atomique : seule leur annulation serait perdue).
+
+        Les entrées ajoutées à une opération terminée la prolongent : elle
+        reste une seule opération pour l'annulation.
+        """
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            self._write(entry_records(op_id, entries), sync=sync)
+            self.operations[op_id].entries += entries
+
+    def end(self, op_id):
+        """
+        Marque l'opération comme entièrement appliquée (sans fsync : au
+        pire, elle est rejouée au prochain démarrage), puis compacte le
+        journal s'il a trop grandi
+        """
+        with self._lock:
+            self._write([{"op": op_id, "end": True}])
+            operation = self.operations[op_id]
+            operation.ended = True
+            self._track(operation)
+            if len(self.operations) > self.max_operations + self.compact_margin:
+                self.compact()
+
+    def last_operation(self):
+        """
+        Dernière opération annulable (ou None)
+        """
+        with self._lock:
+            return self.operations[self.undo_stack[-1]] if self.undo_stack else None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # --- Reprise après un arrêt brutal ---
+
+    def replay(self):
+        """
+        Termine les opérations interrompues en réappliquant leurs entrées
+        validées. Retourne le nombre d'opérations rejouées.
+        """
+        pending = [operation for operation in self.operations.values() if not operation.ended]
+        for operation in pending:
+            for entry in operation.entries:
+                self.apply(entry)
+            self.end(operation.id)
+        return len(pending)
+
+    def apply(self, entry):
+        """
+        Applique une entrée directement sur disque
+        """
+        if entry[0] == "caption":
+            write_tags(self.folder_path, entry[1], split_tags(entry[3]))
+        elif entry[0] == "move":
+            apply_move(self.folder_path, entry[1], entry[2])
+
+    def trash_dir(self, op_id):
+        """
+        Chemin (relatif au dossier) de la corbeille d'une opération
+        """
+        return os.path.join(os.path.relpath(self.trash_path, self.folder_path), str(op_id))
+
+    def compact(self):
+        """
+        Oublie les opérations terminées les plus anciennes au-delà de
+        `max_operations` (et vide leur corbeille) en réécrivant le journal.
+        Les opérations en cours (autre thread) sont gardées.
+        """
+        with self._lock:
+            if len(self.operations) <= self.max_operations:
+                return 0
+            oldest = sorted(self.operations)[:-self.max_operations]
+            dropped = [op_id for op_id in oldest if self.operations[op_id].ended]
+            for op_id in dropped:
+                del self.operations[op_id]
+                shutil.rmtree(os.path.join(self.trash_path, str(op_id)), ignore_errors=True)
+            self.undo_stack = [op_id for op_id in self.undo_stack if op_id in self.operations]
+            self.redo_stack = [op_id for op_id in self.redo_stack if op_id in self.operations]
+
+            self.close()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for operation in self.operations.values():
+                    record = {"op": operation.id, "begin": operation.label}
+                    if operation.kind != "edit":
+                        record.update(kind=operation.kind, target=operation.target)
+                    records = [record] + entry_records(operation.id, operation.entries)
+                    if operation.ended:
+                        records.append({"op": operation.id, "end": True})
+                    f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(dropped)
+
+    # --- Annulation ---
+
+    def undo_label(self):
+        return self.operations[self.undo_stack[-1]].label if self.undo_stack else None
+
+    def redo_label(self):
+        return self.operations[self.redo_stack[-1]].label if self.redo_stack else None
+
+
+def caption_entries(items):
+    """
+    Entrées du journal pour des légendes modifiées : (image, tags avant, tags après)
+    """
+    return [("caption", image_file, join_tags(before), join_tags(after)) for image_file, before, after in items]
+
+
+class UndoJob(Job):
+    """
+    Annule (ou, avec `redo`, rétablit) la dernière opération du journal.
+    Les légendes passent par le CaptionStore (index et affichage à jour),
+    les fichiers sont déplacés depuis / vers la corbeille de l'opération.
+    Les images renommées sont listées dans `renamed` {ancien nom: nouveau nom}.
+    """
+
+    def __init__(self, journal, store, redo=False):
+        super().__init__()
+        self.journal = journal
+        self.store = store
+        self.redo = redo
+        self.target = None
+        self.renamed = {}
+
+    def run(self):
+        stack = self.journal.redo_stack if self.redo else self.journal.undo_stack
+        if not stack:
+            return
+        # Les modifications en attente forment leur propre opération
+        self.store.flush()
+        target = self.journal.operations[stack[-1]]
+        self.target = target
+        entries = target.entries if self.redo else inverse_entries(target.entries)
+        kind = "redo" if self.redo else "undo"
+        op_id = self.journal.begin(target.label, kind, target.id)
+
+        captions = [entry for entry in entries if entry[0] == "caption"]
+        files = [entry for entry in entries if entry[0] != "caption"]
+        total = len(entries)
+        self.report(0, total)
+        if files:
+            self.journal.append(op_id, files)
+            for i, entry in enumerate(files, 1):
+                try:
+                    self.journal.apply(entry)
+                except OSError as e:
+                    self.errors[entry[1]] = str(e)
+                if entry[0] == "rename":
+                    self.renamed[entry[1]] = entry[2]
+                self.report(i, total, entry[1])
+        with self.store.batch(target.label, op_id):
+            for i, entry in enumerate(captions, len(files) + 1):
+                self.store.set(entry[1], split_tags(entry[3]))
+                if i % 1024 == 0:
+                    self.report(i, total, entry[1])
+        self.journal.end(op_id)
+        self.report(total, total)
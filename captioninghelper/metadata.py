@@ -0,0 +1,372 @@
+"""
+Métadonnées de génération (Automatic1111, ComfyUI) lues dans les en-têtes
+des PNG, JPEG et WebP, et cache en colonnes de ces métadonnées par dossier
+"""
+import json
+import os
+import re
+import struct
+import zlib
+from collections import namedtuple
+
+from captioninghelper.paths import dataset_cache_dir
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+TEXT_CHUNKS = (b"tEXt", b"zTXt", b"iTXt")
+METADATA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Tags EXIF : pointeur vers le sous-répertoire Exif, commentaire utilisateur
+EXIF_IFD_POINTER = 0x8769
+EXIF_USER_COMMENT = 0x9286
+
+GenerationInfo = namedtuple(
+    "GenerationInfo",
+    ["prompt", "negative_prompt", "seed", "steps", "sampler", "cfg_scale",
+     "width", "height", "model", "model_hash", "source"]
+)
+GenerationInfo.__new__.__defaults__ = (None,) * len(GenerationInfo._fields)
+
+# Dernière ligne des paramètres A1111 : « Steps: 20, Sampler: Euler a, Seed: 1, ... »
+A1111_SETTING = re.compile(r'\s*([\w ]+):\s*("(?:\\.|[^\\"])*"|[^,]*)(?:,|$)')
+A1111_SETTINGS_LINE = re.compile(r'^Steps: ', re.MULTILINE)
+
+
+# ======================
+#  LECTURE DES EN-TÊTES
+# ======================
+
+def decode_text_chunk(chunk_type, data):
+    """
+    Retourne (mot-clé, texte) d'un chunk tEXt, zTXt ou iTXt
+    """
+    keyword, _, rest = data.partition(b"\0")
+    keyword = keyword.decode("latin-1")
+    if chunk_type == b"tEXt":
+        return keyword, rest.decode("latin-1")
+    if chunk_type == b"zTXt":
+        # Octet de méthode de compression (toujours zlib), puis le texte compressé
+        return keyword, zlib.decompress(rest[1:]).decode("latin-1")
+    # iTXt : drapeau et méthode de compression, langue, mot-clé traduit, texte UTF-8
+    compressed = rest[0]
+    _, _, rest = rest[2:].partition(b"\0")
+    _, _, text = rest.partition(b"\0")
+    if compressed:
+        text = zlib.decompress(text)
+    return keyword, text.decode("utf-8")
+
+
+def read_png_text(png_path):
+    """
+    Lit les chunks texte d'un PNG sans décoder l'image : la lecture
+    s'arrête au premier chunk IDAT (les données de l'image)
+    """
+    texts = {}
+    with open(png_path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("Not a PNG file")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type in (b"IDAT", b"IEND"):
+                break
+            if chunk_type in TEXT_CHUNKS:
+                keyword, text = decode_text_chunk(chunk_type, f.read(length))
+                texts.setdefault(keyword, text)
+                f.seek(4, os.SEEK_CUR)  # CRC
+            else:
+                f.seek(length + 4, os.SEEK_CUR)
+    return texts
+
+
+def decode_user_comment(value, byte_order):
+    """
+    UserComment EXIF : 8 octets de jeu de caractères, puis le texte
+    """
+    charset, text = value[:8], value[8:]
+    if charset == b"UNICODE\0":
+        # L'ordre des octets n'est pas indiqué et ne suit pas toujours celui
+        # du TIFF : un texte surtout ASCII a ses octets nuls d'un seul côté
+        if text[:2] in (b"\xff\xfe", b"\xfe\xff"):
+            return text.decode("utf-16").rstrip("\0")
+        sample = text[:64]
+        big_endian = sample[0::2].count(0) > sample[1::2].count(0) if sample else byte_order == ">"
+        return text.decode("utf-16-be" if big_endian else "utf-16-le", "replace").rstrip("\0")
+    return text.decode("utf-8", "replace").rstrip("\0")
+
+
+def read_exif_user_comment(tiff):
+    """
+    Cherche le UserComment dans un bloc EXIF (en-tête TIFF inclus)
+    """
+    if tiff.startswith(b"Exif\0\0"):
+        tiff = tiff[6:]
+    byte_order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if byte_order is None:
+        return None
+
+    def entries(offset):
+        count, = struct.unpack_from(byte_order + "H", tiff, offset)
+        for i in range(count):
+            yield struct.unpack_from(byte_order + "HHII", tiff, offset + 2 + 12 * i)
+
+    ifd0, = struct.unpack_from(byte_order + "I", tiff, 4)
+    for tag, _, _, value in entries(ifd0):
+        if tag == EXIF_IFD_POINTER:
+            for sub_tag, _, count, offset in entries(value):
+                if sub_tag == EXIF_USER_COMMENT and count > 8:
+                    return decode_user_comment(tiff[offset:offset + count], byte_order)
+    return None
+
+
+def read_jpeg_exif(jpeg_path):
+    """
+    Bloc EXIF (segment APP1) d'un JPEG, lu avant les données de l'image
+    """
+    with open(jpeg_path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise ValueError("Not a JPEG file")
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF or marker[1] == 0xDA:
+                # Début des données de l'image (SOS) : pas d'EXIF
+                return None
+            length, = struct.unpack(">H", f.read(2))
+            if marker[1] == 0xE1:
+                data = f.read(length - 2)
+                if data.startswith(b"Exif\0\0"):
+                    return data
+            else:
+                f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_webp_exif(webp_path):
+    """
+    Chunk EXIF d'un WebP (conteneur RIFF) ; les autres chunks sont sautés
+    """
+    with open(webp_path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+            raise ValueError("Not a WebP file")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_type, length = struct.unpack("<4sI", chunk)
+            if chunk_type == b"EXIF":
+                return f.read(length)
+            # Les chunks sont alignés sur 2 octets
+            f.seek(length + (length & 1), os.SEEK_CUR)
+
+
+# ======================
+#  INTERPRÉTATION
+# ======================
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_a1111_parameters(text):
+    """
+    Paramètres A1111 : prompt, « Negative prompt: ... », puis une ligne
+    « Steps: 20, Sampler: ..., Seed: ..., Size: 512x768, Model hash: ... »
+    """
+    settings = {}
+    match = A1111_SETTINGS_LINE.search(text)
+    if match:
+        settings_text = text[match.start():]
+        text = text[:match.start()]
+        settings = {key.strip(): value.strip().strip('"') for key, value in A1111_SETTING.findall(settings_text)}
+    prompt, _, negative = text.partition("Negative prompt:")
+    width, _, height = settings.get("Size", "").partition("x")
+    return GenerationInfo(
+        prompt=prompt.strip(),
+        negative_prompt=negative.strip() or None,
+        seed=to_int(settings.get("Seed")),
+        steps=to_int(settings.get("Steps")),
+        sampler=settings.get("Sampler"),
+        cfg_scale=to_float(settings.get("CFG scale")),
+        width=to_int(width),
+        height=to_int(height),
+        model=settings.get("Model"),
+        model_hash=settings.get("Model hash"),
+        source="a1111"
+    )
+
+
+def parse_comfyui_prompt(text):
+    """
+    Graphe ComfyUI (chunk « prompt ») : réglages lus sur le premier
+    KSampler, textes suivis jusqu'aux nœuds d'encodage reliés
+    """
+    graph = json.loads(text)
+    if not isinstance(graph, dict):
+        return None
+
+    def linked(value):
+        # Une entrée reliée est [identifiant du nœud, numéro de sortie]
+        if isinstance(value, list) and value and str(value[0]) in graph:
+            return graph[str(value[0])]
+        return None
+
+    def text_of(value, depth=0):
+        node = linked(value)
+        if node is None or depth > 8:
+            return value if isinstance(value, str) else None
+        inputs = node.get("inputs", {})
+        for key in ("text", "text_g", "string"):
+            if key in inputs:
+                return text_of(inputs[key], depth + 1)
+        return None
+
+    nodes = list(graph.values())
+    sampler = next((n for n in nodes if "KSampler" in str(n.get("class_type", ""))), None)
+    if sampler is None:
+        return None
+    inputs = sampler.get("inputs", {})
+    latent = next((n for n in nodes if n.get("class_type") == "EmptyLatentImage"), {})
+    checkpoint = next((n for n in nodes if "CheckpointLoader" in str(n.get("class_type", ""))), {})
+    seed = inputs.get("seed", inputs.get("noise_seed"))
+    return GenerationInfo(
+        prompt=text_of(inputs.get("positive")),
+        negative_prompt=text_of(inputs.get("negative")),
+        seed=to_int(seed) if not isinstance(seed, list) else None,
+        steps=to_int(inputs.get("steps")),
+        sampler=inputs.get("sampler_name"),
+        cfg_scale=to_float(inputs.get("cfg")),
+        width=to_int(latent.get("inputs", {}).get("width")),
+        height=to_int(latent.get("inputs", {}).get("height")),
+        model=checkpoint.get("inputs", {}).get("ckpt_name"),
+        source="comfyui"
+    )
+
+
+def read_generation_info(image_path):
+    """
+    Métadonnées de génération d'une image, ou None si elle n'en contient pas.
+    Seuls les en-têtes du fichier sont lus.
+    """
+    extension = os.path.splitext(image_path)[1].lower()
+    if extension == ".png":
+        texts = read_png_text(image_path)
+        if "parameters" in texts:
+            return parse_a1111_parameters(texts["parameters"])
+        if "prompt" in texts:
+            return parse_comfyui_prompt(texts["prompt"])
+        return None
+    if extension in (".jpg", ".jpeg"):
+        exif = read_jpeg_exif(image_path)
+    elif extension == ".webp":
+        exif = read_webp_exif(image_path)
+    else:
+        return None
+    comment = read_exif_user_comment(exif) if exif else None
+    if not comment:
+        return None
+    if comment.lstrip().startswith("{"):
+        return parse_comfyui_prompt(comment)
+    return parse_a1111_parameters(comment)
+
+
+# ======================
+#  CACHE EN COLONNES
+# ======================
+
+class MetadataCache:
+    """
+    Métadonnées de génération de toutes les images d'un dossier, dans un
+    seul fichier .captioninghelper/metadata.json rangé par colonnes :
+    "name", "mtime" puis une colonne par champ de GenerationInfo. Une
+    image sans métadonnées a une ligne dont tous les champs sont vides,
+    pour ne pas être rouverte tant qu'elle n'a pas changé.
+    """
+
+    FILE_NAME = "metadata.json"
+    VERSION = 1
+    COLUMNS = ("name", "mtime") + GenerationInfo._fields
+
+    def __init__(self, folder_path):
+        self.path = os.path.join(dataset_cache_dir(folder_path), self.FILE_NAME)
+        self.columns = {column: [] for column in self.COLUMNS}
+        self._rows = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.VERSION or set(data.get("columns", ())) != set(self.COLUMNS):
+            return
+        self.columns = data["columns"]
+        self._rows = {name: row for row, name in enumerate(self.columns["name"])}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def is_fresh(self, name, mtime_ns):
+        row = self._rows.get(name)
+        return row is not None and self.columns["mtime"][row] == mtime_ns
+
+    def get(self, name):
+        """
+        GenerationInfo d'une image (None si elle n'en a pas ou n'est pas en cache)
+        """
+        row = self._rows.get(name)
+        if row is None:
+            return None
+        values = [self.columns[field][row] for field in GenerationInfo._fields]
+        if all(value is None for value in values):
+            return None
+        return GenerationInfo(*values)
+
+    def put(self, name, mtime_ns, info):
+        values = (name, mtime_ns) + tuple(info or GenerationInfo())
+        row = self._rows.get(name)
+        if row is None:
+            self._rows[name] = len(self.columns["name"])
+            for column, value in zip(self.COLUMNS, values):
+                self.columns[column].append(value)
+        else:
+            for column, value in zip(self.COLUMNS, values):
+                self.columns[column][row] = value
+        self.dirty = True
+
+    def prune(self, names):
+        """
+        Oublie les images qui ne sont plus dans `names`
+        """
+        keep = [row for name, row in self._rows.items() if name in names]
+        if len(keep) == len(self._rows):
+            return
+        keep.sort()
+        self.columns = {column: [values[row] for row in keep] for column, values in self.columns.items()}
+        self._rows = {name: row for row, name in enumerate(self.columns["name"])}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "columns": self.columns}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,150 @@
+"""
+Légendage automatique via l'API HTTP locale d'Ollama
+"""
+import base64
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from captioninghelper.config import DEFAULT_OLLAMA_URL
+from captioninghelper.jobs import Job
+from captioninghelper.trace import tracer
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaClient:
+    """
+    Client de l'API /api/generate. Chaque thread garde sa propre
+    connexion keep-alive, réutilisée d'une requête à l'autre.
+    """
+
+    def __init__(self, base_url=DEFAULT_OLLAMA_URL, timeout=300):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.https = parts.scheme == "https"
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Import différé : http.client est long à charger et inutile au démarrage
+        import http.client
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def generate(self, model, prompt, image_path):
+        """
+        Envoie une image et un prompt, retourne la réponse texte du modèle
+        """
+        import http.client
+
+        with open(image_path, "rb") as f:
+            image_data = base64.b64encode(f.read()).decode("ascii")
+        body = json.dumps({
+            "model": model,
+            "prompt": prompt,
+            "images": [image_data],
+            "stream": False
+        })
+        headers = {"Content-Type": "application/json"}
+
+        # Une connexion keep-alive peut avoir été fermée par le serveur : on réessaie une fois
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", f"{self.base_path}/api/generate", body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                self._drop_connection()
+                if attempt:
+                    raise
+                continue
+            break
+
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            payload = {}
+        if response.status != 200:
+            raise OllamaError(payload.get("error") or f"HTTP {response.status}")
+        return payload.get("response", "").strip()
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class BatchCaptioner(Job):
+    """
+    Légende une liste d'images avec `workers` requêtes simultanées.
+    Chaque légende obtenue est transmise par on_result(chemin, texte),
+    chaque échec est conservé dans errors[chemin]. Si un `cache`
+    (resultcache.CaptionCache) est fourni, il est consulté avant le modèle.
+    """
+
+    def __init__(self, client, model, prompt, image_paths, workers=2, cache=None):
+        super().__init__()
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.prompt = prompt
+        self.image_paths = list(image_paths)
+        self.workers = max(1, workers)
+        self.done = 0
+        self._done_lock = threading.Lock()
+
+    def _worker(self, jobs):
+        while self.checkpoint():
+            try:
+                image_path = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                output = self.cache.get(image_path, self.model, self.prompt) if self.cache else None
+                if output is None:
+                    with tracer.span("ollama.generate"):
+                        output = self.client.generate(self.model, self.prompt, image_path)
+                    if self.cache:
+                        self.cache.put(image_path, self.model, self.prompt, output)
+                self.emit_result(image_path, output)
+            except Exception as e:
+                self.errors[image_path] = str(e)
+            with self._done_lock:
+                self.done += 1
+                done = self.done
+            self.report(done, len(self.image_paths), os.path.basename(image_path))
+
+    def run(self):
+        jobs = queue.Queue()
+        for image_path in self.image_paths:
+            jobs.put(image_path)
+        self.report(0, len(self.image_paths))
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ollama") as executor:
+            for _ in range(self.workers):
+                executor.submit(self._worker, jobs)
+        self.client.close()
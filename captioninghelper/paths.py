@@ -0,0 +1,19 @@
+"""
+Emplacements des fichiers de l'application
+"""
+import os
+
+# Dossier du programme (config.json, last_folder.json, langues...)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sous-dossier de cache créé dans chaque dossier d'images, à côté de tag_library.json
+CACHE_DIR_NAME = ".captioninghelper"
+
+
+def dataset_cache_dir(folder_path):
+    """
+    Retourne (et crée si besoin) le dossier de cache d'un dossier d'images
+    """
+    path = os.path.join(folder_path, CACHE_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,160 @@
+"""
+Décodage des aperçus en arrière-plan et cache LRU des images décodées
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from captioninghelper.trace import tracer
+
+PREVIEW_SIZE = (600, 400)
+
+# Aperçu décodé : pixels RGBA bruts, prêts à être envoyés dans un QImage
+Preview = namedtuple("Preview", ["width", "height", "data"])
+
+
+def fit_size(width, height, box=PREVIEW_SIZE):
+    """
+    Taille qui tient dans `box` en conservant le ratio (comme Qt.KeepAspectRatio)
+    """
+    scale = min(box[0] / width, box[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decode_preview(image_path, box=PREVIEW_SIZE):
+    """
+    Décode une image directement à la taille de l'aperçu
+    """
+    # Import différé : Pillow se charge dans le thread de décodage, pas au démarrage
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        target = fit_size(img.width, img.height, box)
+        # Pour les JPEG, décode directement à une échelle réduite
+        img.draft("RGB", target)
+        rgba = img.convert("RGBA")
+    rgba = rgba.resize(target, Image.LANCZOS, reducing_gap=3.0)
+    return Preview(rgba.width, rgba.height, rgba.tobytes("raw", "RGBA"))
+
+
+class PreviewCache:
+    """
+    Cache LRU des aperçus décodés, borné par un budget mémoire (en octets)
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            preview = self._items.get(key)
+            if preview is not None:
+                self._items.move_to_end(key)
+            return preview
+
+    def put(self, key, preview):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old.data)
+            self._items[key] = preview
+            self._size += len(preview.data)
+            # Évince les aperçus les moins récemment utilisés
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted.data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+
+class PreviewLoader:
+    """
+    Fournit les aperçus depuis le cache et précharge les voisins
+    dans des threads de travail. Si un `store` persistant est fourni
+    (voir thumbnails.ThumbnailStore), il est consulté avant tout décodage.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, workers=2, box=PREVIEW_SIZE, store=None):
+        self.cache = PreviewCache(max_bytes)
+        self.box = box
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _key(self, image_path):
+        # La taille et la date de modification invalident l'aperçu si le fichier change
+        stat = os.stat(image_path)
+        return image_path, stat.st_size, stat.st_mtime_ns
+
+    def _decode(self, key):
+        try:
+            image_path = key[0]
+            stat = os.stat(image_path)
+            preview = None
+            if self.store:
+                with tracer.span("thumbnail.get"):
+                    preview = self.store.get(image_path, stat)
+            if preview is None:
+                with tracer.span("preview.decode"):
+                    preview = decode_preview(image_path, self.box)
+                if self.store:
+                    with tracer.span("thumbnail.put"):
+                        self.store.put(image_path, stat, preview)
+            self.cache.put(key, preview)
+            return preview
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def get(self, image_path):
+        """
+        Retourne l'aperçu d'une image : immédiat s'il est en cache,
+        sinon attend le préchargement en cours ou décode directement
+        """
+        key = self._key(image_path)
+        preview = self.cache.get(key)
+        if preview is not None:
+            return preview
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None and not future.cancelled():
+            try:
+                with tracer.span("preview.wait_prefetch"):
+                    return future.result()
+            except Exception:
+                pass
+        return self._decode(key)
+
+    def prefetch(self, image_paths):
+        """
+        Planifie le décodage des images données ; les préchargements
+        devenus inutiles et pas encore démarrés sont annulés
+        """
+        wanted = set()
+        for image_path in image_paths:
+            try:
+                key = self._key(image_path)
+            except OSError:
+                continue
+            wanted.add(key)
+            if key in self.cache:
+                continue
+            with self._lock:
+                if key not in self._pending:
+                    self._pending[key] = self._executor.submit(self._decode, key)
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in wanted and future.cancel():
+                    del self._pending[key]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self.store:
+            self.store.close()
@@ -0,0 +1,187 @@
+"""
+Extraction des prompts enregistrés dans les images générées
+(Automatic1111, ComfyUI) vers des .txt de légende
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from captioninghelper.jobs import Job
+from captioninghelper.metadata import METADATA_EXTENSIONS, MetadataCache, read_generation_info
+
+# Balises <lora:...>, <hypernet:...> du prompt
+BRACKETS = re.compile('<.*?>')
+
+
+def remove_after_negprompt(text):
+    return text.split("Negative prompt:")[0]
+
+
+def remove_brackets(text):
+    return BRACKETS.sub('', text)
+
+
+def clean_prompt(metadata):
+    """
+    Garde le prompt positif, sans les balises <lora:...>
+    """
+    prompt = remove_brackets(remove_after_negprompt(metadata))
+    return prompt.strip()
+
+
+def caption_from_info(info):
+    """
+    Légende tirée des métadonnées de génération, ou None sans prompt
+    """
+    if info is None or not info.prompt:
+        return None
+    return remove_brackets(info.prompt).strip() or None
+
+
+def write_caption(folder_path, image_file, caption):
+    txt_path = os.path.join(folder_path, os.path.splitext(image_file)[0] + '.txt')
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        f.write(caption)
+
+
+def extract_prompt(image_path):
+    """
+    Prompt nettoyé d'une image, ou None si elle n'en contient pas
+    """
+    return caption_from_info(read_generation_info(image_path))
+
+
+def extract_prompts(folder_path, items):
+    """
+    Lit les métadonnées d'un paquet d'images et écrit les .txt demandés
+    (exécuté dans un processus de travail). `items` contient des
+    (nom, date de modification, écrire le .txt) ; retourne des
+    (nom, date de modification, métadonnées, .txt écrit, erreur ou None).
+    """
+    results = []
+    for image_file, mtime, write in items:
+        try:
+            info = read_generation_info(os.path.join(folder_path, image_file))
+            caption = caption_from_info(info) if write else None
+            if caption is not None:
+                write_caption(folder_path, image_file, caption)
+            results.append((image_file, mtime, info, caption is not None, None))
+        except Exception as e:
+            results.append((image_file, mtime, None, False, str(e)))
+    return results
+
+
+def scan_images(folder_path):
+    """
+    Images du dossier qui peuvent porter des métadonnées {nom: date de
+    modification} et dates de modification des .txt {nom de base: date},
+    en un seul parcours
+    """
+    images = {}
+    txt_mtimes = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            name = entry.name.lower()
+            try:
+                if name.endswith(METADATA_EXTENSIONS) and entry.is_file():
+                    images[entry.name] = entry.stat().st_mtime_ns
+                elif name.endswith('.txt'):
+                    txt_mtimes[os.path.splitext(entry.name)[0]] = entry.stat().st_mtime_ns
+            except OSError:
+                continue
+    return images, txt_mtimes
+
+
+class ExtractPromptsJob(Job):
+    """
+    Écrit à côté de chaque image générée du dossier un .txt contenant son
+    prompt. Les .txt déjà plus récents que leur image sont laissés tels
+    quels, sauf avec `force` ; avec write_captions=False, seul le cache
+    des métadonnées est mis à jour.
+
+    Les métadonnées sont gardées dans le MetadataCache du dossier : une
+    image qui n'a pas changé n'est jamais rouverte. Les autres sont lues
+    par paquets sur un pool de processus. Les images dont le .txt a été
+    écrit sont listées dans `written`, celles sans travail comptées dans `skipped`.
+    """
+
+    chunk_size = 64
+
+    def __init__(self, folder_path, workers=None, force=False, write_captions=True):
+        super().__init__()
+        self.folder_path = folder_path
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+        self.write_captions = write_captions
+        self.cache = None
+        self.written = []
+        self.skipped = 0
+
+    def run(self):
+        self.cache = cache = MetadataCache(self.folder_path)
+        images, txt_mtimes = scan_images(self.folder_path)
+        cache.prune(images)
+
+        # Les images dont le .txt est à jour ou dont les métadonnées sont en
+        # cache ne partent pas au pool ; sans write_captions, toutes les images
+        # hors cache sont lues puisque remplir le cache est le but
+        to_read = []
+        for image_file, mtime in images.items():
+            write = self.write_captions and (
+                self.force or txt_mtimes.get(os.path.splitext(image_file)[0], -1) < mtime
+            )
+            if self.write_captions and not write:
+                self.skipped += 1
+                continue
+            if not cache.is_fresh(image_file, mtime):
+                to_read.append((image_file, mtime, write))
+                continue
+            caption = caption_from_info(cache.get(image_file)) if write else None
+            if caption is None:
+                self.skipped += 1
+                continue
+            try:
+                write_caption(self.folder_path, image_file, caption)
+            except OSError as e:
+                self.errors[image_file] = str(e)
+            else:
+                self.written.append(image_file)
+                self.emit_result(image_file, caption)
+
+        total = len(to_read)
+        chunks = (to_read[i:i + self.chunk_size] for i in range(0, total, self.chunk_size))
+        in_flight = set()
+        done = 0
+        self.report(0, total)
+
+        # "spawn" : pas de fork d'un processus qui fait tourner Qt et des threads
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+                while True:
+                    while len(in_flight) < 2 * self.workers and self.checkpoint():
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        in_flight.add(executor.submit(extract_prompts, self.folder_path, chunk))
+                    if not in_flight:
+                        break
+
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        for image_file, mtime, info, written, error in future.result():
+                            done += 1
+                            if error is not None:
+                                print(f"Erreur avec {image_file}: {error}")
+                                self.errors[image_file] = error
+                                continue
+                            cache.put(image_file, mtime, info)
+                            if written:
+                                self.written.append(image_file)
+                                self.emit_result(image_file, caption_from_info(info))
+                            else:
+                                self.skipped += 1
+                        self.report(done, total, image_file)
+        finally:
+            cache.save()
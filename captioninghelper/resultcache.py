@@ -0,0 +1,171 @@
+"""
+Cache des légendes produites par les modèles, indexé par contenu d'image,
+modèle et prompt
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from captioninghelper.jobs import Job
+from captioninghelper.paths import APP_DIR
+
+CAPTION_CACHE_FILE = os.path.join(APP_DIR, "caption_cache.db")
+
+
+def file_hash(path):
+    """
+    Empreinte SHA-256 du contenu d'un fichier
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CaptionCache:
+    """
+    Légendes déjà calculées, par (empreinte de l'image, modèle, prompt).
+    Les doublons d'une même image partagent donc leur résultat. Les
+    empreintes sont mémorisées par (chemin, taille, date de modification)
+    pour ne pas relire les fichiers inchangés. Au-delà de `max_entries`,
+    les résultats les moins récemment utilisés sont évincés.
+    """
+
+    def __init__(self, db_path=None, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path or CAPTION_CACHE_FILE, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                image_hash TEXT, model TEXT, prompt TEXT, output TEXT, last_used REAL,
+                PRIMARY KEY (image_hash, model, prompt));
+            CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used);
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, image_hash TEXT);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER);
+            INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0);
+        """)
+        self._conn.commit()
+
+    def image_hash(self, image_path):
+        stat = os.stat(image_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT image_hash FROM file_hashes WHERE path = ? AND size = ? AND mtime = ?",
+                (image_path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        digest = file_hash(image_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                (image_path, stat.st_size, stat.st_mtime_ns, digest)
+            )
+            self._conn.commit()
+        return digest
+
+    def get(self, image_path, model, prompt, count=True):
+        """
+        Retourne la légende en cache, ou None (compté comme un échec du
+        cache). Avec count=False, la consultation n'entre pas dans les
+        statistiques : elle ne remplace pas un appel au modèle.
+        """
+        digest = self.image_hash(image_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM results WHERE image_hash = ? AND model = ? AND prompt = ?",
+                (digest, model, prompt)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE results SET last_used = ? WHERE image_hash = ? AND model = ? AND prompt = ?",
+                    (time.time(), digest, model, prompt)
+                )
+            if count:
+                counter = "hits" if row is not None else "misses"
+                self._conn.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (counter,))
+            self._conn.commit()
+        return row[0] if row is not None else None
+
+    def put(self, image_path, model, prompt, output):
+        digest = self.image_hash(image_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (digest, model, prompt, output, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM results WHERE rowid IN "
+                    "(SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Statistiques du cache : nombre d'entrées, succès, échecs, taux de succès
+        """
+        with self._lock:
+            values = dict(self._conn.execute("SELECT name, value FROM stats"))
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = values["hits"] + values["misses"]
+        return {
+            "entries": entries,
+            "hits": values["hits"],
+            "misses": values["misses"],
+            "hit_rate": values["hits"] / lookups if lookups else 0.0
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self._conn.execute("UPDATE stats SET value = 0")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReapplyCachedCaptions(Job):
+    """
+    Réapplique les légendes en cache à une liste d'images sans appeler
+    le modèle. Les images sans résultat en cache sont ignorées. Ces
+    consultations ne comptent pas dans les statistiques du cache, qui
+    mesurent les appels au modèle évités.
+    """
+
+    def __init__(self, cache, model, prompt, image_paths, workers=4):
+        super().__init__()
+        self.cache = cache
+        self.model = model
+        self.prompt = prompt
+        self.image_paths = list(image_paths)
+        self.workers = workers
+        self.applied = 0
+
+    def _lookup(self, image_path):
+        if not self.checkpoint():
+            return image_path, None
+        try:
+            return image_path, self.cache.get(image_path, self.model, self.prompt, count=False)
+        except OSError as e:
+            self.errors[image_path] = str(e)
+            return image_path, None
+
+    def run(self):
+        total = len(self.image_paths)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for done, (image_path, output) in enumerate(executor.map(self._lookup, self.image_paths), 1):
+                if output is not None:
+                    self.emit_result(image_path, output)
+                    self.applied += 1
+                self.report(done, total, os.path.basename(image_path))
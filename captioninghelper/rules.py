@@ -0,0 +1,292 @@
+"""
+Règles de normalisation des tags d'un dossier (tag_rules.json) :
+alias, implications, liste noire, expressions à repérer dans les
+légendes longues et ordre des tags, compilées en un TagNormalizer
+"""
+import json
+import os
+
+from captioninghelper.bulk import BulkTagJob
+
+RULES_FILE = "tag_rules.json"
+
+# Exemple de tag_rules.json :
+# {
+#     "aliases": {"blue eyes": ["blue_eyes", "blueeyes"]},
+#     "implications": {"blue eyes": ["eyes"]},
+#     "blacklist": ["watermark", "signature"],
+#     "phrases": {"long hair": "long hair", "wearing a hat": "hat"},
+#     "replace_phrase_tags": false,
+#     "case": "lower",
+#     "underscores": "space",
+#     "order": "priority",
+#     "priority": ["1girl", "solo"]
+# }
+ORDERS = ("keep", "alpha", "priority")
+CASES = ("keep", "lower")
+UNDERSCORES = ("keep", "space")
+
+
+class PhraseMatcher:
+    """
+    Automate d'Aho-Corasick : trouve en un seul parcours d'un texte
+    toutes les expressions connues qu'il contient, quel que soit leur
+    nombre. Seules les occurrences délimitées par des mots entiers comptent.
+    """
+
+    def __init__(self, phrases):
+        # goto[état] : {caractère: état suivant}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for phrase in phrases:
+            state = 0
+            for char in phrase:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(phrase)
+
+        # Liens d'échec, en largeur
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        Expressions trouvées dans `text`, dans l'ordre d'apparition (sans doublon)
+        """
+        found = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for phrase in self.output[state]:
+                start = end - len(phrase)
+                if (start == 0 or not text[start - 1].isalnum()) \
+                        and (end == len(text) or not text[end].isalnum()) \
+                        and phrase not in found:
+                    found.append(phrase)
+        return found
+
+
+class TagNormalizer:
+    """
+    Règles compilées : chaque tag est ramené à une clé (casse, "_" et
+    espaces uniformisés) cherchée dans des tables de hachage ; le résultat
+    est mémorisé par tag distinct. normalize() applique dans l'ordre :
+    alias, liste noire, expressions, suppression des doublons,
+    implications (transitives) puis ordre.
+    """
+
+    def __init__(self, rules):
+        self.case = rules.get("case", "keep")
+        self.underscores = rules.get("underscores", "keep")
+        self.order = rules.get("order", "keep")
+        if self.order not in ORDERS:
+            raise ValueError(f"Unknown tag order: {self.order}")
+        self.replace_phrase_tags = rules.get("replace_phrase_tags", False)
+
+        self.aliases = {}
+        for canonical, variants in rules.get("aliases", {}).items():
+            canonical = self.format(canonical)
+            self.aliases[self.key(canonical)] = canonical
+            for variant in variants:
+                self.aliases[self.key(variant)] = canonical
+        self.blacklist = {self.key(tag) for tag in rules.get("blacklist", ())}
+
+        implications = {
+            self.canonical(tag): [self.canonical(implied) for implied in implied_tags]
+            for tag, implied_tags in rules.get("implications", {}).items()
+        }
+        # Fermeture transitive (les cycles sont sans effet)
+        self.implications = {}
+        for tag in implications:
+            closure = []
+            pending = list(implications[tag])
+            while pending:
+                implied = pending.pop(0)
+                if implied is None or implied == tag or implied in closure:
+                    continue
+                closure.append(implied)
+                pending += implications.get(implied, ())
+            self.implications[tag] = tuple(closure)
+
+        self.phrases = {self.key(phrase): self.canonical(tag) for phrase, tag in rules.get("phrases", {}).items()}
+        self.matcher = PhraseMatcher(self.phrases) if self.phrases else None
+        self.priority = {self.canonical(tag): rank for rank, tag in enumerate(rules.get("priority", ()))}
+        self._cache = {}
+
+    def key(self, tag):
+        key = tag.replace("_", " ")
+        return " ".join(key.split()).casefold()
+
+    def format(self, tag):
+        """
+        Tag sans alias, mis en forme selon les règles de casse et de "_"
+        """
+        tag = " ".join(tag.split())
+        if self.underscores == "space":
+            tag = " ".join(tag.replace("_", " ").split())
+        if self.case == "lower":
+            tag = tag.lower()
+        return tag
+
+    def canonical(self, tag):
+        """
+        Tag canonique, ou None s'il est sur la liste noire
+        """
+        key = self.key(tag)
+        if key in self.blacklist:
+            return None
+        canonical = self.aliases.get(key)
+        if canonical is None:
+            canonical = self.format(tag)
+        return canonical if self.key(canonical) not in self.blacklist else None
+
+    def rewrite_tag(self, tag):
+        """
+        Comme canonical() (interface de bulk.rewrite_library)
+        """
+        return self.canonical(tag)
+
+    def _lookup(self, tag):
+        """
+        (tag canonique ou None, tags des expressions trouvées), mémorisé
+        """
+        try:
+            return self._cache[tag]
+        except KeyError:
+            pass
+        canonical = self.canonical(tag)
+        extra = ()
+        if self.matcher is not None and canonical is not None and self.key(canonical) not in self.phrases:
+            extra = tuple(
+                implied for implied in (self.phrases[phrase] for phrase in self.matcher.find(self.key(canonical)))
+                if implied is not None
+            )
+            if extra and self.replace_phrase_tags:
+                canonical = None
+        result = self._cache[tag] = (canonical, extra)
+        return result
+
+    def normalize(self, tags):
+        """
+        Tags normalisés (nouvelle liste)
+        """
+        result = []
+        seen = set()
+
+        def add(tag):
+            if tag is not None and tag not in seen:
+                seen.add(tag)
+                result.append(tag)
+
+        for tag in tags:
+            canonical, extra = self._lookup(tag)
+            add(canonical)
+            for implied in extra:
+                add(implied)
+        for tag in list(result):
+            for implied in self.implications.get(tag, ()):
+                add(implied)
+
+        if self.order == "alpha":
+            result.sort(key=str.casefold)
+        elif self.order == "priority" and self.priority:
+            # Tri stable : les tags prioritaires d'abord, les autres dans leur ordre
+            last = len(self.priority)
+            result.sort(key=lambda tag: self.priority.get(tag, last))
+        return result
+
+
+def rules_path(folder_path):
+    return os.path.join(folder_path, RULES_FILE)
+
+
+def _is_tag_list(value):
+    return isinstance(value, list) and all(isinstance(tag, str) for tag in value)
+
+
+def check_rules(rules):
+    """
+    Vérifie la forme de chaque champ des règles ; ValueError en nommant
+    le premier champ invalide
+    """
+    if not isinstance(rules, dict):
+        raise ValueError("a JSON object is expected")
+    for field in ("aliases", "implications"):
+        value = rules.get(field, {})
+        if not isinstance(value, dict) or not all(_is_tag_list(tags) for tags in value.values()):
+            raise ValueError(f'"{field}" must map each tag to a list of tags')
+    for field in ("blacklist", "priority"):
+        if not _is_tag_list(rules.get(field, [])):
+            raise ValueError(f'"{field}" must be a list of tags')
+    phrases = rules.get("phrases", {})
+    if not isinstance(phrases, dict) or not all(isinstance(tag, str) for tag in phrases.values()):
+        raise ValueError('"phrases" must map each phrase to a tag')
+    if not isinstance(rules.get("replace_phrase_tags", False), bool):
+        raise ValueError('"replace_phrase_tags" must be true or false')
+    for field, allowed in (("case", CASES), ("underscores", UNDERSCORES), ("order", ORDERS)):
+        if rules.get(field, "keep") not in allowed:
+            raise ValueError(f'"{field}" must be one of: {", ".join(allowed)}')
+
+
+def load_rules(folder_path):
+    """
+    TagNormalizer des règles du dossier, ou None s'il n'y en a pas.
+    ValueError si le fichier est invalide.
+    """
+    try:
+        with open(rules_path(folder_path), "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise ValueError(f"{RULES_FILE}: {e}") from None
+    try:
+        check_rules(rules)
+    except ValueError as e:
+        raise ValueError(f"{RULES_FILE}: {e}") from None
+    return TagNormalizer(rules)
+
+
+class NormalizeTagsJob(BulkTagJob):
+    """
+    Applique les règles à un ensemble d'images en un seul passage
+    (légendes chargées par paquets en parallèle, une seule opération du
+    journal). En aperçu (`dry_run`), les images à modifier sont seulement
+    listées dans `changed`.
+    """
+
+    def __init__(self, store, image_files, normalizer, dry_run=False):
+        super().__init__(store, image_files, None)
+        self.normalizer = normalizer
+        self.dry_run = dry_run
+
+    @property
+    def label(self):
+        return "Normalize tags"
+
+    def update_tags(self, tags):
+        new_tags = self.normalizer.normalize(tags)
+        return new_tags if new_tags != tags else None
+
+    def process(self, image_file):
+        if not self.dry_run:
+            super().process(image_file)
+        elif self.update_tags(self.store.get(image_file)) is not None:
+            self.changed.append(image_file)
@@ -0,0 +1,162 @@
+"""
+Parcours incrémental du dossier d'images et détection des changements
+"""
+import json
+import os
+from collections import namedtuple
+
+from captioninghelper.jobs import Job
+from captioninghelper.paths import CACHE_DIR_NAME, dataset_cache_dir
+
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg')
+
+# Changements entre deux parcours du dossier
+FolderChanges = namedtuple(
+    "FolderChanges",
+    ["added_images", "removed_images", "changed_captions", "removed_captions"]
+)
+
+
+# État du dossier enregistré à la fermeture, pour le rouvrir sans le parcourir
+SNAPSHOT_FILE = "folder_snapshot.json"
+SNAPSHOT_VERSION = 1
+
+
+def is_image_file(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def folder_mtime(folder_path):
+    """
+    Date de modification du dossier (change à chaque création, suppression
+    ou renommage d'un fichier), ou None s'il est inaccessible
+    """
+    try:
+        return os.stat(folder_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_entries(folder_path, batch_size=2000):
+    """
+    Parcourt le dossier avec os.scandir et produit des paquets
+    (images, légendes) au fur et à mesure : `images` est une liste de noms,
+    `légendes` un dict {nom de base: date de modification} des .txt non vides.
+    Le premier paquet est petit pour pouvoir afficher une image au plus tôt.
+    """
+    images = []
+    captions = {}
+    limit = min(64, batch_size)
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            name = entry.name
+            try:
+                if is_image_file(name):
+                    if entry.is_file():
+                        images.append(name)
+                elif name.lower().endswith(".txt") and entry.is_file():
+                    stat = entry.stat()
+                    if stat.st_size > 0:
+                        captions[os.path.splitext(name)[0]] = stat.st_mtime_ns
+            except OSError:
+                continue
+            if len(images) + len(captions) >= limit:
+                yield images, captions
+                images, captions = [], {}
+                limit = batch_size
+    if images or captions:
+        yield images, captions
+
+
+class FolderSnapshot:
+    """
+    État du dossier à un instant donné : noms des images et date de
+    modification des légendes non vides
+    """
+
+    def __init__(self, images=(), captions=None):
+        self.images = set(images)
+        self.captions = dict(captions or {})
+
+    def add(self, images, captions):
+        self.images.update(images)
+        self.captions.update(captions)
+
+    def diff(self, newer):
+        """
+        Changements pour passer de cet état à `newer`. Un renommage
+        apparaît comme une suppression suivie d'un ajout.
+        """
+        return FolderChanges(
+            added_images=newer.images - self.images,
+            removed_images=self.images - newer.images,
+            changed_captions={
+                stem for stem, mtime in newer.captions.items()
+                if self.captions.get(stem) != mtime
+            },
+            removed_captions=self.captions.keys() - newer.captions.keys()
+        )
+
+
+def scan_folder(folder_path):
+    """
+    Parcours complet et synchrone du dossier
+    """
+    snapshot = FolderSnapshot()
+    for images, captions in scan_entries(folder_path):
+        snapshot.add(images, captions)
+    return snapshot
+
+
+def save_snapshot(folder_path, images, captions):
+    """
+    Enregistre l'état du dossier : noms des images dans l'ordre de
+    navigation et dates de modification des légendes
+    """
+    path = os.path.join(dataset_cache_dir(folder_path), SNAPSHOT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": SNAPSHOT_VERSION, "images": images, "captions": captions},
+            f, ensure_ascii=False, separators=(",", ":")
+        )
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(folder_path):
+    """
+    Retourne (images, légendes) enregistrés par save_snapshot(),
+    ou None si l'état est absent ou illisible
+    """
+    path = os.path.join(folder_path, CACHE_DIR_NAME, SNAPSHOT_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None
+    return data["images"], data["captions"]
+
+
+class FolderScanJob(Job):
+    """
+    Parcourt le dossier en arrière-plan. Chaque paquet est transmis par
+    on_result(images, légendes) dès qu'il est lu, l'état complet est
+    disponible dans `snapshot` à la fin, et la date de modification du
+    dossier au début du parcours dans `folder_mtime`.
+    """
+
+    def __init__(self, folder_path):
+        super().__init__()
+        self.folder_path = folder_path
+        self.snapshot = FolderSnapshot()
+        self.folder_mtime = None
+
+    def run(self):
+        self.folder_mtime = folder_mtime(self.folder_path)
+        for images, captions in scan_entries(self.folder_path):
+            if not self.checkpoint():
+                return
+            self.snapshot.add(images, captions)
+            self.emit_result(images, captions)
@@ -0,0 +1,323 @@
+"""
+Légendes de tout le dossier en mémoire, avec écriture différée sur disque
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from captioninghelper.captions import caption_path, read_tags, write_tags
+from captioninghelper.journal import caption_entries
+from captioninghelper.trace import traced, tracer
+
+
+class CaptionStore:
+    """
+    Source de vérité unique des légendes d'un dossier pour l'interface
+    et les traitements par lot.
+
+    Les légendes sont lues une fois puis gardées en mémoire ; une
+    modification ne fait que marquer l'image comme « sale ». flush()
+    écrit ensuite toutes les images sales en un seul passage, chaque
+    fichier de façon atomique (fichier temporaire + renommage).
+
+    `index` tient l'état légendé / non légendé des images (un
+    dataset.Dataset) : is_captioned(), mark() et captioned_count. Le
+    parcours du dossier y déclare légendé tout .txt non vide ; une
+    légende lue sans aucun tag (espaces, virgules) y est corrigée en
+    non légendée, comme le fait remove_empty_captions().
+
+    Les fonctions de `listeners` sont appelées avec
+    (image_file, anciens_tags, nouveaux_tags) à chaque modification,
+    éventuellement depuis un thread de travail.
+
+    Avec une `database` (database.CaptionDatabase), les légendes sont lues
+    en base (une requête par paquet au lieu d'un fichier par image) et
+    flush() les y enregistre en une transaction ; les .txt sont écrits en
+    même temps, ou plus tard par export_sidecars() si `write_sidecars` est faux.
+
+    Avec un `journal` (journal.OperationJournal), les légendes avant /
+    après y sont enregistrées avant d'être écrites, et peuvent être
+    annulées. Une opération par lot (batch()) est validée d'un bloc (un
+    seul fsync). Les modifications interactives, écrites par la minuterie
+    de l'interface, prolongent sans fsync la dernière opération tant
+    qu'elles portent sur les mêmes images : une opération par image
+    éditée plutôt qu'une par écriture.
+
+    Pendant un batch(), seules les modifications faites par le thread du
+    lot en font partie ; celles des autres threads (l'interface) restent
+    des modifications interactives, écrites et annulées à part.
+    """
+
+    def __init__(self, folder_path, index, database=None, write_sidecars=True, journal=None):
+        self.folder_path = folder_path
+        self.index = index
+        self.database = database
+        self.write_sidecars = write_sidecars or database is None
+        self.journal = journal
+        self.listeners = []
+        self._tags = {}
+        self._files = {}
+        self._dirty = set()
+        # Tags au dernier flush() des légendes modifiées depuis
+        self._saved = {}
+        # Même chose pour les modifications du lot en cours
+        self._batch_dirty = set()
+        self._batch_saved = {}
+        self._batch = None
+        self._batch_thread = None
+        # Dernière opération interactive du journal et ses images
+        self._edit_operation = None
+        self._edit_images = set()
+        # .txt écrits depuis le dernier take_written()
+        self._written = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+
+    def _stem(self, image_file):
+        return os.path.splitext(image_file)[0]
+
+    def _read(self, image_file):
+        if self.database is not None:
+            tags = self.database.get(self._stem(image_file))
+            if tags is not None:
+                return tags
+        return read_tags(self.folder_path, image_file)
+
+    def _in_batch(self):
+        return self._batch is not None and threading.get_ident() == self._batch_thread
+
+    def _changes(self, batch):
+        """
+        Images modifiées et leurs tags au dernier flush() : celles du lot
+        en cours ou les modifications interactives
+        """
+        if batch:
+            return self._batch_dirty, self._batch_saved
+        return self._dirty, self._saved
+
+    def _load(self, image_file):
+        stem = self._stem(image_file)
+        if stem not in self._tags:
+            # L'index évite d'ouvrir un .txt qui n'existe pas
+            captioned = self.index.is_captioned(image_file)
+            tags = self._read(image_file) if captioned else []
+            self._tags.setdefault(stem, tags)
+            self._files.setdefault(stem, image_file)
+            if captioned and not tags:
+                self.index.mark(image_file, False)
+        return self._tags[stem]
+
+    def get(self, image_file):
+        """
+        Tags d'une image (copie de la liste en mémoire)
+        """
+        with self._lock:
+            return list(self._load(image_file))
+
+    def set(self, image_file, tags):
+        """
+        Remplace les tags d'une image en mémoire ; l'écriture sur disque
+        est différée jusqu'au prochain flush()
+        """
+        tags = list(tags)
+        with self._lock:
+            old_tags = self._load(image_file)
+            if old_tags == tags:
+                return False
+            stem = self._stem(image_file)
+            dirty, saved = self._changes(self._in_batch())
+            if stem not in dirty:
+                saved[stem] = old_tags
+            self._tags[stem] = tags
+            self._files[stem] = image_file
+            dirty.add(stem)
+            self.index.mark(image_file, bool(tags))
+        for listener in self.listeners:
+            listener(image_file, old_tags, tags)
+        return True
+
+    @traced("captions.preload")
+    def preload(self, image_files, workers=8):
+        """
+        Charge en parallèle les légendes pas encore en mémoire
+        """
+        with self._lock:
+            missing = [
+                f for f in image_files
+                if self._stem(f) not in self._tags and self.index.is_captioned(f)
+            ]
+        loading = missing
+        if self.database is not None and missing:
+            # Une requête pour tout le paquet ; seules les légendes
+            # inconnues de la base sont lues dans les .txt
+            found = self.database.get_many(self._stem(f) for f in missing)
+            with self._lock:
+                for image_file in missing:
+                    stem = self._stem(image_file)
+                    if stem in found:
+                        self._tags.setdefault(stem, found[stem])
+                        self._files.setdefault(stem, image_file)
+            missing = [f for f in missing if self._stem(f) not in found]
+
+        def read(image_file):
+            try:
+                return image_file, read_tags(self.folder_path, image_file)
+            except OSError:
+                return image_file, []
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(read, missing))
+        with self._lock:
+            for image_file, tags in loaded:
+                stem = self._stem(image_file)
+                self._tags.setdefault(stem, tags)
+                self._files.setdefault(stem, image_file)
+            # .txt sans aucun tag : l'image n'est pas légendée
+            for image_file in loading:
+                if not self._tags[self._stem(image_file)]:
+                    self.index.mark(image_file, False)
+
+    def forget_captions(self, stems):
+        """
+        Oublie la version en mémoire de légendes modifiées hors de
+        l'application (par nom de base) ; elles seront relues au besoin
+        """
+        with self._lock:
+            for stem in stems:
+                if stem not in self._dirty and stem not in self._batch_dirty:
+                    self._tags.pop(stem, None)
+                    self._files.pop(stem, None)
+
+    def is_captioned(self, image_file):
+        return self.index.is_captioned(image_file)
+
+    def take_written(self):
+        """
+        {nom de base: date de modification du .txt, None s'il a été
+        supprimé} des légendes écrites depuis le dernier appel : l'état
+        du dossier connu de l'interface n'y voit alors pas de changement
+        """
+        with self._lock:
+            written, self._written = self._written, {}
+        return written
+
+    @property
+    def captioned_count(self):
+        return self.index.captioned_count
+
+    @property
+    def dirty_count(self):
+        return len(self._dirty) + len(self._batch_dirty)
+
+    @contextmanager
+    def batch(self, label, operation=None):
+        """
+        with store.batch("Add tag"): ... — les modifications faites dans
+        le bloc (par ce thread) sont écrites ensemble à sa sortie, en une
+        seule opération du journal ; les flush() appelés entre-temps
+        (minuterie de l'interface) n'écrivent que les modifications
+        interactives
+        """
+        self.flush()
+        with self._lock:
+            self._batch = (label, operation)
+            self._batch_thread = threading.get_ident()
+        try:
+            yield self
+        finally:
+            self.flush(label, operation)
+            with self._lock:
+                self._batch = self._batch_thread = None
+
+    def flush(self, label="Edit captions", operation=None):
+        """
+        Écrit sur disque toutes les légendes modifiées. Retourne le nombre
+        de légendes écrites.
+
+        Avec un journal, les modifications forment l'opération `label`,
+        ou s'ajoutent à l'opération `operation` déjà commencée (que
+        l'appelant termine alors lui-même). Pendant un batch(), seule la
+        sortie du bloc écrit les modifications du lot ; les autres appels
+        n'écrivent que les modifications interactives.
+        """
+        batch = self._batch is not None and (label, operation) == self._batch
+        # Pendant l'écriture d'un lot (qui peut être longue), l'interface
+        # n'attend pas : ses modifications seront écrites au flush() suivant
+        if not self._flush_lock.acquire(blocking=self._batch is None or batch):
+            return 0
+        try:
+            return self._flush(label, operation, batch)
+        finally:
+            self._flush_lock.release()
+
+    def _flush(self, label, operation, batch):
+        with self._lock:
+            dirty, saved_tags = self._changes(batch)
+            pending = [(self._files[stem], list(self._tags[stem])) for stem in dirty]
+            saved = {stem: saved_tags.pop(stem, None) for stem in dirty}
+            dirty.clear()
+        if not pending:
+            return 0
+        written = 0
+        records = []
+        mtimes = {}
+        op_id = operation
+        if self.journal is not None:
+            changes = [
+                (image_file, saved[self._stem(image_file)], tags) for image_file, tags in pending
+                if saved[self._stem(image_file)] != tags
+            ]
+            if changes and (batch or operation is not None):
+                if op_id is None:
+                    op_id = self.journal.begin(label)
+                self.journal.append(op_id, caption_entries(changes))
+            elif changes:
+                op_id = self._journal_edit(label, changes)
+        with tracer.span("captions.flush"):
+            for image_file, tags in pending:
+                stem = self._stem(image_file)
+                if not self.write_sidecars:
+                    # En base seulement : le .txt sera écrit par export_sidecars()
+                    records.append((stem, tags, None, True))
+                    written += 1
+                    continue
+                try:
+                    write_tags(self.folder_path, image_file, tags)
+                    txt_mtime = os.stat(caption_path(self.folder_path, image_file)).st_mtime_ns if tags else None
+                    mtimes[stem] = txt_mtime
+                    if self.database is not None:
+                        records.append((stem, tags, txt_mtime, False))
+                    written += 1
+                except OSError as e:
+                    print(f"Erreur lors de l'écriture de la légende de {image_file}: {e}")
+                    with self._lock:
+                        dirty.add(stem)
+                        saved_tags.setdefault(stem, saved[stem])
+            if records:
+                self.database.put_many(records)
+            with self._lock:
+                self._written.update(mtimes)
+        if op_id is not None and operation is None:
+            self.journal.end(op_id)
+        return written
+
+    def _journal_edit(self, label, changes):
+        """
+        Enregistre des modifications interactives (sans fsync) : elles
+        prolongent la dernière opération interactive si elle est toujours
+        la dernière annulable et porte sur les mêmes images, sinon elles
+        forment une nouvelle opération. Retourne l'opération si elle est
+        nouvelle (à terminer après l'écriture), None sinon.
+        """
+        images = {image_file for image_file, _, _ in changes}
+        last = self.journal.last_operation()
+        if last is not None and last.id == self._edit_operation and last.label == label \
+                and images <= self._edit_images:
+            self.journal.append(last.id, caption_entries(changes), sync=False)
+            return None
+        op_id = self.journal.begin(label)
+        self.journal.append(op_id, caption_entries(changes), sync=False)
+        self._edit_operation = op_id
+        self._edit_images = images
+        return op_id
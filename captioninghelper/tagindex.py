@@ -0,0 +1,279 @@
+"""
+Index inversé des tags (tag -> images) et langage de requête
+"""
+import bisect
+import os
+import sys
+import threading
+
+from captioninghelper.jobs import Job
+
+
+class QueryError(ValueError):
+    pass
+
+
+def tokenize(query):
+    """
+    Découpe une requête en opérateurs et en tags.
+    Opérateurs : & ou , (ET), | (OU), ! ou - en tête (NON), parenthèses.
+    Un tag contenant un opérateur peut être écrit entre guillemets.
+    """
+    tokens = []
+    i = 0
+    length = len(query)
+    while i < length:
+        char = query[i]
+        if char.isspace():
+            i += 1
+        elif char in "&,|()!":
+            tokens.append(("op", "&" if char == "," else char))
+            i += 1
+        elif char == "-" and (not tokens or tokens[-1][0] == "op" and tokens[-1][1] != ")"):
+            tokens.append(("op", "!"))
+            i += 1
+        elif char == '"':
+            end = query.find('"', i + 1)
+            if end < 0:
+                raise QueryError("Unterminated quote")
+            tokens.append(("tag", query[i + 1:end]))
+            i = end + 1
+        else:
+            start = i
+            while i < length and query[i] not in "&,|()!\"":
+                i += 1
+            tokens.append(("tag", query[start:i].strip()))
+    return tokens
+
+
+class TagIndex:
+    """
+    Index inversé : pour chaque tag, l'ensemble des identifiants d'images
+    (dataset.Dataset) qui le portent. Tenu à jour par update(), à brancher
+    sur CaptionStore.listeners.
+
+    Pendant une construction (TagIndexBuildJob), les images reçues par
+    update() sont retenues : leurs tags indexés sont plus récents que
+    ceux que la construction a pu lire avant la modification, qu'elle
+    n'écrase donc pas (set_built_tags).
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.postings = {}
+        self._image_tags = {}
+        self._sorted_tags = None
+        self._builds = 0
+        self._updated_during_build = set()
+        self._lock = threading.RLock()
+
+    def set_tags(self, image_id, tags):
+        """
+        Remplace les tags indexés d'une image
+        """
+        new_tags = frozenset(sys.intern(tag) for tag in tags)
+        with self._lock:
+            old_tags = self._image_tags.get(image_id, frozenset())
+            for tag in old_tags - new_tags:
+                ids = self.postings[tag]
+                ids.discard(image_id)
+                if not ids:
+                    del self.postings[tag]
+                    self._sorted_tags = None
+            for tag in new_tags - old_tags:
+                ids = self.postings.get(tag)
+                if ids is None:
+                    ids = self.postings[tag] = set()
+                    self._sorted_tags = None
+                ids.add(image_id)
+            if new_tags:
+                self._image_tags[image_id] = new_tags
+            else:
+                self._image_tags.pop(image_id, None)
+
+    def update(self, image_file, old_tags, new_tags):
+        """
+        Écouteur du CaptionStore
+        """
+        image_id = self.dataset.id_of(image_file)
+        if image_id is not None:
+            with self._lock:
+                if self._builds:
+                    self._updated_during_build.add(image_id)
+                self.set_tags(image_id, new_tags)
+
+    def start_build(self):
+        with self._lock:
+            self._builds += 1
+
+    def finish_build(self):
+        with self._lock:
+            self._builds -= 1
+            if not self._builds:
+                self._updated_during_build.clear()
+
+    def set_built_tags(self, image_id, tags):
+        """
+        Comme set_tags(), sauf pour une image modifiée depuis le début de
+        la construction : ses tags indexés sont alors déjà à jour
+        """
+        with self._lock:
+            if image_id not in self._updated_during_build:
+                self.set_tags(image_id, tags)
+
+    def count(self, tag):
+        with self._lock:
+            return len(self.postings.get(tag, ()))
+
+    def tags(self):
+        """
+        Tous les tags connus, triés
+        """
+        with self._lock:
+            if self._sorted_tags is None:
+                self._sorted_tags = sorted(self.postings)
+            return self._sorted_tags
+
+    def tags_with_prefix(self, prefix):
+        """
+        Tags connus qui commencent par `prefix`
+        """
+        with self._lock:
+            tags = self.tags()
+            start = bisect.bisect_left(tags, prefix)
+            end = bisect.bisect_left(tags, prefix + "\U0010ffff", start)
+            return tags[start:end]
+
+    def _match(self, tag):
+        # « tag* » : tous les tags qui commencent par « tag »
+        if tag.endswith("*"):
+            result = set()
+            for prefixed in self.tags_with_prefix(tag[:-1]):
+                result |= self.postings[prefixed]
+            return result
+        return self.postings.get(tag, set())
+
+    def query(self, text):
+        """
+        Évalue une requête, ex. « blue eyes & !smile » ou « (cat | dog), -outdoors ».
+        Retourne l'ensemble des identifiants d'images correspondantes.
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            raise QueryError("Empty query")
+        with self._lock:
+            parser = _QueryParser(tokens, self._match, self._universe)
+            return parser.parse()
+
+    def _universe(self):
+        return set(self.dataset.visible_ids())
+
+
+class _QueryParser:
+    """
+    Analyse descendante de la requête :
+        expr   := term ('|' term)*
+        term   := factor ('&' factor)*
+        factor := '!' factor | '(' expr ')' | tag
+    Les ET sont évalués du plus petit ensemble au plus grand et les NON
+    par différence, sans parcourir toutes les images quand c'est possible.
+    """
+
+    def __init__(self, tokens, match, universe):
+        self.tokens = tokens
+        self.pos = 0
+        self.match = match
+        self.universe = universe
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        result = self.expr()
+        if self.pos != len(self.tokens):
+            raise QueryError(f"Unexpected '{self.peek()[1]}'")
+        return result
+
+    def expr(self):
+        result = self.term()
+        while self.peek() == ("op", "|"):
+            self.take()
+            result = result | self.term()
+        return result
+
+    def term(self):
+        positives = []
+        negatives = []
+        while True:
+            negated, value = self.factor()
+            (negatives if negated else positives).append(value)
+            if self.peek() != ("op", "&"):
+                break
+            self.take()
+        if positives:
+            positives.sort(key=len)
+            result = set(positives[0])
+            for value in positives[1:]:
+                result &= value
+        else:
+            result = self.universe()
+        for value in negatives:
+            result -= value
+        return result
+
+    def factor(self):
+        """
+        Retourne (négation, ensemble)
+        """
+        kind, value = self.take()
+        if (kind, value) == ("op", "!"):
+            negated, result = self.factor()
+            if negated:
+                return False, result
+            return True, result
+        if (kind, value) == ("op", "("):
+            result = self.expr()
+            if self.take() != ("op", ")"):
+                raise QueryError("Missing ')'")
+            return False, result
+        if kind == "tag" and value:
+            return False, self.match(value)
+        raise QueryError(f"Unexpected '{value}'" if value else "Incomplete query")
+
+
+class TagIndexBuildJob(Job):
+    """
+    Construit l'index depuis les .txt : les légendes sont chargées par
+    paquets en parallèle dans le CaptionStore puis indexées, sans écraser
+    les modifications reçues par l'index entre-temps
+    """
+
+    batch_size = 4096
+
+    def __init__(self, index, store, image_files):
+        super().__init__()
+        self.index = index
+        self.store = store
+        self.image_files = list(image_files)
+
+    def run(self):
+        total = len(self.image_files)
+        dataset = self.index.dataset
+        self.index.start_build()
+        try:
+            for start in range(0, total, self.batch_size):
+                if not self.checkpoint():
+                    return
+                batch = self.image_files[start:start + self.batch_size]
+                self.store.preload(batch)
+                for image_file in batch:
+                    if self.store.is_captioned(image_file):
+                        self.index.set_built_tags(dataset.id_of(image_file), self.store.get(image_file))
+                self.report(start + len(batch), total, os.path.basename(batch[-1]))
+        finally:
+            self.index.finish_build()
@@ -0,0 +1,107 @@
+"""
+Bibliothèque de tags : liste triée avec recherche par préfixe
+"""
+import bisect
+import heapq
+import json
+import os
+
+
+def tag_key(tag):
+    # Recherche insensible à la casse, l'ordre reste stable entre casses
+    return (tag.casefold(), tag)
+
+
+class TagLibrary:
+    """
+    Tags de la bibliothèque, gardés triés pour retrouver par bisection
+    tous ceux qui commencent par un préfixe donné.
+
+    Les fonctions de `listeners` sont appelées avec (rang, tag, ajouté)
+    après chaque ajout ou retrait.
+    """
+
+    def __init__(self, tags=()):
+        self._keys = sorted(tag_key(tag) for tag in set(tags))
+        self.listeners = []
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, row):
+        return self._keys[row][1]
+
+    def __contains__(self, tag):
+        key = tag_key(tag)
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def __iter__(self):
+        return (key[1] for key in self._keys)
+
+    def add(self, tag):
+        """
+        Ajoute un tag ; retourne False s'il y était déjà
+        """
+        key = tag_key(tag)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return False
+        self._keys.insert(i, key)
+        self.dirty = True
+        for listener in self.listeners:
+            listener(i, tag, True)
+        return True
+
+    def remove(self, tag):
+        """
+        Retire un tag ; retourne False s'il n'y était pas
+        """
+        key = tag_key(tag)
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return False
+        del self._keys[i]
+        self.dirty = True
+        for listener in self.listeners:
+            listener(i, tag, False)
+        return True
+
+    def prefix_range(self, prefix):
+        """
+        Rangs [début, fin) des tags qui commencent par `prefix`
+        """
+        if not prefix:
+            return 0, len(self._keys)
+        folded = prefix.casefold()
+        start = bisect.bisect_left(self._keys, (folded,))
+        # Premier préfixe qui suit strictement `folded` dans l'ordre
+        end = bisect.bisect_left(self._keys, (folded + "\U0010ffff",), start)
+        return start, end
+
+    def complete(self, prefix, count, limit=20):
+        """
+        Les `limit` tags les plus utilisés qui commencent par `prefix`,
+        `count(tag)` donnant le nombre d'images qui portent le tag
+        """
+        start, end = self.prefix_range(prefix)
+        candidates = (self._keys[i][1] for i in range(start, end))
+        return heapq.nlargest(limit, candidates, key=count)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        """
+        Écrit la bibliothèque (fichier temporaire + renommage)
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self), f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+        self.dirty = False
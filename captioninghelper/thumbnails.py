@@ -0,0 +1,130 @@
+"""
+Cache persistant des miniatures d'un dossier d'images (un seul fichier SQLite)
+"""
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from captioninghelper.paths import dataset_cache_dir
+from captioninghelper.previews import Preview
+
+THUMBNAIL_DB_NAME = "thumbnails.db"
+
+
+def encode_preview(preview):
+    """
+    Compresse un aperçu : JPEG s'il est opaque, PNG s'il a de la transparence
+    """
+    from PIL import Image
+
+    img = Image.frombytes("RGBA", (preview.width, preview.height), preview.data)
+    buffer = io.BytesIO()
+    if img.getextrema()[3][0] == 255:
+        img.convert("RGB").save(buffer, "JPEG", quality=90)
+    else:
+        img.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def decode_thumbnail(data):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        rgba = img.convert("RGBA")
+    return Preview(rgba.width, rgba.height, rgba.tobytes("raw", "RGBA"))
+
+
+class ThumbnailStore:
+    """
+    Miniatures indexées par nom de fichier, taille et date de modification :
+    une miniature dont le fichier source a changé est ignorée puis remplacée.
+    Le fichier est borné par `max_bytes`, les moins récemment utilisées
+    sont évincées en premier. Les dates d'utilisation des miniatures lues
+    sont gardées en mémoire et écrites avec la prochaine miniature ajoutée
+    (avant l'éviction) ou à la fermeture : une lecture n'écrit rien.
+    """
+
+    def __init__(self, folder_path, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        db_path = os.path.join(dataset_cache_dir(folder_path), THUMBNAIL_DB_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " name TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,"
+            " data BLOB, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails(last_used)")
+        self._conn.commit()
+        # {nom: date d'utilisation} pas encore écrites
+        self._last_used = {}
+        self._total = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails"
+        ).fetchone()[0]
+
+    def get(self, image_path, stat):
+        """
+        Retourne l'aperçu stocké, ou None s'il est absent ou périmé
+        """
+        name = os.path.basename(image_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM thumbnails WHERE name = ? AND size = ? AND mtime = ?",
+                (name, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+            if row is None:
+                return None
+            self._last_used[name] = time.time()
+        return decode_thumbnail(row[0])
+
+    def put(self, image_path, stat, preview):
+        name = os.path.basename(image_path)
+        data = encode_preview(preview)
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT LENGTH(data) FROM thumbnails WHERE name = ?", (name,)
+            ).fetchone()
+            if old is not None:
+                self._total -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?)",
+                (name, stat.st_size, stat.st_mtime_ns, data, time.time())
+            )
+            self._total += len(data)
+            self._last_used.pop(name, None)
+            self._write_last_used()
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _write_last_used(self):
+        if self._last_used:
+            self._conn.executemany(
+                "UPDATE thumbnails SET last_used = ? WHERE name = ?",
+                ((used, name) for name, used in self._last_used.items())
+            )
+            self._last_used.clear()
+
+    def _evict(self):
+        # Supprime les miniatures les plus anciennes jusqu'à repasser sous 90 % du plafond
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute(
+            "SELECT name, LENGTH(data) FROM thumbnails ORDER BY last_used"
+        )
+        evicted = []
+        for name, length in rows:
+            if self._total <= target:
+                break
+            evicted.append((name,))
+            self._total -= length
+        self._conn.executemany("DELETE FROM thumbnails WHERE name = ?", evicted)
+
+    def close(self):
+        with self._lock:
+            self._write_last_used()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,166 @@
+"""
+Mesure des temps des chemins critiques : intervalles nommés (spans),
+export au format Chrome trace, profilage cProfile à la demande.
+
+Désactivé, un span ne coûte qu'un test de booléen.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Tracer:
+    """
+    Garde les `max_events` derniers intervalles mesurés :
+    (nom, début, durée, identifiant du thread)
+    """
+
+    def __init__(self, max_events=100000):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self._origin = time.perf_counter()
+        self._profiler = None
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """
+        with tracer.span("load_image"): ...
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return _Span(self, name)
+
+    def add(self, name, start, duration):
+        # deque.append est atomique : pas de verrou sur le chemin critique
+        self.events.append((name, start, duration, threading.get_ident()))
+
+    def clear(self):
+        self.events.clear()
+
+    def stats(self, last=200):
+        """
+        Par nom : dernière durée, moyenne, maximum et nombre, sur les
+        `last` derniers intervalles de ce nom (en secondes)
+        """
+        durations = {}
+        for name, _, duration, _ in reversed(list(self.events)):
+            values = durations.setdefault(name, [])
+            if len(values) < last:
+                values.append(duration)
+        return {
+            name: {"last": values[0], "mean": sum(values) / len(values),
+                   "max": max(values), "count": len(values)}
+            for name, values in durations.items()
+        }
+
+    def export_chrome_trace(self, path):
+        """
+        Écrit les intervalles au format « Trace Event » de Chrome
+        (chrome://tracing, Perfetto). Retourne le nombre d'intervalles écrits.
+        """
+        pid = os.getpid()
+        events = [
+            {"name": name, "ph": "X", "pid": pid, "tid": tid,
+             "ts": (start - self._origin) * 1e6, "dur": duration * 1e6}
+            for name, start, duration, tid in list(self.events)
+        ]
+        threads = {event["tid"] for event in events}
+        names = {t.ident: t.name for t in threading.enumerate()}
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+             "args": {"name": names.get(tid, str(tid))}}
+            for tid in threads
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events) - len(threads)
+
+    # --- Profilage ---
+
+    @property
+    def profiling(self):
+        return self._profiler is not None
+
+    def start_profile(self):
+        import cProfile
+
+        with self._lock:
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+
+    def stop_profile(self, path):
+        """
+        Arrête le profilage du thread de l'interface et écrit les statistiques
+        (lisibles avec pstats ou snakeviz) dans `path`, et le résumé des
+        fonctions les plus coûteuses à côté (même nom, en .txt) ; retourne
+        ce résumé
+        """
+        import io
+        import pstats
+
+        with self._lock:
+            profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return ""
+        profiler.disable()
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        return summary.getvalue()
+
+
+# Instance partagée par toute l'application
+tracer = Tracer()
+
+
+def traced(name=None):
+    """
+    Décorateur : mesure chaque appel de la fonction sous `name`
+    (par défaut le nom de la fonction). Pas pour une méthode branchée
+    directement sur un signal Qt, qui recevrait alors les arguments du
+    signal : utiliser `with tracer.span(...)` dans son corps.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with _Span(tracer, span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
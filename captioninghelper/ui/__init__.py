@@ -0,0 +1,3 @@
+"""
+Composants Qt partagés par les fenêtres de l'application
+"""
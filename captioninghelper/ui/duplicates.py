@@ -0,0 +1,77 @@
+"""
+Revue des groupes d'images en double trouvés par DuplicateScanJob
+"""
+import os
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import (
+    QDialog, QDialogButtonBox, QHBoxLayout, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout
+)
+
+
+class DuplicatesDialog(QDialog):
+    """
+    Un groupe par nœud, une case à cocher par image. Dans chaque groupe,
+    toutes les images sauf la plus lourde (en octets) sont cochées :
+    « Cacher » les cache toutes en une fois.
+    """
+
+    def __init__(self, folder_path, clusters, file_size, texts, parent=None):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self.setWindowTitle(texts.get("duplicates_title", "Duplicate Images"))
+        self.resize(800, 500)
+
+        layout = QVBoxLayout(self)
+        summary = texts.get("duplicates_summary", "{clusters} groups, {images} images")
+        layout.addWidget(QLabel(summary.format(
+            clusters=len(clusters), images=sum(len(names) for names in clusters)
+        )))
+
+        content_layout = QHBoxLayout()
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.currentItemChanged.connect(self.show_preview)
+        content_layout.addWidget(self.tree, 1)
+        self.preview = QLabel()
+        self.preview.setFixedSize(320, 320)
+        self.preview.setAlignment(Qt.AlignCenter)
+        content_layout.addWidget(self.preview)
+        layout.addLayout(content_layout)
+
+        template = texts.get("duplicates_group", "Group {number} ({count} images)")
+        for number, names in enumerate(clusters, 1):
+            group = QTreeWidgetItem(self.tree, [template.format(number=number, count=len(names))])
+            keep = max(names, key=file_size)
+            for name in names:
+                item = QTreeWidgetItem(group, [name])
+                item.setData(0, Qt.UserRole, name)
+                item.setCheckState(0, Qt.Unchecked if name == keep else Qt.Checked)
+            group.setExpanded(number <= 50)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Cancel)
+        hide_button = buttons.addButton(texts.get("duplicates_hide", "Hide Checked"), QDialogButtonBox.AcceptRole)
+        hide_button.setDefault(True)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def show_preview(self, item, previous=None):
+        name = item.data(0, Qt.UserRole) if item is not None else None
+        if name is None:
+            self.preview.clear()
+            return
+        pixmap = QPixmap(os.path.join(self.folder_path, name))
+        self.preview.setPixmap(pixmap.scaled(self.preview.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def checked_images(self):
+        names = []
+        for i in range(self.tree.topLevelItemCount()):
+            group = self.tree.topLevelItem(i)
+            for j in range(group.childCount()):
+                item = group.child(j)
+                if item.checkState(0) == Qt.Checked:
+                    names.append(item.data(0, Qt.UserRole))
+        return names
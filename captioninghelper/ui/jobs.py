@@ -0,0 +1,84 @@
+"""
+Exécution des tâches de fond (captioninghelper.jobs) depuis l'interface Qt
+"""
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QDialog, QHBoxLayout, QLabel, QProgressBar, QPushButton, QVBoxLayout
+
+from captioninghelper.trace import tracer
+
+
+class JobRunner(QThread):
+    """
+    Lance job.run() dans un thread et relaie progression et résultats
+    vers le thread de l'interface sous forme de signaux. Si la tâche lève
+    une exception, elle est gardée dans `error` et émise par `failure`
+    (avant `finished`).
+    """
+    progress = pyqtSignal(int, int, object)
+    result = pyqtSignal(object, object)
+    failure = pyqtSignal(object)
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self.job = job
+        self.error = None
+        job.on_progress = self.progress.emit
+        job.on_result = self.result.emit
+
+    def run(self):
+        try:
+            with tracer.span(f"job.{type(self.job).__name__}"):
+                self.job.run()
+        except Exception as e:
+            self.error = e
+            print(f"Error in {type(self.job).__name__}: {str(e)}")
+            self.failure.emit(e)
+
+
+class JobDialog(QDialog):
+    """
+    Fenêtre non modale de suivi d'une tâche : progression, pause / reprise, annulation
+    """
+
+    def __init__(self, runner, title, texts, parent=None):
+        super().__init__(parent)
+        self.runner = runner
+        self.texts = texts
+        self.setWindowTitle(title)
+
+        layout = QVBoxLayout(self)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.progress_bar = QProgressBar()
+        layout.addWidget(self.progress_bar)
+
+        buttons_layout = QHBoxLayout()
+        self.pause_button = QPushButton(texts.get("pause_button", "Pause"))
+        self.pause_button.clicked.connect(self.toggle_pause)
+        buttons_layout.addWidget(self.pause_button)
+        cancel_button = QPushButton(texts.get("cancel_button", "Cancel"))
+        cancel_button.clicked.connect(self.runner.job.cancel)
+        buttons_layout.addWidget(cancel_button)
+        layout.addLayout(buttons_layout)
+
+        runner.progress.connect(self.update_progress)
+        runner.finished.connect(self.accept)
+
+    def update_progress(self, done, total, item):
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+        self.status_label.setText(f"{done} / {total}" + (f" - {item}" if item else ""))
+
+    def toggle_pause(self):
+        job = self.runner.job
+        if job.paused:
+            job.resume()
+            self.pause_button.setText(self.texts.get("pause_button", "Pause"))
+        else:
+            job.pause()
+            self.pause_button.setText(self.texts.get("resume_button", "Resume"))
+
+    def reject(self):
+        # Fermer la fenêtre annule la tâche
+        self.runner.job.cancel()
+        super().reject()
@@ -0,0 +1,48 @@
+"""
+Surcouche affichant les temps mesurés par captioninghelper.trace
+"""
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QLabel
+
+
+class LatencyOverlay(QLabel):
+    """
+    Tableau semi-transparent en haut à gauche de `parent` :
+    dernière durée, moyenne et maximum de chaque span, rafraîchi
+    toutes les `interval_ms` tant qu'il est visible
+    """
+
+    def __init__(self, tracer, parent, interval_ms=500):
+        super().__init__(parent)
+        self.tracer = tracer
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: #9f9; padding: 6px;")
+        font = QFont("Monospace")
+        font.setStyleHint(QFont.TypeWriter)
+        font.setPointSize(8)
+        self.setFont(font)
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def setVisible(self, visible):
+        super().setVisible(visible)
+        if visible:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        stats = self.tracer.stats()
+        lines = [f"{'span':28s} {'last':>8s} {'mean':>8s} {'max':>8s}"]
+        for name, values in sorted(stats.items(), key=lambda item: -item[1]["mean"]):
+            lines.append(
+                f"{name[:28]:28s} {values['last'] * 1000:7.1f}ms "
+                f"{values['mean'] * 1000:7.1f}ms {values['max'] * 1000:7.1f}ms"
+            )
+        self.setText("\n".join(lines) if stats else "No timings recorded yet")
+        self.adjustSize()
+        self.raise_()
@@ -0,0 +1,106 @@
+"""
+Réécriture des tags de tout le dossier : saisie de la règle, puis aperçu
+des changements (TagRewriteJob en mode dry_run) avant de les appliquer
+"""
+from PyQt5.QtWidgets import (
+    QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QLabel, QLineEdit,
+    QTreeWidget, QTreeWidgetItem, QVBoxLayout
+)
+
+from captioninghelper.bulk import REWRITE_MODES, TagRewriter
+
+# Nombre maximal d'images listées dans l'aperçu
+PREVIEW_IMAGES = 1000
+
+
+class TagRewriteDialog(QDialog):
+    """
+    Règle de réécriture : tag cherché (exact, préfixe ou expression
+    régulière), action (remplacer / fusionner, ou supprimer)
+    """
+
+    def __init__(self, texts, tag="", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(texts.get("rewrite_title", "Rewrite Tags"))
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+
+        self.pattern_input = QLineEdit(tag)
+        form.addRow(texts.get("rewrite_find", "Find:"), self.pattern_input)
+        self.mode_combo = QComboBox()
+        mode_names = {
+            "exact": texts.get("rewrite_exact", "Exact tag"),
+            "prefix": texts.get("rewrite_prefix", "Prefix"),
+            "regex": texts.get("rewrite_regex", "Regular expression"),
+        }
+        for mode in REWRITE_MODES:
+            self.mode_combo.addItem(mode_names[mode], mode)
+        form.addRow(texts.get("rewrite_mode", "Match:"), self.mode_combo)
+        self.ignore_case_checkbox = QCheckBox(texts.get("rewrite_ignore_case", "Ignore case"))
+        form.addRow("", self.ignore_case_checkbox)
+        self.delete_checkbox = QCheckBox(texts.get("rewrite_delete", "Delete matching tags"))
+        form.addRow("", self.delete_checkbox)
+        self.replacement_input = QLineEdit()
+        self.replacement_input.setPlaceholderText(texts.get("rewrite_replace_hint", "new tag (merged if it exists)"))
+        self.delete_checkbox.toggled.connect(lambda checked: self.replacement_input.setEnabled(not checked))
+        form.addRow(texts.get("rewrite_replace", "Replace with:"), self.replacement_input)
+        layout.addLayout(form)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Cancel)
+        preview_button = buttons.addButton(texts.get("rewrite_preview", "Preview"), QDialogButtonBox.AcceptRole)
+        preview_button.setDefault(True)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def rewriter(self):
+        """
+        TagRewriter saisi ; ValueError si la règle est invalide
+        """
+        replacement = None if self.delete_checkbox.isChecked() else self.replacement_input.text()
+        return TagRewriter(
+            self.pattern_input.text().strip(),
+            replacement,
+            self.mode_combo.currentData(),
+            self.ignore_case_checkbox.isChecked()
+        )
+
+
+class TagRewritePreviewDialog(QDialog):
+    """
+    Résultat d'un TagRewriteJob en aperçu : tags modifiés (avec leur
+    nombre d'images) et nombre de tags modifiés par image
+    """
+
+    def __init__(self, job, texts, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(texts.get("rewrite_title", "Rewrite Tags"))
+        self.resize(700, 500)
+        layout = QVBoxLayout(self)
+        summary = texts.get("rewrite_summary", "{images} images and {tags} distinct tags will change.")
+        layout.addWidget(QLabel(summary.format(images=len(job.changed), tags=len(job.tag_changes))))
+
+        deleted = texts.get("rewrite_deleted", "(deleted)")
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels([
+            texts.get("rewrite_column_change", "Change"),
+            texts.get("rewrite_column_images", "Images"),
+        ])
+        self.tree.setUniformRowHeights(True)
+        changes = QTreeWidgetItem(self.tree, [texts.get("rewrite_tag_changes", "Tags")])
+        for (tag, new_tag), count in job.tag_changes.most_common():
+            QTreeWidgetItem(changes, [f"{tag} → {new_tag if new_tag is not None else deleted}", str(count)])
+        changes.setExpanded(True)
+        images = QTreeWidgetItem(self.tree, [texts.get("rewrite_images", "Images")])
+        for image_file in job.changed[:PREVIEW_IMAGES]:
+            QTreeWidgetItem(images, [image_file, str(job.counts[image_file])])
+        if len(job.changed) > PREVIEW_IMAGES:
+            QTreeWidgetItem(images, [f"... (+{len(job.changed) - PREVIEW_IMAGES})", ""])
+        self.tree.resizeColumnToContents(0)
+        layout.addWidget(self.tree)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Cancel)
+        buttons.addButton(texts.get("rewrite_apply", "Apply"), QDialogButtonBox.AcceptRole)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
@@ -0,0 +1,126 @@
+"""
+Modèle Qt de la bibliothèque de tags et éditeur de tags avec autocomplétion
+"""
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QStringListModel, Qt
+from PyQt5.QtWidgets import QCompleter, QTextEdit
+
+
+class TagLibraryModel(QAbstractListModel):
+    """
+    Vue sur les tags d'une TagLibrary qui commencent par un préfixe.
+
+    Le modèle ne copie rien : il ne retient que l'intervalle de rangs
+    correspondant au préfixe, la vue ne demande que les lignes affichées.
+    `count(tag)` donne le nombre d'images qui portent le tag.
+    """
+    TagRole = Qt.UserRole
+
+    def __init__(self, library, count, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.count = count
+        self.prefix = ""
+        self._start, self._end = library.prefix_range("")
+        library.listeners.append(self.on_library_changed)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._end - self._start
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        tag = self.library[self._start + index.row()]
+        if role == Qt.DisplayRole:
+            count = self.count(tag)
+            return f"{tag} ({count})" if count else tag
+        if role == self.TagRole:
+            return tag
+        return None
+
+    def tag_at(self, row):
+        return self.library[self._start + row]
+
+    def set_prefix(self, prefix):
+        self.beginResetModel()
+        self.prefix = prefix
+        self._start, self._end = self.library.prefix_range(prefix)
+        self.endResetModel()
+
+    def refresh_counts(self):
+        """
+        Redessine les compteurs après des modifications de légendes
+        """
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1), [Qt.DisplayRole])
+
+    def on_library_changed(self, position, tag, added):
+        if tag.casefold().startswith(self.prefix.casefold()):
+            row = position - self._start
+            if added:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._end += 1
+                self.endInsertRows()
+            else:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self._end -= 1
+                self.endRemoveRows()
+        elif position <= self._start:
+            # Le tag est avant l'intervalle affiché : il se décale
+            shift = 1 if added else -1
+            self._start += shift
+            self._end += shift
+
+
+class TagEditor(QTextEdit):
+    """
+    Zone de saisie des tags « tag1, tag2, ... » qui propose les tags
+    connus pour le mot en cours. `complete(prefix)` retourne la liste
+    des propositions, les plus pertinentes d'abord.
+    """
+
+    def __init__(self, complete, parent=None):
+        super().__init__(parent)
+        self.complete = complete
+        self.completer = QCompleter(QStringListModel(self), self)
+        self.completer.setWidget(self)
+        # Le filtrage est déjà fait par complete()
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.activated[str].connect(self.insert_completion)
+
+    def current_word(self):
+        cursor = self.textCursor()
+        text = self.toPlainText()[:cursor.position()]
+        return text.rsplit(",", 1)[-1].lstrip()
+
+    def insert_completion(self, tag):
+        cursor = self.textCursor()
+        word = self.current_word()
+        for _ in word:
+            cursor.deletePreviousChar()
+        cursor.insertText(tag)
+        self.setTextCursor(cursor)
+
+    def keyPressEvent(self, event):
+        popup = self.completer.popup()
+        if popup.isVisible() and event.key() in (Qt.Key_Enter, Qt.Key_Return, Qt.Key_Escape,
+                                                 Qt.Key_Tab, Qt.Key_Backtab):
+            # Laisse le completer valider ou fermer la liste
+            event.ignore()
+            return
+        super().keyPressEvent(event)
+
+        word = self.current_word()
+        if not event.text() or not word:
+            popup.hide()
+            return
+        matches = self.complete(word)
+        if not matches or matches == [word]:
+            popup.hide()
+            return
+        self.completer.model().setStringList(matches)
+        popup.setCurrentIndex(self.completer.model().index(0))
+        rect = self.cursorRect()
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.completer.complete(rect)
@@ -0,0 +1,173 @@
+"""
+Légendage par lot (ollama.BatchCaptioner) contre un faux serveur Ollama
+local : requêtes simultanées, erreurs par image, annulation et écriture
+des résultats dans les .txt via la ligne de commande.
+
+    python -m pytest -q tests
+"""
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from captioninghelper import config
+from captioninghelper.captions import read_tags
+from captioninghelper.cli import main
+from captioninghelper.ollama import BatchCaptioner, OllamaClient
+
+RESPONSE = "a cat,  blue sky, a cat"
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    Répond à /api/generate comme Ollama après `delay` secondes. Les images
+    dont le contenu commence par b"bad" reçoivent une erreur 500.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.05):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            image = base64.b64decode(body["images"][0])
+            time.sleep(server.delay)
+            if self.path != "/api/generate":
+                status, payload = 404, {"error": "not found"}
+            elif image.startswith(b"bad"):
+                status, payload = 500, {"error": "cannot decode image"}
+            else:
+                status, payload = 200, {"model": body["model"], "response": f" {RESPONSE}\n"}
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BatchCaptionerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="captioninghelper-test-")
+        self.server = StubOllama()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_images(self, count, bad=()):
+        paths = []
+        for i in range(count):
+            path = os.path.join(self.folder, f"image_{i:03}.png")
+            with open(path, "wb") as f:
+                f.write(b"bad" if i in bad else f"image {i}".encode("ascii"))
+            paths.append(path)
+        return paths
+
+    def run_captioner(self, paths, workers, on_result=None):
+        job = BatchCaptioner(OllamaClient(self.server.url), "model", "prompt", paths, workers=workers)
+        results = {}
+        lock = threading.Lock()
+
+        def collect(image_path, output):
+            with lock:
+                results[image_path] = output
+            if on_result:
+                on_result(job, results)
+
+        job.on_result = collect
+        job.run()
+        return job, results
+
+    def test_concurrent_requests(self):
+        paths = self.make_images(12)
+        job, results = self.run_captioner(paths, workers=4)
+        self.assertEqual(self.server.requests, 12)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertEqual(job.done, 12)
+        self.assertEqual(job.errors, {})
+        self.assertEqual(results, {path: RESPONSE for path in paths})
+
+    def test_errors_are_kept_per_image(self):
+        paths = self.make_images(6, bad={1, 4})
+        job, results = self.run_captioner(paths, workers=3)
+        self.assertEqual(job.done, 6)
+        self.assertEqual(job.errors, {
+            paths[1]: "cannot decode image",
+            paths[4]: "cannot decode image"
+        })
+        self.assertEqual(set(results), set(paths) - {paths[1], paths[4]})
+
+    def test_cancel(self):
+        paths = self.make_images(20)
+        job, results = self.run_captioner(paths, workers=2, on_result=lambda job, results: job.cancel())
+        self.assertTrue(job.cancelled)
+        # Seules les requêtes déjà parties se terminent
+        self.assertLessEqual(self.server.requests, 2)
+        self.assertEqual(job.done, self.server.requests)
+        self.assertEqual(len(results), job.done)
+
+    def test_cli_writes_tags(self):
+        paths = self.make_images(8, bad={2})
+        with open(os.path.join(self.folder, "image_000.txt"), "w", encoding="utf-8") as f:
+            f.write("already, blue sky")
+        state_dir = tempfile.mkdtemp(prefix="captioninghelper-state-")
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        default_config = config.CONFIG_FILE
+        config.CONFIG_FILE = os.path.join(state_dir, "config.json")
+        try:
+            status = main([
+                "-q", "caption", self.folder, "--all", "--no-cache",
+                "--url", self.server.url, "--workers", "4"
+            ])
+        finally:
+            config.CONFIG_FILE = default_config
+        self.assertEqual(status, 1)
+        self.assertEqual(self.server.requests, 8)
+        for i, path in enumerate(paths):
+            tags = read_tags(self.folder, os.path.basename(path))
+            if i == 2:
+                self.assertEqual(tags, [])
+            elif i == 0:
+                self.assertEqual(tags, ["already", "blue sky", "a cat"])
+            else:
+                self.assertEqual(tags, ["a cat", "blue sky"])
+
+
+if __name__ == "__main__":
+    unittest.main()